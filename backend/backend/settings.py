@@ -10,9 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
+from corsheaders.defaults import default_headers
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -45,6 +48,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'subscriptions.middleware.RequestMetricsMiddleware',
+    'subscriptions.middleware.CompressionMiddleware',
+    'subscriptions.middleware.ReplicaRoutingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -89,6 +95,55 @@ DATABASES = {
     }
 }
 
+# USE_SQLITE=1 runs locally (e.g. the seeder and load test) without PostgreSQL
+if os.environ.get('USE_SQLITE'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            # Let concurrent writers wait for the lock instead of failing
+            'OPTIONS': {
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+                'init_command': 'PRAGMA journal_mode=WAL;',
+            },
+        }
+    }
+
+# Read replicas (see subscriptions/routers.py). DATABASE_REPLICA_HOSTS=db-replica-1,db-replica-2
+# adds a replica1, replica2, ... alias per host with the primary's other settings.
+# With USE_SQLITE, SQLITE_REPLICAS=<n> adds n read-only connections to the same
+# file instead, to try the routing locally. In tests replicas mirror the primary.
+if os.environ.get('USE_SQLITE'):
+    replica_databases = [
+        {**DATABASES['default'], 'OPTIONS': {'timeout': 20, 'init_command': 'PRAGMA query_only = ON;'}}
+        for _ in range(int(os.environ.get('SQLITE_REPLICAS', 0)))
+    ]
+else:
+    replica_databases = [
+        {**DATABASES['default'], 'HOST': host.strip()}
+        for host in os.environ.get('DATABASE_REPLICA_HOSTS', '').split(',') if host.strip()
+    ]
+DATABASE_REPLICAS = []
+for number, replica in enumerate(replica_databases, 1):
+    DATABASES[f'replica{number}'] = {**replica, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+# Keep each alias' connections open between requests, checking them before reuse
+for database in DATABASES.values():
+    database.setdefault('CONN_MAX_AGE', int(os.environ.get('DATABASE_CONN_MAX_AGE', 60)))
+    database.setdefault('CONN_HEALTH_CHECKS', True)
+
+DATABASE_ROUTERS = ['subscriptions.routers.ReplicaRouter']
+# How long a client that wrote keeps reading from the primary (seconds), and the
+# cache holding those pins; it must be shared by all workers (e.g. Redis)
+DATABASE_REPLICA_STICKY_SECONDS = 5
+DATABASE_REPLICA_PIN_CACHE = 'default'
+# Seconds between replica health checks, and the replication lag (PostgreSQL)
+# beyond which a replica is taken out of rotation
+DATABASE_REPLICA_HEALTH_CHECK_INTERVAL = 10
+DATABASE_REPLICA_MAX_LAG = 30
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -135,6 +190,7 @@ CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
     "http://127.0.0.1:3000",
 ]
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
 
 import os
 from pathlib import Path
@@ -152,6 +208,39 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 # The URL that handles the media served from MEDIA_ROOT.
 MEDIA_URL = '/media/'
 
+# Cache used for per-user entitlements (see subscriptions/cache.py).
+# Point this at a shared backend such as Redis or Memcached in production.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+ENTITLEMENT_CACHE_ALIAS = 'default'
+ENTITLEMENT_CACHE_TIMEOUT = 300  # seconds; entries never outlive the subscription's end_date
+AUTH_USER_CACHE_TIMEOUT = 300  # seconds a user resolved from a JWT stays cached (dropped on user save/delete)
+PLAN_CATALOG_MAX_AGE = 300  # Cache-Control max-age for /api/plans/ responses; clients revalidate with the ETag
+PLAN_CATALOG_VERSION_TTL = 30  # seconds before each process rebuilds the catalog version from the database
+
+# Payment proofs are stored under content-hash names so identical uploads are kept once
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+    'payment_proofs': {
+        'BACKEND': 'subscriptions.storage.ContentAddressedStorage',
+    },
+}
+
+# Background thumbnail/review-copy generation for payment proofs (see subscriptions/proof_pipeline.py)
+PAYMENT_PROOF_PIPELINE_ENABLED = True
+PAYMENT_PROOF_WORKERS = 2
+PAYMENT_PROOF_THUMBNAIL_SIZE = (160, 160)
+PAYMENT_PROOF_REVIEW_SIZE = (1600, 1600)
+PAYMENT_PROOF_JPEG_QUALITY = 75
+
 # adding jwt authentication settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -159,6 +248,37 @@ REST_FRAMEWORK = {
     ),
 }
 
+# Page size for the cursor-paginated list endpoints (clients may pass ?page_size= up to the max)
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 500
+
+# Largest batch accepted by POST /api/subscriptions/batch/
+PROVISIONING_MAX_BATCH = 5000
+
+# Longest date range served by the daily analytics endpoint (days)
+ANALYTICS_MAX_DAYS = 366
+
+# Per-view request metrics (subscriptions/middleware.py), scraped from /api/metrics/.
+# METRICS_SAMPLE_RATE is the share of requests measured (0.0 - 1.0).
+METRICS_ENABLED = True
+METRICS_SAMPLE_RATE = 1.0
+METRICS_SERVER_TIMING = True
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# Response compression (subscriptions.middleware.CompressionMiddleware). Brotli
+# is offered when the brotli package is installed; higher levels save bytes
+# at the cost of CPU (see the api_compression_* metrics when tuning them).
+COMPRESSION_ENABLED = True
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 4
+COMPRESSION_CONTENT_TYPES = ['application/json', 'application/x-ndjson', 'text/']
+
+# Rows fetched per server-side cursor round trip by the streaming exports
+EXPORT_CHUNK_SIZE = 2000
+
+# How long responses to POSTs with an Idempotency-Key header are kept for replay (seconds)
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
 
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=5),  # Shorter for security
@@ -184,6 +304,8 @@ SIMPLE_JWT = {
     "AUTH_TOKEN_CLASSES": ("rest_framework_simplejwt.tokens.AccessToken",),
     "TOKEN_TYPE_CLAIM": "token_type",
     "TOKEN_USER_CLASS": "rest_framework_simplejwt.models.TokenUser",
+    # Checks the refresh token's user through the user cache instead of the database
+    "TOKEN_REFRESH_SERIALIZER": "subscriptions.authentication.CachedTokenRefreshSerializer",
 
     "JTI_CLAIM": "jti",
 
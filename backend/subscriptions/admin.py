@@ -1,19 +1,47 @@
+from django import forms
 from django.contrib import admin
-from .models import SubscriptionPlan, UserSubscription, Payment
+from django.core.exceptions import ValidationError
+from .models import DailyPlanStats, SubscriptionPlan, UserSubscription, Payment
+from .analytics import monthly_summary
+from .services import verify_payments
 from django.utils import timezone
 from django.utils.html import format_html
 from django.contrib import messages
+from django.db import IntegrityError, transaction
+from dateutil.relativedelta import relativedelta
 
 @admin.register(SubscriptionPlan)
 class SubscriptionPlanAdmin(admin.ModelAdmin):
     list_display = ('name', 'price', 'duration_months')
     search_fields = ('name',)
 
+class UserSubscriptionAdminForm(forms.ModelForm):
+    class Meta:
+        model = UserSubscription
+        fields = '__all__'
+
+    def clean(self):
+        cleaned_data = super().clean()
+        user = cleaned_data.get('user')
+        # Status is read-only here, so the instance's value is the one that gets saved
+        if user and self.instance.status == 'ACTIVE':
+            live = (
+                UserSubscription.objects.filter(user=user, status='ACTIVE')
+                .exclude(end_date__lt=timezone.now().date())
+                .exclude(pk=self.instance.pk)
+            )
+            if live.exists():
+                raise ValidationError(f"{user.username} already has an active subscription.")
+        return cleaned_data
+
+
 @admin.register(UserSubscription)
 class UserSubscriptionAdmin(admin.ModelAdmin):
+    form = UserSubscriptionAdminForm
     list_display = ('user', 'plan', 'is_active_display', 'start_date', 'end_date')
+    list_select_related = ('user', 'plan')
     readonly_fields = ('status',)
-    list_filter = ('plan', 'status')
+    list_filter = ('plan', 'status', 'auto_renew')
     search_fields = ('user__username', 'plan__name')
     
     # def status_icon(self, obj):
@@ -35,13 +63,13 @@ class UserSubscriptionAdmin(admin.ModelAdmin):
         if request.user.is_superuser:
             return (
                 (None, {
-                    'fields': ('user', 'plan', 'status', 'start_date', 'end_date')
+                    'fields': ('user', 'plan', 'status', 'start_date', 'end_date', 'auto_renew')
                 }),
             )
         else:
             return (
                 (None, {
-                    'fields': ('user', 'plan', 'status'),
+                    'fields': ('user', 'plan', 'status', 'auto_renew'),
                     'readonly_fields': ('start_date', 'end_date')
                 }),
             )
@@ -58,26 +86,47 @@ class UserSubscriptionAdmin(admin.ModelAdmin):
 @admin.register(Payment)
 class PaymentAdmin(admin.ModelAdmin):
     list_display = ('user', 'plan', 'is_verified', 'created_at', 'payment_proof_display', 'subscription_status')
+    list_select_related = ('user', 'plan')
     list_filter = ('is_verified', 'plan')
     search_fields = ('user__username', 'plan__name')
     readonly_fields = ('payment_proof_display', 'user', 'plan', 'subscription', 'created_at')
     fields = ('user', 'plan', 'payment_proof_display', 'is_verified', 'subscription', 'created_at')
+    actions = ('verify_selected_payments',)
 
     def payment_proof_display(self, obj):
         if obj.payment_proof:
+            if obj.proof_thumbnail:
+                # Link the compressed review copy rather than the full-size original
+                return format_html(
+                    '<a href="{}" target="_blank"><img src="{}" alt="Payment proof" style="max-height: 80px;"></a>',
+                    obj.proof_review.url, obj.proof_thumbnail.url
+                )
             return format_html('<a href="{}" target="_blank">View Payment Proof</a>', obj.payment_proof.url)
         return "No image"
 
     payment_proof_display.short_description = 'Payment Proof Link'
     
     def subscription_status(self, obj):
-        if obj.subscription:
+        # Only the foreign key is needed here, so don't load the subscription row
+        if obj.subscription_id:
             return format_html('<span style="color: green;">✓ Created</span>')
         elif obj.is_verified:
             return format_html('<span style="color: orange;">⚠ Verified but no subscription</span>')
         
     subscription_status.short_description = 'Subscription'
     
+    @admin.action(description='Verify selected payments and create subscriptions')
+    def verify_selected_payments(self, request, queryset):
+        result = verify_payments(list(queryset.values_list('pk', flat=True)))
+        if result['verified']:
+            messages.success(request, f"Verified {len(result['verified'])} payment(s) and created their subscriptions.")
+        if result['skipped']:
+            messages.warning(
+                request,
+                f"Skipped {len(result['skipped'])} payment(s) that were already verified, "
+                "had no plan, or belong to a user with an active subscription."
+            )
+
     def save_model(self, request, obj, form, change):
         # Check if is_verified changed from False to True
         if change and obj.is_verified:
@@ -90,12 +139,47 @@ class PaymentAdmin(admin.ModelAdmin):
                     start_date=timezone.now().date()
                 )
                 # end_date will be calculated automatically in the model's save method
-                new_subscription.save()
-                
-                # Link the subscription to this payment
-                obj.subscription = new_subscription
-                
-                messages.success(request, f"Subscription for {obj.user.username} has been created and activated.")
+                try:
+                    with transaction.atomic():
+                        new_subscription.save()
+                except IntegrityError:
+                    # Leave the payment pending so it can be verified once the current subscription ends
+                    obj.is_verified = False
+                    messages.error(request, f"{obj.user.username} already has an active subscription.")
+                else:
+                    # Link the subscription to this payment
+                    obj.subscription = new_subscription
+                    
+                    messages.success(request, f"Subscription for {obj.user.username} has been created and activated.")
         
         super().save_model(request, obj, form, change)
 
+
+@admin.register(DailyPlanStats)
+class DailyPlanStatsAdmin(admin.ModelAdmin):
+    # Read-only dashboard over the rollups written by `manage.py rollup_daily_stats`
+    list_display = (
+        'date', 'plan', 'new_subscriptions', 'renewed_subscriptions',
+        'expired_subscriptions', 'active_subscriptions', 'revenue',
+    )
+    list_select_related = ('plan',)
+    list_filter = ('plan',)
+    date_hierarchy = 'date'
+    ordering = ('-date', 'plan')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        today = timezone.now().date()
+        extra_context = {
+            **(extra_context or {}),
+            'monthly_summary': monthly_summary(today.replace(day=1) - relativedelta(months=11), today),
+        }
+        return super().changelist_view(request, extra_context=extra_context)
@@ -0,0 +1,160 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Count, Exists, OuterRef, Sum
+from django.utils import timezone
+
+from .models import DailyPlanStats, Payment, RollupDay, SubscriptionPlan, UserSubscription
+
+# Daily per-plan rollups for reporting. For each day and plan they hold the
+# subscriptions that started (new, or renewed when the user had an earlier
+# subscription), ran out (end_date) and were running, plus verified revenue,
+# booked on the start date of the paid subscription. Canceled subscriptions
+# are left out. Writes mark the days they affect as dirty (see signals.py and
+# services.py) and jobs.rollup_daily_stats recomputes only those days and the
+# ones since its last run, so reports read rollup rows instead of the history.
+
+STAT_FIELDS = (
+    'new_subscriptions', 'renewed_subscriptions', 'expired_subscriptions', 'active_subscriptions', 'revenue',
+)
+
+
+def date_range(first, last):
+    return [first + timedelta(days=offset) for offset in range((last - first).days + 1)]
+
+
+def subscription_days(start_date, end_date, today=None):
+    """Days (up to today) whose stats depend on a subscription with these dates"""
+    if not start_date:
+        return []
+    today = today or timezone.now().date()
+    return date_range(start_date, min(end_date or start_date, today))
+
+
+def mark_days_dirty(days):
+    """Queue days for recomputation by the next rollup run"""
+    if days:
+        RollupDay.objects.bulk_create(
+            [RollupDay(date=day, dirty=True) for day in set(days)],
+            update_conflicts=True,
+            unique_fields=['date'],
+            update_fields=['dirty'],
+        )
+
+
+def mark_subscriptions_dirty(subscriptions, today=None):
+    """mark_days_dirty for every day the given subscriptions count towards"""
+    days = set()
+    for start_date, end_date in {(s.start_date, s.end_date) for s in subscriptions}:
+        days.update(subscription_days(start_date, end_date, today))
+    mark_days_dirty(days)
+
+
+def compute_stats(days):
+    """Build DailyPlanStats rows for `days` from the subscription and payment tables.
+
+    Costs a fixed number of queries; the active counts come from one pass over
+    the subscriptions overlapping the days, so keep the span of `days` short.
+    """
+    days = sorted(days)
+    first, last = days[0], days[-1]
+    span = (last - first).days + 1
+    counted = UserSubscription.objects.exclude(status='CANCELED')
+    totals = defaultdict(lambda: dict.fromkeys(STAT_FIELDS, 0))
+
+    earlier = UserSubscription.objects.filter(user_id=OuterRef('user_id'), start_date__lt=OuterRef('start_date'))
+    starts = (
+        counted.filter(start_date__in=days)
+        .annotate(is_renewal=Exists(earlier))
+        .values_list('start_date', 'plan_id', 'is_renewal')
+    )
+    for day, plan_id, is_renewal in starts.iterator(chunk_size=2000):
+        totals[day, plan_id]['renewed_subscriptions' if is_renewal else 'new_subscriptions'] += 1
+
+    ends = counted.filter(end_date__in=days).values('end_date', 'plan_id').annotate(count=Count('id'))
+    for row in ends:
+        totals[row['end_date'], row['plan_id']]['expired_subscriptions'] = row['count']
+
+    revenue = (
+        Payment.objects.filter(is_verified=True, plan__isnull=False, subscription__start_date__in=days)
+        .values('subscription__start_date', 'plan_id')
+        .annotate(total=Sum('plan__price'))
+    )
+    for row in revenue:
+        totals[row['subscription__start_date'], row['plan_id']]['revenue'] = row['total']
+
+    # Running subscriptions: +1 on the first covered day, -1 after the last one
+    changes = defaultdict(lambda: [0] * (span + 1))
+    running = (
+        counted.filter(start_date__lte=last, end_date__gte=first)
+        .values_list('plan_id', 'start_date', 'end_date')
+    )
+    for plan_id, start_date, end_date in running.iterator(chunk_size=2000):
+        changes[plan_id][max((start_date - first).days, 0)] += 1
+        changes[plan_id][min((end_date - first).days, span - 1) + 1] -= 1
+    wanted = set(days)
+    for plan_id, deltas in changes.items():
+        active = 0
+        for offset, day in enumerate(date_range(first, last)):
+            active += deltas[offset]
+            if active and day in wanted:
+                totals[day, plan_id]['active_subscriptions'] = active
+
+    return [
+        DailyPlanStats(date=day, plan_id=plan_id, **values)
+        for (day, plan_id), values in sorted(totals.items())
+        if day in wanted
+    ]
+
+
+def monthly_summary(first, last, plan_id=None):
+    """Per-month totals from the rollups between two dates, one entry per month.
+
+    ``active_subscriptions`` and ``mrr`` (recurring revenue per month, from plan
+    price over duration) are taken on the month's last rolled-up day.
+    ``churn_rate`` is expired minus renewed subscriptions over those running on
+    the month's first rolled-up day.
+    """
+    stats = DailyPlanStats.objects.filter(date__range=(first, last))
+    if plan_id is not None:
+        stats = stats.filter(plan_id=plan_id)
+    monthly_price = {
+        plan.pk: plan.price / plan.duration_months
+        for plan in SubscriptionPlan.objects.all()
+        if plan.duration_months
+    }
+
+    months = {}
+    for row in stats.order_by('date').values('date', 'plan_id', *STAT_FIELDS).iterator(chunk_size=2000):
+        month = months.setdefault(row['date'].replace(day=1), {
+            'new_subscriptions': 0, 'renewed_subscriptions': 0, 'expired_subscriptions': 0,
+            'revenue': Decimal('0'), 'opening': None, 'last_day': None, 'closing': {},
+        })
+        for field in ('new_subscriptions', 'renewed_subscriptions', 'expired_subscriptions', 'revenue'):
+            month[field] += row[field]
+        if month['opening'] is None:
+            month['opening'] = {'date': row['date'], 'active': 0}
+        if row['date'] == month['opening']['date']:
+            month['opening']['active'] += row['active_subscriptions']
+        if row['date'] != month['last_day']:
+            month['last_day'], month['closing'] = row['date'], {}
+        month['closing'][row['plan_id']] = row['active_subscriptions']
+
+    summary = []
+    for start, month in sorted(months.items()):
+        churned = max(month['expired_subscriptions'] - month['renewed_subscriptions'], 0)
+        opening = month['opening']['active']
+        summary.append({
+            'month': start,
+            'new_subscriptions': month['new_subscriptions'],
+            'renewed_subscriptions': month['renewed_subscriptions'],
+            'expired_subscriptions': month['expired_subscriptions'],
+            'active_subscriptions': sum(month['closing'].values()),
+            'revenue': month['revenue'],
+            'mrr': sum(
+                (monthly_price.get(pk, 0) * count for pk, count in month['closing'].items()), Decimal('0')
+            ).quantize(Decimal('0.01')),
+            'churn_rate': round(churned / opening, 4) if opening else None,
+        })
+    return summary
@@ -0,0 +1,129 @@
+from functools import wraps
+
+from django.conf import settings
+from django.http import HttpResponseNotModified, JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .. import catalog
+from ..authentication import aget_cached_user
+from ..models import CurrentSubscription, UserSubscription
+from .serializers import UserSerializer, UserSubscriptionSerializer
+
+# Async counterparts of the read-heavy views in views.py. DRF views are
+# synchronous, so these are plain Django async views using the async ORM and
+# cache APIs; under ASGI they don't tie up a worker thread while waiting on
+# the database. Responses match the sync endpoints, except that the user
+# subscription list pages with a plain ?before=<id> keyset cursor.
+
+
+async def authenticate(request):
+    """Return the user for the request's Bearer token, or None without one"""
+    parts = request.headers.get('Authorization', '').split()
+    if not parts:
+        return None
+    if len(parts) != 2 or parts[0] not in api_settings.AUTH_HEADER_TYPES:
+        raise AuthenticationFailed("Authorization header must contain two space-delimited values")
+    try:
+        token = AccessToken(parts[1])
+    except TokenError:
+        raise AuthenticationFailed("Given token not valid for any token type")
+    user = await aget_cached_user(token.get(api_settings.USER_ID_CLAIM))
+    if user is None or not user.is_active:
+        raise AuthenticationFailed("User not found")
+    return user
+
+
+def jwt_view(login_required=False):
+    """Authenticate the request like the sync views and only allow GET"""
+    def decorator(view):
+        @require_GET
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            try:
+                user = await authenticate(request)
+            except AuthenticationFailed as e:
+                return JsonResponse({"detail": str(e.detail)}, status=401)
+            if login_required and user is None:
+                return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+            request.user = user
+            return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def catalog_response(data, version, status=200):
+    if status == 304:
+        response = HttpResponseNotModified()
+    else:
+        response = JsonResponse(data, status=status, safe=False)
+    response['ETag'] = catalog.etag(version)
+    patch_cache_control(response, public=True, max_age=getattr(settings, 'PLAN_CATALOG_MAX_AGE', 300))
+    return response
+
+
+@require_GET
+async def plan_list(request):
+    version = await catalog.aget_version()
+    if catalog.etag_matches(request, version):
+        return catalog_response(None, version, status=304)
+    plans, _ = await catalog.aget_plans(version)
+    return catalog_response(plans, version)
+
+
+@require_GET
+async def plan_detail(request, pk):
+    version = await catalog.aget_version()
+    if catalog.etag_matches(request, version):
+        return catalog_response(None, version, status=304)
+    _, plans_by_id = await catalog.aget_plans(version)
+    if pk not in plans_by_id:
+        return JsonResponse({"detail": "No SubscriptionPlan matches the given query."}, status=404)
+    return catalog_response(plans_by_id[pk], version)
+
+
+@jwt_view(login_required=True)
+async def user_detail(request):
+    return JsonResponse(UserSerializer(request.user).data)
+
+
+@jwt_view()
+async def user_subscriptions(request, user_id):
+    try:
+        page_size = int(request.GET.get('page_size') or settings.API_PAGE_SIZE)
+        before = int(request.GET['before']) if request.GET.get('before') else None
+    except ValueError:
+        return JsonResponse({"detail": "Invalid page_size or before parameter."}, status=400)
+    page_size = max(1, min(page_size, settings.API_MAX_PAGE_SIZE))
+
+    subscriptions = UserSubscription.objects.filter(user__id=user_id).select_related('plan').order_by('-id')
+    if before is not None:
+        subscriptions = subscriptions.filter(id__lt=before)
+    page = [subscription async for subscription in subscriptions[:page_size + 1]]
+
+    next_url = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        query = request.GET.copy()
+        query['before'] = page[-1].id
+        next_url = request.build_absolute_uri(f"{request.path}?{query.urlencode()}")
+    return JsonResponse({
+        "next": next_url,
+        "results": UserSubscriptionSerializer(page, many=True).data,
+    })
+
+
+@jwt_view()
+async def user_current_subscription(request, user_id):
+    current = await (
+        CurrentSubscription.objects.select_related('subscription__plan')
+        .filter(user_id=user_id)
+        .afirst()
+    )
+    if not current:
+        return JsonResponse({"error": "No subscription found for this user."}, status=404)
+    return JsonResponse(UserSubscriptionSerializer(current.subscription).data)
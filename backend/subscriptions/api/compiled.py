@@ -0,0 +1,172 @@
+from functools import cached_property
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+from .. import catalog
+from ..models import SubscriptionPlan
+from .serializers import DailyPlanStatsSerializer, PaymentSerializer, SubscriptionPlanSerializer, UserSubscriptionSerializer
+from .sparse import check
+
+# Read-only fast path for the list endpoints. A RowSerializer looks at the
+# readable fields of a ModelSerializer once and turns them into a plan of
+# (output key, .values() column, converter); serializing a page is then a
+# loop over plain dict rows, with no model instances, field objects or
+# nested serializers per row. Nested plans come from the versioned plan
+# catalog. The output matches the ModelSerializer's .data exactly (see
+# GoldenSerializationTests), so fields it can't reproduce are rejected
+# when the plan is built. select() narrows the plan for ?fields= and
+# ?expand= like SparseFieldsMixin narrows the serializer.
+
+# Fields whose to_representation() returns database values unchanged
+_PASSTHROUGH = (serializers.IntegerField, serializers.BooleanField, serializers.CharField)
+# Fields whose to_representation() only depends on the value
+_CONVERTED = (serializers.ChoiceField, serializers.DateField, serializers.DateTimeField, serializers.DecimalField)
+
+
+def _bind_plans(context):
+    """Plan id -> serialized plan, from the catalog"""
+    _, plans_by_id = catalog.get_plans(catalog.get_version())
+    newer = None
+
+    def plan(pk):
+        nonlocal newer
+        data = plans_by_id.get(pk)
+        if data is None:
+            # Created after the catalog snapshot was taken; load all of those at once
+            if newer is None:
+                newer = {
+                    new_plan.pk: dict(SubscriptionPlanSerializer(new_plan).data)
+                    for new_plan in SubscriptionPlan.objects.exclude(pk__in=list(plans_by_id))
+                }
+            data = newer[pk]
+        return data
+    return plan
+
+
+def _bind_file(model_field):
+    def bind(context):
+        request = context.get('request')
+        storage = model_field.storage
+        use_url = api_settings.UPLOADED_FILES_USE_URL
+
+        def file(name):
+            if not name:
+                return None
+            if not use_url:
+                return name
+            url = storage.url(name)
+            return request.build_absolute_uri(url) if request is not None else url
+        return file
+    return bind
+
+
+# Nested serializers the fast path can fill in without a query per row
+NESTED = {SubscriptionPlanSerializer: _bind_plans}
+
+
+class RowSelection:
+    """A field plan: [(key, column, converter or None, bind or None)] in output order"""
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    @cached_property
+    def columns(self):
+        """Columns to pass to .values()"""
+        return tuple(dict.fromkeys(column for _, column, _, _ in self.fields))
+
+    def serialize(self, rows, context=None):
+        context = context or {}
+        fields = [
+            (name, column, bind(context) if bind else convert)
+            for name, column, convert, bind in self.fields
+        ]
+        data = []
+        for row in rows:
+            item = {}
+            for name, column, convert in fields:
+                value = row[column]
+                item[name] = value if convert is None or value is None else convert(value)
+            data.append(item)
+        return data
+
+
+class RowSerializer(RowSelection):
+    """Serialize .values() rows the way `serializer_class` serializes instances.
+
+    ``computed`` maps read-only fields backed by a model property to
+    ``(column, bind)``: ``bind(context)`` returns a function of the column
+    value (never called for None, which serializes as None).
+    """
+
+    def __init__(self, serializer_class, computed=None):
+        self.serializer_class = serializer_class
+        self.computed = computed or {}
+
+    @cached_property
+    def fields(self):
+        """The full field plan, in the serializer's field order"""
+        model = self.serializer_class.Meta.model
+        fields = []
+        for field in self.serializer_class()._readable_fields:
+            name = field.field_name
+            if name in self.computed:
+                column, bind = self.computed[name]
+                fields.append((name, column, None, bind))
+                continue
+            if '.' in field.source or field.source == '*':
+                raise ImproperlyConfigured(f"{self.serializer_class.__name__}.{name}: source {field.source!r} isn't a column")
+            model_field = model._meta.get_field(field.source)
+            column = model_field.attname
+            if type(field) in NESTED:
+                fields.append((name, column, None, NESTED[type(field)]))
+            elif isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+                fields.append((name, column, None, None))
+            elif isinstance(field, serializers.FileField):
+                fields.append((name, column, None, _bind_file(model_field)))
+            elif isinstance(field, _CONVERTED):
+                fields.append((name, column, field.to_representation, None))
+            elif isinstance(field, _PASSTHROUGH):
+                fields.append((name, column, None, None))
+            else:
+                raise ImproperlyConfigured(
+                    f"{self.serializer_class.__name__}.{name}: {type(field).__name__} isn't supported by RowSerializer"
+                )
+        return fields
+
+    @cached_property
+    def expandable(self):
+        """Field name -> bind for the nested object, for the serializer's expandable_fields"""
+        return {name: NESTED[nested] for name, nested in getattr(self.serializer_class, 'expandable_fields', {}).items()}
+
+    def select(self, fields=None, expand=frozenset()):
+        """The plan for ?fields= and ?expand= (see sparse.py); this serializer without them"""
+        if fields is None and not expand:
+            return self
+        check([name for name, _, _, _ in self.fields], self.expandable, fields, expand)
+        selected = []
+        for name, column, convert, bind in self.fields:
+            if fields is not None and name not in fields:
+                continue
+            if name in expand:
+                convert, bind = None, self.expandable[name]
+            elif fields is not None and name in self.expandable:
+                # Sparse requests get the id unless the relation is expanded
+                convert, bind = None, None
+            selected.append((name, column, convert, bind))
+        return RowSelection(selected)
+
+
+def _bind_is_active(context):
+    # UserSubscription.is_active, with today's date looked up once per page
+    today = timezone.now().date()
+    return lambda end_date: end_date >= today
+
+
+SUBSCRIPTION_ROWS = RowSerializer(UserSubscriptionSerializer, computed={'is_active': ('end_date', _bind_is_active)})
+PAYMENT_ROWS = RowSerializer(PaymentSerializer)
+PLAN_ROWS = RowSerializer(SubscriptionPlanSerializer)
+DAILY_STATS_ROWS = RowSerializer(DailyPlanStatsSerializer)
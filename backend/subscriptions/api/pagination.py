@@ -0,0 +1,22 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """Opaque-cursor pagination on the primary key.
+
+    Every page is an indexed range scan (``WHERE id < <cursor>``), so deep
+    pages cost the same as the first one. Rows come newest-created first,
+    which is not the same as ``-start_date``: imported history, provisioned
+    start dates and renewals get ids out of start-date order. ``start_date``
+    is nullable and can't anchor a cursor, so sort by it on the client if
+    that order matters.
+    """
+    ordering = '-id'
+    page_size_query_param = 'page_size'
+
+    def get_page_size(self, request):
+        # Read from settings per request so the size can be tuned without a code change
+        self.page_size = getattr(settings, 'API_PAGE_SIZE', 50)
+        self.max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 500)
+        return super().get_page_size(request)
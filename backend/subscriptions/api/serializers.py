@@ -1,31 +1,120 @@
 from rest_framework import serializers
-from ..models import SubscriptionPlan, UserSubscription, Payment
+from .. import metrics
+from .sparse import check, sparse_params
+from ..models import DailyPlanStats, SubscriptionPlan, UserSubscription, Payment
 from django.contrib.auth.models import User
 
-class UserSerializer(serializers.ModelSerializer):
+class TimedListSerializer(serializers.ListSerializer):
+    @property
+    def data(self):
+        with metrics.serializer_timer():
+            return super().data
+
+
+class TimedSerializerMixin:
+    """Count building .data towards the request's serializer time in the metrics"""
+
+    @property
+    def data(self):
+        with metrics.serializer_timer():
+            return super().data
+
+
+class SparseFieldsMixin:
+    """Apply ?fields= and ?expand= (see sparse.py) to GET representations.
+
+    ``expandable_fields`` maps relation fields to the serializer used when
+    they're expanded; in sparse responses they're ids otherwise.
+    """
+    expandable_fields = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields, expand = sparse_params(kwargs.get('context', {}).get('request'))
+        if fields is None and not expand:
+            return
+        readable = [name for name, field in self.fields.items() if not field.write_only]
+        check(readable, self.expandable_fields, fields, expand)
+        for name in readable:
+            if fields is not None and name not in fields:
+                self.fields.pop(name)
+            elif name in expand:
+                self.fields[name] = self.expandable_fields[name](read_only=True)
+            elif fields is not None and name in self.expandable_fields:
+                self.fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
+
+
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'username', 'email')
 
-class SubscriptionPlanSerializer(serializers.ModelSerializer):
+class SubscriptionPlanSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = SubscriptionPlan
         fields = '__all__'
+        list_serializer_class = TimedListSerializer
 
-class UserSubscriptionSerializer(serializers.ModelSerializer):
+class UserSubscriptionSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
+    expandable_fields = {'plan': SubscriptionPlanSerializer}
     plan = SubscriptionPlanSerializer(read_only=True)
     plan_id = serializers.PrimaryKeyRelatedField(queryset=SubscriptionPlan.objects.all(), write_only=True, source='plan')
     is_active = serializers.ReadOnlyField()
     class Meta:
         model = UserSubscription
         fields = '__all__'
+        list_serializer_class = TimedListSerializer
+
+class PrevalidatedPlanField(serializers.PrimaryKeyRelatedField):
+    """Use the plan the view already loaded (context['plan']) instead of fetching it again"""
+
+    def to_internal_value(self, data):
+        plan = self.context.get('plan')
+        if plan is not None and str(data) == str(plan.pk):
+            return plan
+        return super().to_internal_value(data)
 
-class PaymentSerializer(serializers.ModelSerializer):
-    plan = serializers.PrimaryKeyRelatedField(queryset=SubscriptionPlan.objects.all(), required=True)
+
+class PaymentSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
+    expandable_fields = {'plan': SubscriptionPlanSerializer}
+    plan = PrevalidatedPlanField(queryset=SubscriptionPlan.objects.all(), required=True)
     subscription = serializers.PrimaryKeyRelatedField(read_only=True) 
     
     class Meta:
         model = Payment
         fields = ['id', 'plan', 'subscription', 'payment_proof', 'is_verified', 'created_at', 'user']
+        list_serializer_class = TimedListSerializer
         read_only_fields = ['is_verified', 'user', 'created_at', 'subscription']  # user is set automatically from request
 
+
+
+class SubscriptionProvisionSerializer(serializers.Serializer):
+    # Plain ids rather than related fields, so validating a large batch
+    # doesn't look up every user and plan one by one
+    user = serializers.IntegerField(min_value=1)
+    plan = serializers.IntegerField(min_value=1)
+    start_date = serializers.DateField(required=False)
+
+
+class DailyPlanStatsSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = DailyPlanStats
+        exclude = ['id']
+        list_serializer_class = TimedListSerializer
+
+
+class AnalyticsQuerySerializer(serializers.Serializer):
+    # Query parameters of the analytics endpoints; the views fill in default dates
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    plan = serializers.IntegerField(min_value=1, required=False)
+
+    def validate(self, attrs):
+        if attrs.get('start') and attrs.get('end') and attrs['start'] > attrs['end']:
+            raise serializers.ValidationError("start must not be after end.")
+        return attrs
+
+
+class ExportQuerySerializer(AnalyticsQuerySerializer):
+    # Checked against the exported model in exports.export_queryset
+    status = serializers.CharField(required=False)
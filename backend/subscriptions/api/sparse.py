@@ -0,0 +1,46 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+# Sparse fieldsets for reads. ?fields=id,status returns only the named
+# fields, and relations come back as ids unless ?expand=plan asks for the
+# nested object. Without ?fields= every field is returned as before (with
+# ?expand= still embedding relations that are ids by default). The views
+# narrow their querysets to the columns the selected fields read.
+
+
+def _names(value):
+    return tuple(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+
+
+def sparse_params(request):
+    """(fields or None, expand) requested by a GET; writes always get the full representation"""
+    if request is None or request.method not in SAFE_METHODS:
+        return None, frozenset()
+    query = getattr(request, 'query_params', request.GET)
+    fields = _names(query.get('fields', ''))
+    return fields or None, frozenset(_names(query.get('expand', '')))
+
+
+def check(names, expandable, fields, expand):
+    """Reject field and expansion names the resource doesn't have"""
+    errors = {}
+    unknown = [name for name in fields or () if name not in names]
+    if unknown:
+        errors['fields'] = [f"Unknown fields: {', '.join(unknown)}. Choose from: {', '.join(names)}."]
+    unknown = sorted(expand - set(expandable))
+    if unknown:
+        errors['expand'] = [
+            f"Can't expand: {', '.join(unknown)}. Expandable: {', '.join(expandable) or 'nothing'}."
+        ]
+    if errors:
+        raise ValidationError(errors)
+
+
+def narrow(queryset, selection, expand, prefix=''):
+    """only() the columns `selection` reads (under `prefix` for a related model),
+    joining expanded relations and nothing else"""
+    related = [prefix + name for name in sorted(expand)]
+    queryset = queryset.select_related(None).only(*(prefix + column for column in selection.columns), *related)
+    if prefix:
+        related.append(prefix[:-2])
+    return queryset.select_related(*related) if related else queryset
@@ -1,14 +1,31 @@
 from rest_framework.views import APIView
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework import generics, status
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated, SAFE_METHODS
+from rest_framework.renderers import BrowsableAPIRenderer
 
 
-from ..models import UserSubscription, SubscriptionPlan, Payment
+from ..models import UserSubscription, SubscriptionPlan, Payment, CurrentSubscription, DailyPlanStats
+from django.conf import settings
 from django.utils import timezone
+from datetime import timedelta
+from dateutil.relativedelta import relativedelta
+from django.utils.cache import patch_cache_control
+from django.db import IntegrityError, transaction
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from .serializers import SubscriptionPlanSerializer, UserSubscriptionSerializer, UserSerializer, PaymentSerializer
+from .. import cache as entitlements, catalog, exports, metrics
+from ..authentication import CachedJWTAuthentication
+from ..cache import get_entitlement
+from ..idempotency import idempotent
+from ..analytics import monthly_summary
+from ..services import payment_eligibility, provision_subscriptions
+from .compiled import DAILY_STATS_ROWS, PAYMENT_ROWS, PLAN_ROWS, SUBSCRIPTION_ROWS
+from .pagination import KeysetPagination
+from .renderers import FastJSONRenderer
+from .sparse import narrow, sparse_params
+from .serializers import SubscriptionPlanSerializer, UserSubscriptionSerializer, UserSerializer, PaymentSerializer, SubscriptionProvisionSerializer, DailyPlanStatsSerializer, AnalyticsQuerySerializer, ExportQuerySerializer
 from django.contrib.auth.models import User
 from rest_framework.authentication import TokenAuthentication
 import logging
@@ -16,34 +33,158 @@ import logging
 # Set up logging
 logger = logging.getLogger(__name__)
 
+class PlanCatalogCacheMixin:
+    """Serve plan reads from the versioned in-memory catalog with ETags"""
+
+    def perform_authentication(self, request):
+        # Plan reads are public, so don't resolve the user (a database hit) for them
+        if request.method not in SAFE_METHODS:
+            super().perform_authentication(request)
+
+    def catalog_response(self, data, version, status_code=status.HTTP_200_OK):
+        fields, expand = sparse_params(self.request)
+        if data is not None and (fields is not None or expand):
+            names = [name for name, _, _, _ in PLAN_ROWS.select(fields, expand).fields]
+            if isinstance(data, list):
+                data = [{name: plan[name] for name in names} for plan in data]
+            else:
+                data = {name: data[name] for name in names}
+        response = Response(data, status=status_code)
+        response['ETag'] = catalog.etag(version)
+        patch_cache_control(response, public=True, max_age=getattr(settings, 'PLAN_CATALOG_MAX_AGE', 300))
+        return response
+
+
+class CompiledListMixin:
+    """Serve list GETs from .values() rows through a precompiled RowSerializer (see compiled.py)"""
+    row_serializer = None
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def list(self, request, *args, **kwargs):
+        rows = self.row_serializer.select(*sparse_params(request))
+        columns = rows.columns
+        if self.paginator is not None:
+            # The pagination cursor is taken from the id, even when it isn't a selected field
+            columns = tuple(dict.fromkeys(columns + ('id',)))
+        queryset = self.filter_queryset(self.get_queryset()).values(*columns)
+        page = self.paginate_queryset(queryset)
+        with metrics.serializer_timer():
+            data = rows.serialize(queryset if page is None else page, self.get_serializer_context())
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+
 # Create your views here.
-class SubscriptionPlanListCreate(generics.ListCreateAPIView):
+class SubscriptionPlanListCreate(PlanCatalogCacheMixin, generics.ListCreateAPIView):
     queryset = SubscriptionPlan.objects.all()
     serializer_class = SubscriptionPlanSerializer
 
-class SubscriptionPlanRetrieveUpdateDestroy(generics.RetrieveUpdateDestroyAPIView):
+    def list(self, request, *args, **kwargs):
+        version = catalog.get_version()
+        if catalog.etag_matches(request, version):
+            return self.catalog_response(None, version, status.HTTP_304_NOT_MODIFIED)
+        plans, _ = catalog.get_plans(version)
+        return self.catalog_response(plans, version)
+
+class SubscriptionPlanRetrieveUpdateDestroy(PlanCatalogCacheMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = SubscriptionPlan.objects.all()
     serializer_class = SubscriptionPlanSerializer
+
+    def retrieve(self, request, *args, **kwargs):
+        version = catalog.get_version()
+        if catalog.etag_matches(request, version):
+            return self.catalog_response(None, version, status.HTTP_304_NOT_MODIFIED)
+        _, plans_by_id = catalog.get_plans(version)
+        plan = plans_by_id.get(kwargs['pk'])
+        if plan is None:
+            # Not in the catalog: let the regular lookup produce the 404
+            return super().retrieve(request, *args, **kwargs)
+        return self.catalog_response(plan, version)
     
-class UserSubscriptionListCreate(generics.ListCreateAPIView):
-    queryset = UserSubscription.objects.all()
+class UserSubscriptionListCreate(CompiledListMixin, generics.ListCreateAPIView):
+    queryset = UserSubscription.objects.select_related('plan')
     serializer_class = UserSubscriptionSerializer
+    row_serializer = SUBSCRIPTION_ROWS
+    pagination_class = KeysetPagination
 
     def perform_create(self, serializer):
         user = serializer.validated_data['user']
         current_date = timezone.now().date()
+        # Any unexpired subscription counts, whatever its status
         if UserSubscription.objects.filter(user=user, end_date__gte=current_date).exists():
             raise ValidationError("You already have an active subscription.")
-        serializer.save()
+        # The one-active-subscription constraint still catches concurrent creates
+        try:
+            with transaction.atomic():
+                serializer.save()
+        except IntegrityError:
+            raise ValidationError("You already have an active subscription.")
+
+class SubscriptionBatchCreateView(generics.GenericAPIView):
+    permission_classes = [IsAdminUser]
+    serializer_class = SubscriptionProvisionSerializer
+
+    def post(self, request, *args, **kwargs):
+        max_batch = getattr(settings, 'PROVISIONING_MAX_BATCH', 5000)
+        if not isinstance(request.data, list) or not 0 < len(request.data) <= max_batch:
+            return Response(
+                {"error": f"Send a list of 1 to {max_batch} subscriptions."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            results = provision_subscriptions(serializer.validated_data)
+        except IntegrityError:
+            # A concurrent request subscribed one of these users first
+            return Response(
+                {"error": "Subscriptions changed while provisioning; please retry."},
+                status=status.HTTP_409_CONFLICT
+            )
+        failed = sum(1 for result in results if 'error' in result)
+        return Response(
+            {"created": len(results) - failed, "failed": failed, "results": results},
+            status=status.HTTP_200_OK
+        )
 
 class UserSubscriptionRetrieveUpdateDestroy(generics.RetrieveUpdateDestroyAPIView):
-    queryset = UserSubscription.objects.all()
+    queryset = UserSubscription.objects.select_related('plan')
     serializer_class = UserSubscriptionSerializer
+
+    def get_queryset(self):
+        fields, expand = sparse_params(self.request)
+        if fields is None:
+            return super().get_queryset()
+        return narrow(super().get_queryset(), SUBSCRIPTION_ROWS.select(fields, expand), expand)
     
-class UserSubscriptions(APIView):
+class UserSubscriptions(CompiledListMixin, generics.ListAPIView):
+    authentication_classes = [CachedJWTAuthentication]
+    serializer_class = UserSubscriptionSerializer
+    row_serializer = SUBSCRIPTION_ROWS
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        return UserSubscription.objects.filter(user__id=self.kwargs['user_id']).select_related('plan')
+
+
+class UserCurrentSubscription(APIView):
+    authentication_classes = [CachedJWTAuthentication]
+
     def get(self, request, user_id):
-        subscriptions = UserSubscription.objects.filter(user__id=user_id).order_by('-start_date')
-        serializer = UserSubscriptionSerializer(subscriptions, many=True)
+        # Single primary key lookup on the maintained pointer instead of the full history
+        current = CurrentSubscription.objects.select_related('subscription__plan')
+        fields, expand = sparse_params(request)
+        if fields is not None:
+            current = narrow(current, SUBSCRIPTION_ROWS.select(fields, expand), expand, prefix='subscription__')
+        current = current.filter(user_id=user_id).first()
+        if not current:
+            return Response(
+                {"error": "No subscription found for this user."},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        serializer = UserSubscriptionSerializer(current.subscription, context={'request': request})
         return Response(serializer.data)
     
 
@@ -51,11 +192,13 @@ class RenewSubscriptionView(generics.GenericAPIView):
     # authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
 
+    @idempotent
     def post(self, request, *args, **kwargs):
         user = request.user
         
         # Find the user's latest expired subscription to get the plan
-        latest_expired_sub = UserSubscription.objects.filter(user=user).order_by('-end_date').first()
+        current = CurrentSubscription.objects.select_related('subscription__plan').filter(user=user).first()
+        latest_expired_sub = current.subscription if current else None
 
         if not latest_expired_sub:
             return Response(
@@ -69,7 +212,14 @@ class RenewSubscriptionView(generics.GenericAPIView):
             plan=latest_expired_sub.plan,
             start_date=timezone.now().date(),
         )
-        new_subscription.save()
+        try:
+            with transaction.atomic():
+                new_subscription.save()
+        except IntegrityError:
+            return Response(
+                {"error": "You already have an active subscription."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
         return Response(
             {"message": "Subscription renewed successfully!"},
@@ -81,6 +231,7 @@ class PurchaseSubscriptionView(generics.GenericAPIView):
     permission_classes = [IsAuthenticated]
     # authentication_classes = [TokenAuthentication]
 
+    @idempotent
     def post(self, request, *args, **kwargs):
         user = request.user
         plan_id = request.data.get('plan_id')
@@ -92,16 +243,16 @@ class PurchaseSubscriptionView(generics.GenericAPIView):
             )
         
         try:
+            entitlement = get_entitlement(user.id)
+
             # Check if the user already has an active subscription
-            active_subscriptions = UserSubscription.objects.filter(user=user,end_date__gte=timezone.now().date())
-            if active_subscriptions.exists():
+            if entitlement['active']:
                 return Response(
                     {"error": "You already have an active subscription."},
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            pending_payment = Payment.objects.filter(user=user, is_verified=False).first()
-            if pending_payment:
+            if entitlement['pending_payment']:
                 return Response(
                     {"error": "You have a pending payment awaiting verification."},
                     status=status.HTTP_400_BAD_REQUEST
@@ -121,6 +272,7 @@ class PurchaseSubscriptionView(generics.GenericAPIView):
             
 class UserDetailView(generics.RetrieveAPIView):
     # authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
     serializer_class = UserSerializer
     
@@ -138,12 +290,26 @@ class UserDetailView(generics.RetrieveAPIView):
             )
 
 
-class PaymentCreateView(generics.CreateAPIView):
+class PaymentCreateView(CompiledListMixin, generics.ListCreateAPIView):
     queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
+    row_serializer = PAYMENT_ROWS
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
     # authentication_classes = [TokenAuthentication]
 
+    def get_authenticators(self):
+        # Cached users can't be saved, so only the payment list uses them;
+        # uploads authenticate with the stock JWTAuthentication
+        if self.request.method in SAFE_METHODS:
+            return [CachedJWTAuthentication()]
+        return super().get_authenticators()
+
+    def get_queryset(self):
+        # Users only ever list their own payments
+        return Payment.objects.filter(user=self.request.user)
+
+    @idempotent
     def create(self, request, *args, **kwargs):
         
         # Check for required fields
@@ -160,51 +326,58 @@ class PaymentCreateView(generics.CreateAPIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        # Plan, pending payment and active subscription in one query
+        try:
+            plan_id = request.data.get('plan')
+            logger.info(f"PaymentCreateView - Plan ID: {plan_id}")
+            eligibility = payment_eligibility(request.user.id, plan_id)
+        except Exception as e:
+            logger.error(f"PaymentCreateView - Error validating plan: {str(e)}")
+            return Response(
+                {"error": f"Error validating plan: {str(e)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if eligibility['plan'] is None:
+            logger.error(f"PaymentCreateView - Plan not found: {plan_id}")
+            return Response(
+                {"error": "Plan not found"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        logger.info(f"PaymentCreateView - Found plan: {eligibility['plan']}")
+
         # Check if user already has a pending payment
-        existing_pending = Payment.objects.filter(user=request.user, is_verified=False).first()
-        if existing_pending:
-            logger.error(f"PaymentCreateView - User already has pending payment")
+        if eligibility['pending_payment']:
+            logger.error("PaymentCreateView - User already has pending payment")
             return Response(
                 {"error": "You already have a pending payment awaiting verification"},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
         # Check if user has an active subscription
-        active_sub = UserSubscription.objects.filter(user=request.user, end_date__gte=timezone.now().date()).first()
-        if active_sub:
+        if eligibility['active']:
             logger.error(f"PaymentCreateView - User already has active subscription")
             return Response(
                 {"error": "You already have an active subscription"},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        # Validate plan ID
-        try:
-            plan_id = request.data.get('plan')
-            logger.info(f"PaymentCreateView - Plan ID: {plan_id}")
-            
-            # Check if plan exists
-            plan = SubscriptionPlan.objects.get(id=plan_id)
-            logger.info(f"PaymentCreateView - Found plan: {plan}")
-                
-        except SubscriptionPlan.DoesNotExist:
-            logger.error(f"PaymentCreateView - Plan not found: {plan_id}")
-            return Response(
-                {"error": "Plan not found"},
-                status=status.HTTP_404_NOT_FOUND
-            )
-        except Exception as e:
-            logger.error(f"PaymentCreateView - Error validating plan: {str(e)}")
-            return Response(
-                {"error": f"Error validating plan: {str(e)}"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+
+        # The serializer reuses this plan instead of looking it up again
+        self.plan = eligibility['plan']
         
         # Proceed with the default create method
         try:
-            response = super().create(request, *args, **kwargs)
+            with transaction.atomic():
+                response = super().create(request, *args, **kwargs)
             logger.info(f"PaymentCreateView - Success: {response.data}")
             return response
+        except IntegrityError:
+            # A concurrent request created a pending payment for this user first
+            logger.error("PaymentCreateView - User already has pending payment")
+            return Response(
+                {"error": "You already have a pending payment awaiting verification"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         except Exception as e:
             logger.error(f"PaymentCreateView - Error during creation: {str(e)}")
             return Response(
@@ -212,9 +385,81 @@ class PaymentCreateView(generics.CreateAPIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['plan'] = getattr(self, 'plan', None)
+        return context
+
     def perform_create(self, serializer):
         logger.info(f"PaymentCreateView.perform_create - Validated data: {serializer.validated_data}")
         
         # Add the user to the payment
         serializer.save(user=self.request.user)
-        logger.info("PaymentCreateView.perform_create - Payment saved successfully")
\ No newline at end of file
+        logger.info("PaymentCreateView.perform_create - Payment saved successfully")
+
+
+class AnalyticsDailyStatsView(CompiledListMixin, generics.ListAPIView):
+    """Daily per-plan rollup rows between ?start= and ?end= (default: the last 30 days)"""
+    permission_classes = [IsAdminUser]
+    serializer_class = DailyPlanStatsSerializer
+    row_serializer = DAILY_STATS_ROWS
+    pagination_class = None
+
+    def get_queryset(self):
+        query = AnalyticsQuerySerializer(data=self.request.query_params)
+        query.is_valid(raise_exception=True)
+        end = query.validated_data.get('end') or timezone.now().date()
+        start = query.validated_data.get('start') or end - timedelta(days=29)
+        max_days = getattr(settings, 'ANALYTICS_MAX_DAYS', 366)
+        if (end - start).days >= max_days:
+            raise ValidationError({"error": f"Request at most {max_days} days at a time."})
+
+        stats = DailyPlanStats.objects.filter(date__range=(start, end)).order_by('date', 'plan_id')
+        if 'plan' in query.validated_data:
+            stats = stats.filter(plan_id=query.validated_data['plan'])
+        return stats
+
+
+class AnalyticsSummaryView(APIView):
+    """Monthly new/renewed/expired subscriptions, revenue, MRR and churn from the daily rollups"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        query = AnalyticsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        end = query.validated_data.get('end') or timezone.now().date()
+        # Default to the last twelve calendar months, including the current one
+        start = query.validated_data.get('start') or end.replace(day=1) - relativedelta(months=11)
+        return Response(monthly_summary(start, end, query.validated_data.get('plan')))
+
+
+class ExportView(APIView):
+    """Stream all subscriptions or payments matching the filters as CSV or NDJSON"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, kind, fmt):
+        if kind not in exports.COLUMNS or fmt not in exports.FORMATS:
+            raise NotFound()
+        query = ExportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        try:
+            queryset = exports.export_queryset(kind, **query.validated_data)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # The body is streamed after ReplicaRoutingMiddleware's replica_reads()
+        # block has ended, so pick the database (a replica if allowed) now
+        queryset = queryset.using(queryset.db)
+        response = StreamingHttpResponse(exports.stream(kind, fmt, queryset), content_type=exports.FORMATS[fmt])
+        response['Content-Disposition'] = f'attachment; filename="{kind}.{fmt}"'
+        return response
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint for the request metrics, only served to METRICS_ALLOWED_IPS"""
+    if request.META.get('REMOTE_ADDR') not in getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1', '::1']):
+        raise Http404
+    return HttpResponse(
+        metrics.render_prometheus(getattr(settings, 'METRICS_SAMPLE_RATE', 1.0), entitlements.stats()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
@@ -0,0 +1,97 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+# Users resolved from JWT claims are cached by id so authenticated reads and
+# token refreshes don't need a database query. Entries are dropped by the
+# user signal handlers in signals.py whenever a user is saved or deleted.
+
+USER_FIELDS = ('id', 'username', 'email', 'first_name', 'last_name', 'is_active', 'is_staff', 'is_superuser')
+
+
+def _key(user_id):
+    return f"auth_user:{user_id}"
+
+
+def get_cached_user(user_id):
+    """Return the user with this id built from cached fields, or None"""
+    User = get_user_model()
+    data = cache.get(_key(user_id))
+    if data is None:
+        # Cached, so read from the primary rather than a replica
+        data = User.objects.using(DEFAULT_DB_ALIAS).filter(**{api_settings.USER_ID_FIELD: user_id}).values(*USER_FIELDS).first()
+        if data is None:
+            return None
+        cache.set(_key(user_id), data, getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 300))
+    user = User(**data)
+    user._state.adding = False
+    user._state.db = 'default'
+    return user
+
+
+async def aget_cached_user(user_id):
+    """Async version of get_cached_user"""
+    User = get_user_model()
+    data = await cache.aget(_key(user_id))
+    if data is None:
+        data = await User.objects.using(DEFAULT_DB_ALIAS).filter(**{api_settings.USER_ID_FIELD: user_id}).values(*USER_FIELDS).afirst()
+        if data is None:
+            return None
+        await cache.aset(_key(user_id), data, getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 300))
+    user = User(**data)
+    user._state.adding = False
+    user._state.db = 'default'
+    return user
+
+
+def invalidate_user(user_id):
+    cache.delete(_key(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWT authentication that resolves the user through the user cache.
+
+    The user object carries no password hash and must not be saved, so use
+    this only on read-only views.
+    """
+
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            # Revocation compares against the password hash, which isn't cached
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        user = get_cached_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
+
+
+class CachedTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refresh serializer that checks the token's user through the user cache"""
+
+    def validate(self, attrs):
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            # Rotation records outstanding tokens in the database anyway
+            return super().validate(attrs)
+
+        refresh = self.token_class(attrs["refresh"])
+        user_id = refresh.payload.get(api_settings.USER_ID_CLAIM, None)
+        if user_id and not api_settings.USER_AUTHENTICATION_RULE(get_cached_user(user_id)):
+            raise AuthenticationFailed(
+                self.error_messages["no_active_account"],
+                "no_active_account",
+            )
+        return {"access": str(refresh.access_token)}
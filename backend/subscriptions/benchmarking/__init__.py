@@ -0,0 +1,4 @@
+# Benchmark tooling: in-process load drivers (drivers.py), a bulk data seeder
+# (seed.py) and the endpoint load test (load.py) used by the benchmark_asgi,
+# seed_data and load_test management commands.
+from .drivers import allow_test_host, percentile, run_asgi, run_wsgi, summarize  # noqa: F401
@@ -0,0 +1,81 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.test import AsyncClient, Client, override_settings
+
+# In-process load drivers for comparing serving modes. Requests go through
+# the full WSGI or ASGI handler (middleware, URL routing, views, database)
+# without a network server in between, so results are reproducible locally.
+
+
+def allow_test_host():
+    """The test clients send Host: testserver; let it through for a run"""
+    return override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'])
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    """Throughput and latency percentiles (in milliseconds) for one run"""
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def run_wsgi(paths, total, concurrency, headers=None):
+    """Send `total` GETs round-robin over `paths` from `concurrency` threads.
+
+    Like a threaded WSGI server, every thread blocks on its own database
+    connection while a query runs.
+    """
+    local = threading.local()
+
+    def request(i):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = Client()
+        started = time.perf_counter()
+        response = client.get(paths[i % len(paths)], headers=headers)
+        return time.perf_counter() - started, response.status_code >= 400
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(request, range(total)))
+    elapsed = time.perf_counter() - started
+    return summarize([latency for latency, _ in results], sum(failed for _, failed in results), elapsed)
+
+
+def run_asgi(paths, total, concurrency, headers=None):
+    """Send `total` GETs with up to `concurrency` in flight on one event loop"""
+
+    async def main():
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def request(i):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(paths[i % len(paths)], headers=headers)
+                return time.perf_counter() - started, response.status_code >= 400
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(request(i) for i in range(total)))
+        return results, time.perf_counter() - started
+
+    results, elapsed = asyncio.run(main())
+    return summarize([latency for latency, _ in results], sum(failed for _, failed in results), elapsed)
@@ -0,0 +1,184 @@
+import io
+import json
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import resolve, reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .. import metrics
+from ..models import CurrentSubscription, SubscriptionPlan, UserSubscription
+from .drivers import allow_test_host, summarize
+
+# Endpoint load test. Every URL in subscriptions/urls.py plus the token
+# endpoints is called `requests` times from `concurrency` threads through
+# the in-process WSGI handler, as a dedicated load-test user (or staff user
+# for the staff endpoints). Per endpoint it reports latency percentiles,
+# throughput, status codes and SQL queries per request (from the request
+# metrics), as JSON that can be diffed between commits. Write endpoints run
+# too, mostly taking their validation paths once the user is subscribed.
+
+LOADTEST_USERNAME = 'loadtest'
+LOADTEST_ADMIN_USERNAME = 'loadtest-admin'
+LOADTEST_PASSWORD = 'loadtest-password'
+
+Scenario = namedtuple(
+    'Scenario', 'name url_name method args params body auth multipart',
+    defaults=('GET', None, None, None, None, False),
+)
+
+
+def _proof(fixture):
+    image = io.BytesIO()
+    Image.new('RGB', (8, 8)).save(image, 'PNG')
+    return {
+        'plan': fixture['plan'].pk,
+        'payment_proof': SimpleUploadedFile('proof.png', image.getvalue(), content_type='image/png'),
+    }
+
+
+SCENARIOS = [
+    Scenario('plans', 'plan-list-create'),
+    Scenario('plan', 'plan-retrieve-update-destroy', args=lambda fx: [fx['plan'].pk]),
+    Scenario('subscriptions', 'subscription-list-create', auth='user'),
+    Scenario('subscription', 'subscription-retrieve-update-destroy', args=lambda fx: [fx['subscription'].pk], auth='user'),
+    Scenario(
+        'subscriptions-batch', 'subscription-batch-create', 'POST',
+        body=lambda fx: [{'user': fx['user'].pk, 'plan': fx['plan'].pk}], auth='admin',
+    ),
+    Scenario('user-subscriptions', 'user-subscriptions', args=lambda fx: [fx['user'].pk], auth='user'),
+    Scenario('user-current-subscription', 'user-current-subscription', args=lambda fx: [fx['user'].pk], auth='user'),
+    Scenario('renew', 'renew-subscription', 'POST', auth='user'),
+    Scenario('purchase', 'purchase-subscription', 'POST', body=lambda fx: {'plan_id': fx['plan'].pk}, auth='user'),
+    Scenario('user', 'user-detail', auth='user'),
+    Scenario('payments', 'payment-list', auth='user'),
+    Scenario('payment-upload', 'payment-list', 'POST', body=_proof, auth='user', multipart=True),
+    Scenario('analytics-daily', 'analytics-daily', auth='admin'),
+    Scenario('analytics-summary', 'analytics-summary', auth='admin'),
+    Scenario(
+        'export', 'export', args=lambda fx: ['subscriptions', 'ndjson'],
+        params=lambda fx: {'start': fx['today']}, auth='admin',
+    ),
+    Scenario('metrics', 'metrics'),
+    Scenario('async-plans', 'async-plan-list'),
+    Scenario('async-plan', 'async-plan-detail', args=lambda fx: [fx['plan'].pk]),
+    Scenario('async-user', 'async-user-detail', auth='user'),
+    Scenario('async-user-subscriptions', 'async-user-subscriptions', args=lambda fx: [fx['user'].pk], auth='user'),
+    Scenario(
+        'async-user-current-subscription', 'async-user-current-subscription',
+        args=lambda fx: [fx['user'].pk], auth='user',
+    ),
+    Scenario(
+        'token', 'token_obtain_pair', 'POST',
+        body=lambda fx: {'username': LOADTEST_USERNAME, 'password': LOADTEST_PASSWORD},
+    ),
+    Scenario('token-refresh', 'token_refresh', 'POST', body=lambda fx: {'refresh': fx['refresh']}),
+]
+
+
+def _loadtest_user(username, is_staff):
+    user, created = get_user_model().objects.get_or_create(username=username, defaults={'is_staff': is_staff})
+    if created or not user.check_password(LOADTEST_PASSWORD):
+        user.set_password(LOADTEST_PASSWORD)
+        user.save()
+    return user
+
+
+def prepare_fixture():
+    """Get or create the load-test users, a plan and a live subscription for the user"""
+    today = timezone.now().date()
+    user = _loadtest_user(LOADTEST_USERNAME, False)
+    admin = _loadtest_user(LOADTEST_ADMIN_USERNAME, True)
+    plan = SubscriptionPlan.objects.filter(active=True).order_by('pk').first()
+    if plan is None:
+        plan = SubscriptionPlan.objects.create(name='Load test plan', price=100, duration_months=1)
+    current = CurrentSubscription.objects.select_related('subscription').filter(user=user).first()
+    if current is None or current.subscription.end_date < today:
+        subscription = UserSubscription.objects.create(user=user, plan=plan, start_date=today)
+    else:
+        subscription = current.subscription
+    return {
+        'today': today.isoformat(),
+        'user': user,
+        'plan': plan,
+        'subscription': subscription,
+        'refresh': str(RefreshToken.for_user(user)),
+        'headers': {
+            'user': {'Authorization': f"Bearer {AccessToken.for_user(user)}"},
+            'admin': {'Authorization': f"Bearer {AccessToken.for_user(admin)}"},
+        },
+    }
+
+
+def run_scenario(scenario, fixture, requests, concurrency):
+    path = reverse(scenario.url_name, args=scenario.args(fixture) if scenario.args else None)
+    view = resolve(path).view_name
+    params = scenario.params(fixture) if scenario.params else None
+    headers = fixture['headers'].get(scenario.auth)
+    local = threading.local()
+
+    def request(_):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = Client()
+        started = time.perf_counter()
+        if scenario.method == 'GET':
+            response = client.get(path, params, headers=headers)
+        elif scenario.multipart:
+            response = client.post(path, scenario.body(fixture), headers=headers)
+        else:
+            body = json.dumps(scenario.body(fixture)) if scenario.body else ''
+            response = client.post(path, body, content_type='application/json', headers=headers)
+        if response.streaming:
+            # Time the whole body, not just the first chunk
+            b''.join(response.streaming_content)
+        return time.perf_counter() - started, response.status_code
+
+    before = metrics.snapshot().get(view, {'count': 0, 'queries': 0})
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(request, range(requests)))
+    elapsed = time.perf_counter() - started
+    after = metrics.snapshot().get(view, {'count': 0, 'queries': 0})
+
+    measured = after['count'] - before['count']
+    statuses = Counter(status_code for _, status_code in results)
+    return {
+        'method': scenario.method,
+        'path': path,
+        **summarize(
+            [latency for latency, _ in results],
+            sum(count for status_code, count in statuses.items() if status_code >= 500),
+            elapsed,
+        ),
+        'status_codes': {str(status_code): count for status_code, count in sorted(statuses.items())},
+        'queries_per_request': round((after['queries'] - before['queries']) / measured, 2) if measured else None,
+    }
+
+
+def run_load(requests=200, concurrency=10, only=None, on_result=None):
+    """Run the scenarios (or the ones named in `only`) and return the report dict"""
+    fixture = prepare_fixture()
+    endpoints = {}
+    settings_override = override_settings(METRICS_ENABLED=True, METRICS_SAMPLE_RATE=1.0, METRICS_SERVER_TIMING=False)
+    with allow_test_host(), settings_override:
+        for scenario in SCENARIOS:
+            if only and scenario.name not in only:
+                continue
+            endpoints[scenario.name] = run_scenario(scenario, fixture, requests, concurrency)
+            if on_result:
+                on_result(scenario.name, endpoints[scenario.name])
+    return {
+        'database': connection.vendor,
+        'requests_per_endpoint': requests,
+        'concurrency': concurrency,
+        'endpoints': endpoints,
+    }
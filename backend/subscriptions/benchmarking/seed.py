@@ -0,0 +1,120 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from .. import analytics
+from ..models import Payment, SubscriptionPlan, UserSubscription
+from ..services import after_bulk_write
+
+# Bulk seeder for benchmark data. Every user gets a run of back-to-back
+# subscriptions starting somewhere in the last `history_days`, each with a
+# verified payment; the one covering today is ACTIVE and the rest EXPIRED.
+# Some users without a live subscription also get a payment awaiting
+# verification. The output is the same for the same arguments and seed.
+
+DURATIONS = (1, 3, 6, 12)
+
+
+def seed_plans(count):
+    """Get or create `count` plans with a mix of durations and prices"""
+    plans = []
+    for index in range(count):
+        months = DURATIONS[index % len(DURATIONS)]
+        plan, _ = SubscriptionPlan.objects.get_or_create(
+            name=f"Seed plan {index + 1}",
+            defaults={'price': Decimal(100 + 25 * (index // len(DURATIONS))) * months, 'duration_months': months},
+        )
+        plans.append(plan)
+    return plans
+
+
+def _history(rng, plans, today, history_days, max_subscriptions, end_dates):
+    """(plan, start_date, end_date, status) for one user's subscriptions, oldest first"""
+    plan = rng.choice(plans)
+    start_date = today - timedelta(days=rng.randint(0, history_days))
+    history = []
+    for _ in range(rng.randint(1, max_subscriptions)):
+        if start_date > today:
+            break
+        if rng.random() < 0.2:
+            plan = rng.choice(plans)
+        key = (start_date, plan.duration_months)
+        if key not in end_dates:
+            end_dates[key] = start_date + relativedelta(months=plan.duration_months)
+        end_date = end_dates[key]
+        history.append((plan, start_date, end_date, 'ACTIVE' if end_date >= today else 'EXPIRED'))
+        start_date = end_date + timedelta(days=1)
+    return history
+
+
+def seed(users, plans=20, max_subscriptions=4, pending_ratio=0.05, history_days=3 * 365,
+         batch_size=5000, prefix='seed', rng_seed=42, on_batch=None):
+    """Create `users` users with their subscriptions and payments in batches.
+
+    Each batch is one transaction of three bulk inserts. Usernames are
+    ``<prefix>-<n>`` and continue after the users an earlier run created.
+    ``on_batch`` is called with the running totals after every batch.
+    """
+    User = get_user_model()
+    rng = random.Random(rng_seed)
+    today = timezone.now().date()
+    plan_objects = seed_plans(plans)
+    password = make_password(None)
+    end_dates = {}
+    first = User.objects.filter(username__startswith=f"{prefix}-").count()
+    totals = {'users': 0, 'subscriptions': 0, 'payments': 0}
+    started = time.monotonic()
+
+    for offset in range(0, users, batch_size):
+        numbers = range(first + offset, first + min(offset + batch_size, users))
+        with transaction.atomic():
+            created_users = User.objects.bulk_create([
+                User(username=f"{prefix}-{n}", email=f"{prefix}-{n}@example.com", password=password)
+                for n in numbers
+            ])
+            subscriptions = []
+            pending = []
+            for user in created_users:
+                history = _history(rng, plan_objects, today, history_days, max_subscriptions, end_dates)
+                subscriptions += [
+                    UserSubscription(user=user, plan=plan, start_date=start_date, end_date=end_date, status=status)
+                    for plan, start_date, end_date, status in history
+                ]
+                if history[-1][3] != 'ACTIVE' and rng.random() < pending_ratio:
+                    pending.append(Payment(
+                        user=user, plan=rng.choice(plan_objects), payment_proof='payment_proofs/seed.png',
+                    ))
+            UserSubscription.objects.bulk_create(subscriptions)
+            payments = [
+                Payment(
+                    user_id=subscription.user_id, plan=subscription.plan, subscription=subscription,
+                    payment_proof='payment_proofs/seed.png', is_verified=True,
+                )
+                for subscription in subscriptions
+            ] + pending
+            Payment.objects.bulk_create(payments)
+            after_bulk_write([user.pk for user in created_users])
+
+        totals['users'] += len(created_users)
+        totals['subscriptions'] += len(subscriptions)
+        totals['payments'] += len(payments)
+        if on_batch:
+            on_batch(dict(totals))
+
+    if totals['subscriptions']:
+        # Let the next rollup_daily_stats run cover the seeded history
+        analytics.mark_days_dirty(analytics.date_range(today - timedelta(days=history_days), today))
+    elapsed = time.monotonic() - started
+    rows = sum(totals.values())
+    return {
+        **totals,
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(rows / elapsed, 1) if elapsed else float(rows),
+    }
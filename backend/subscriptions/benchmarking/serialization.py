@@ -0,0 +1,73 @@
+import statistics
+import time
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from ..api.compiled import PAYMENT_ROWS, SUBSCRIPTION_ROWS
+from ..api.renderers import FastJSONRenderer, orjson
+from ..api.serializers import PaymentSerializer, UserSubscriptionSerializer
+from ..models import Payment, UserSubscription
+from .drivers import allow_test_host
+
+# CPU cost of building a list response body: the ModelSerializer path
+# (instances + serializer .data + JSONRenderer) against the compiled path
+# (.values() rows + RowSerializer + FastJSONRenderer), per stage, in CPU
+# milliseconds per 1,000 rows. Uses the first `rows` rows in the database,
+# so seed some first (seed_data).
+
+KINDS = {
+    'subscriptions': (
+        lambda: UserSubscription.objects.select_related('plan').order_by('-id'),
+        UserSubscriptionSerializer, SUBSCRIPTION_ROWS,
+    ),
+    'payments': (lambda: Payment.objects.order_by('-id'), PaymentSerializer, PAYMENT_ROWS),
+}
+
+
+def _cpu(fn):
+    started = time.process_time()
+    result = fn()
+    return result, time.process_time() - started
+
+
+def _measure(stages, repeat, rows):
+    """Median CPU ms per 1,000 rows for each (name, fn) stage; each fn gets the previous result"""
+    timings = {name: [] for name, _ in stages}
+    for _ in range(repeat):
+        result = None
+        for name, fn in stages:
+            result, seconds = _cpu(lambda: fn(result))
+            timings[name].append(seconds)
+    report = {name: round(statistics.median(values) * 1000 * 1000 / rows, 3) for name, values in timings.items()}
+    report['total'] = round(sum(report.values()), 3)
+    return report, result
+
+
+def benchmark_serialization(kind='subscriptions', rows=1000, repeat=10):
+    queryset, serializer_class, row_serializer = KINDS[kind]
+    count = queryset()[:rows].count()
+    if not count:
+        raise ValueError(f"No {kind} to serialize; seed some data first.")
+    context = {'request': APIRequestFactory().get('/')}
+
+    with allow_test_host():
+        drf, drf_body = _measure([
+            ('fetch', lambda _: list(queryset()[:rows])),
+            ('serialize', lambda instances: serializer_class(instances, many=True, context=context).data),
+            ('render', lambda data: JSONRenderer().render(data)),
+        ], repeat, count)
+        compiled, compiled_body = _measure([
+            ('fetch', lambda _: list(queryset().values(*row_serializer.columns)[:rows])),
+            ('serialize', lambda values: row_serializer.serialize(values, context)),
+            ('render', lambda data: FastJSONRenderer().render(data)),
+        ], repeat, count)
+    return {
+        'kind': kind,
+        'rows': count,
+        'repeat': repeat,
+        'orjson': orjson is not None,
+        'cpu_ms_per_1000_rows': {'modelserializer': drf, 'compiled': compiled},
+        'speedup': round(drf['total'] / compiled['total'], 2) if compiled['total'] else None,
+        'identical': drf_body == compiled_body,
+    }
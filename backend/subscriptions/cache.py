@@ -0,0 +1,96 @@
+import threading
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+from .models import CurrentSubscription, Payment
+
+# Per-user entitlement cache used by the purchase/payment pre-checks.
+# Entries hold the user's current plan, its end_date and whether a payment is
+# awaiting verification; they are dropped by the signal handlers in signals.py
+# whenever a subscription or payment for the user changes.
+
+KEY_PREFIX = 'entitlement'
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def _cache():
+    return caches[getattr(settings, 'ENTITLEMENT_CACHE_ALIAS', 'default')]
+
+
+def _key(user_id):
+    return f"{KEY_PREFIX}:{user_id}"
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _timeout(entry):
+    """Never let an entry outlive the end_date it was computed for"""
+    timeout = getattr(settings, 'ENTITLEMENT_CACHE_TIMEOUT', 300)
+    if entry['end_date']:
+        expires_at = datetime.combine(entry['end_date'] + timedelta(days=1), time.min, tzinfo=dt_timezone.utc)
+        remaining = int((expires_at - timezone.now()).total_seconds())
+        timeout = max(0, min(timeout, remaining))
+    return timeout
+
+
+def _load(user_id):
+    # Cached, so read from the primary rather than a replica
+    today = timezone.now().date()
+    current = (
+        CurrentSubscription.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id, subscription__end_date__gte=today)
+        .values('subscription__plan_id', 'subscription__end_date')
+        .first()
+    )
+    return {
+        'plan_id': current['subscription__plan_id'] if current else None,
+        'end_date': current['subscription__end_date'] if current else None,
+        'pending_payment': Payment.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id, is_verified=False).exists(),
+    }
+
+
+def get_entitlement(user_id):
+    """Return the user's entitlement, reading through the cache"""
+    cache = _cache()
+    entry = cache.get(_key(user_id))
+    if entry is None:
+        _count('misses')
+        entry = _load(user_id)
+        timeout = _timeout(entry)
+        if timeout:
+            cache.set(_key(user_id), entry, timeout)
+    else:
+        _count('hits')
+    return {
+        **entry,
+        'active': bool(entry['end_date'] and entry['end_date'] >= timezone.now().date()),
+    }
+
+
+def invalidate(user_id):
+    _cache().delete(_key(user_id))
+
+
+def invalidate_many(user_ids):
+    """Drop entries for rows changed by bulk operations, which send no signals"""
+    _cache().delete_many([_key(user_id) for user_id in user_ids])
+
+
+def stats():
+    """Hit and miss counters for this process"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_stats():
+    with _stats_lock:
+        for name in _stats:
+            _stats[name] = 0
@@ -0,0 +1,92 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.http import parse_etags
+
+from .models import SubscriptionPlan
+
+# Versioned plan catalog. The version is a hash of the serialized plans, so
+# every process that loads the same plans agrees on it (and on the ETag).
+# It is cached for at most PLAN_CATALOG_VERSION_TTL seconds and dropped
+# whenever a SubscriptionPlan is saved or deleted (see signals.py); the next
+# read rebuilds it from the database. With a shared cache other processes
+# see a change at once, with a per-process one (LocMemCache) within the TTL.
+# Each process keeps one serialized copy of the catalog for the current
+# version, so plan reads only hit the database when the version is rebuilt.
+
+VERSION_KEY = 'plan_catalog:version'
+
+# (version, plans, plans_by_id) for the most recently loaded version
+_snapshot = None
+
+
+def _version_ttl():
+    return getattr(settings, 'PLAN_CATALOG_VERSION_TTL', 30)
+
+
+def _plans():
+    # Kept until the next version, so never load it from a lagging replica
+    return SubscriptionPlan.objects.using(DEFAULT_DB_ALIAS)
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # First read, expired or bumped: derive it from the plans themselves
+        version = _store(_plans())[0]
+        cache.set(VERSION_KEY, version, _version_ttl())
+    return version
+
+
+async def aget_version():
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        version = _store([plan async for plan in _plans()])[0]
+        await cache.aset(VERSION_KEY, version, _version_ttl())
+    return version
+
+
+def bump_version():
+    cache.delete(VERSION_KEY)
+
+
+def etag(version):
+    return f'"plans-{version}"'
+
+
+def etag_matches(request, version):
+    """True if the request's If-None-Match already names this version"""
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return '*' in etags or etag(version) in etags or f'W/{etag(version)}' in etags
+
+
+def _store(plan_objects):
+    global _snapshot
+    from .api.serializers import SubscriptionPlanSerializer
+
+    plans = [dict(plan) for plan in SubscriptionPlanSerializer(plan_objects, many=True).data]
+    version = hashlib.sha256(json.dumps(plans, sort_keys=True, default=str).encode()).hexdigest()[:32]
+    _snapshot = (version, plans, {plan['id']: plan for plan in plans})
+    return _snapshot
+
+
+def get_plans(version):
+    """Return (plans, plans_by_id) as serialized dicts for the given version"""
+    snapshot = _snapshot
+    if snapshot is None or snapshot[0] != version:
+        snapshot = _store(_plans())
+    return snapshot[1], snapshot[2]
+
+
+async def aget_plans(version):
+    """Async version of get_plans"""
+    snapshot = _snapshot
+    if snapshot is None or snapshot[0] != version:
+        snapshot = _store([plan async for plan in _plans()])
+    return snapshot[1], snapshot[2]
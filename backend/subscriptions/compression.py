@@ -0,0 +1,105 @@
+import time
+import zlib
+
+try:
+    import brotli
+except ImportError:  # optional; without it responses are only gzipped
+    brotli = None
+
+# Response compression for CompressionMiddleware (see middleware.py): content
+# negotiation from Accept-Encoding and incremental gzip/brotli compressors.
+# CPU time is measured with time.thread_time(), so time spent by other
+# threads while this one waits doesn't count.
+
+
+class GzipCompressor:
+    def __init__(self, level):
+        # wbits=31: deflate with a gzip header and trailer
+        self._zlib = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._zlib.compress(data)
+
+    def flush(self):
+        return self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._zlib.flush()
+
+
+class BrotliCompressor:
+    def __init__(self, quality):
+        self._brotli = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._brotli.process(data)
+
+    def flush(self):
+        return self._brotli.flush()
+
+    def finish(self):
+        return self._brotli.finish()
+
+
+def available_encodings():
+    """Encodings we can produce, most preferred first"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate(accept_encoding, available):
+    """The encoding in `available` the client prefers (ties go to the earlier one), or None"""
+    accepted = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding.strip():
+            accepted[coding.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for coding in available:
+        quality = accepted.get(coding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def compressor(encoding, gzip_level=6, brotli_quality=4):
+    if encoding == 'br':
+        return BrotliCompressor(brotli_quality)
+    return GzipCompressor(gzip_level)
+
+
+def compress(data, compressor):
+    """(compressed data, CPU seconds) for a whole body"""
+    started = time.thread_time()
+    compressed = compressor.compress(data) + compressor.finish()
+    return compressed, time.thread_time() - started
+
+
+def compress_stream(chunks, compressor, on_finish=None):
+    """Compress a streaming body chunk by chunk, flushing after each chunk so
+    the client keeps receiving data. ``on_finish(bytes_in, bytes_out, cpu_seconds)``
+    is called once the whole body has been sent."""
+    bytes_in = bytes_out = 0
+    cpu_seconds = 0.0
+    for chunk in chunks:
+        started = time.thread_time()
+        data = compressor.compress(chunk) + compressor.flush()
+        cpu_seconds += time.thread_time() - started
+        bytes_in += len(chunk)
+        bytes_out += len(data)
+        if data:
+            yield data
+    started = time.thread_time()
+    data = compressor.finish()
+    cpu_seconds += time.thread_time() - started
+    bytes_out += len(data)
+    yield data
+    if on_finish:
+        on_finish(bytes_in, bytes_out, cpu_seconds)
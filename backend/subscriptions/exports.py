@@ -0,0 +1,117 @@
+import csv
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Payment, UserSubscription
+
+# Streaming exports of subscriptions and payments. Rows are read with
+# .values_list().iterator(), which uses a server-side cursor on PostgreSQL,
+# and are rendered a chunk at a time, so memory stays flat however many rows
+# are exported. Used by the export endpoints and `manage.py export_data`.
+
+COLUMNS = {
+    'subscriptions': [
+        ('id', 'id'),
+        ('user_id', 'user_id'),
+        ('username', 'user__username'),
+        ('email', 'user__email'),
+        ('plan_id', 'plan_id'),
+        ('plan_name', 'plan__name'),
+        ('plan_price', 'plan__price'),
+        ('start_date', 'start_date'),
+        ('end_date', 'end_date'),
+        ('status', 'status'),
+        ('auto_renew', 'auto_renew'),
+        ('renewed_from_id', 'renewed_from_id'),
+    ],
+    'payments': [
+        ('id', 'id'),
+        ('user_id', 'user_id'),
+        ('username', 'user__username'),
+        ('email', 'user__email'),
+        ('plan_id', 'plan_id'),
+        ('plan_name', 'plan__name'),
+        ('plan_price', 'plan__price'),
+        ('subscription_id', 'subscription_id'),
+        ('subscription_start_date', 'subscription__start_date'),
+        ('is_verified', 'is_verified'),
+        ('created_at', 'created_at'),
+        ('payment_proof', 'payment_proof'),
+        ('proof_sha256', 'proof_sha256'),
+        ('proof_size', 'proof_size'),
+    ],
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+PAYMENT_STATUSES = {'verified': True, 'pending': False}
+
+
+def export_queryset(kind, start=None, end=None, plan=None, status=None):
+    """Rows to export as tuples in COLUMNS order, oldest first.
+
+    Subscriptions are filtered by start_date and payments by creation date.
+    ``status`` is a subscription status, or 'verified'/'pending' for payments.
+    Raises ValueError for an unknown kind or status.
+    """
+    if kind == 'subscriptions':
+        queryset, date_field = UserSubscription.objects.all(), 'start_date'
+        if status is not None:
+            if status not in dict(UserSubscription.STATUS_CHOICES):
+                raise ValueError(f"Unknown subscription status: {status}")
+            queryset = queryset.filter(status=status)
+    elif kind == 'payments':
+        queryset, date_field = Payment.objects.all(), 'created_at__date'
+        if status is not None:
+            if status not in PAYMENT_STATUSES:
+                raise ValueError(f"Unknown payment status: {status} (use 'verified' or 'pending')")
+            queryset = queryset.filter(is_verified=PAYMENT_STATUSES[status])
+    else:
+        raise ValueError(f"Unknown export: {kind}")
+
+    if start:
+        queryset = queryset.filter(**{f"{date_field}__gte": start})
+    if end:
+        queryset = queryset.filter(**{f"{date_field}__lte": end})
+    if plan:
+        queryset = queryset.filter(plan_id=plan)
+    return queryset.order_by('pk').values_list(*(field for _, field in COLUMNS[kind]))
+
+
+class _Echo:
+    """File-like object for csv.writer that hands back what it is given"""
+
+    def write(self, value):
+        return value
+
+
+def _chunks(queryset, chunk_size):
+    rows = []
+    for row in queryset.iterator(chunk_size=chunk_size):
+        rows.append(row)
+        if len(rows) == chunk_size:
+            yield rows
+            rows = []
+    if rows:
+        yield rows
+
+
+def stream(kind, fmt, queryset, chunk_size=None):
+    """Yield the export as text, one chunk of rows at a time"""
+    chunk_size = chunk_size or getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    header = [name for name, _ in COLUMNS[kind]]
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(header)
+        for rows in _chunks(queryset, chunk_size):
+            yield ''.join(writer.writerow(row) for row in rows)
+    elif fmt == 'ndjson':
+        encoder = DjangoJSONEncoder()
+        for rows in _chunks(queryset, chunk_size):
+            yield ''.join(encoder.encode(dict(zip(header, row))) + '\n' for row in rows)
+    else:
+        raise ValueError(f"Unknown format: {fmt}")
@@ -0,0 +1,103 @@
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyRecord
+
+HEADER = 'Idempotency-Key'
+
+
+def record_key(user_id, path, key):
+    return hashlib.sha256(f"{user_id}:{path}:{key}".encode()).hexdigest()
+
+
+class _FingerprintEncoder(JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, UploadedFile):
+            # Uploads count by content, hashed in chunks like the proof storage does
+            digest = hashlib.sha256()
+            for chunk in obj.chunks():
+                digest.update(chunk)
+            obj.seek(0)
+            return f"file:{digest.hexdigest()}"
+        return super().default(obj)
+
+
+def request_hash(request):
+    """SHA-256 of the parsed request payload, uploaded files included"""
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    return hashlib.sha256(json.dumps(data, sort_keys=True, cls=_FingerprintEncoder).encode()).hexdigest()
+
+
+def mismatch():
+    return Response(
+        {"error": f"This {HEADER} was already used with a different request."},
+        status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+    )
+
+
+def replay(record):
+    response = Response(json.loads(record.body) if record.body else None, status=record.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(handler):
+    """Answer retried POSTs carrying the same Idempotency-Key with the first response.
+
+    Replays are a single primary key lookup. A first request holds a lock on
+    its record until its response is stored, so concurrent duplicates wait
+    for it and then replay it. Server errors are not stored, so those
+    requests can be retried. Reusing a key with a different payload gets a
+    422 instead of the stored response.
+    """
+    @wraps(handler)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return handler(self, request, *args, **kwargs)
+        if len(key) > 255:
+            return Response({"error": f"{HEADER} must be at most 255 characters."}, status=status.HTTP_400_BAD_REQUEST)
+
+        now = timezone.now()
+        pk = record_key(request.user.pk, request.path, key)
+        fingerprint = request_hash(request)
+        record = IdempotencyRecord.objects.filter(pk=pk, expires_at__gt=now, status_code__isnull=False).first()
+        if record:
+            if record.request_hash and record.request_hash != fingerprint:
+                return mismatch()
+            return replay(record)
+
+        ttl = timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+        with transaction.atomic():
+            record, created = IdempotencyRecord.objects.select_for_update().get_or_create(
+                pk=pk, defaults={'expires_at': now + ttl, 'request_hash': fingerprint}
+            )
+            if not created and record.status_code is not None and record.expires_at > now:
+                # A concurrent duplicate finished while we waited for the lock
+                if record.request_hash and record.request_hash != fingerprint:
+                    return mismatch()
+                return replay(record)
+
+            response = handler(self, request, *args, **kwargs)
+            if response.status_code >= 500:
+                record.delete()
+            else:
+                record.request_hash = fingerprint
+                record.status_code = response.status_code
+                record.body = json.dumps(response.data, cls=JSONEncoder) if response.data is not None else ''
+                record.expires_at = now + ttl
+                record.save()
+        return response
+    return wrapper
@@ -0,0 +1,36 @@
+import os
+
+from PIL import Image, ImageOps
+
+# Pillow work for payment proofs. This module must not import Django: its
+# functions run in worker processes of the proof pipeline (proof_pipeline.py).
+
+
+def _save_jpeg(image, path, quality):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.part"
+    # No exif= argument, so the metadata of the original is not carried over
+    image.save(tmp_path, 'JPEG', quality=quality, optimize=True)
+    os.replace(tmp_path, path)
+
+
+def render_proof_variants(source_path, thumbnail_path, review_path, thumbnail_size, review_size, quality):
+    """Check an uploaded proof and write its thumbnail and review copy.
+
+    Both outputs are re-encoded JPEGs without EXIF data, rotated according
+    to the original's orientation tag. Returns None on success or an error
+    message if the file is not a readable image.
+    """
+    try:
+        with Image.open(source_path) as image:
+            image.verify()
+        with Image.open(source_path) as image:
+            image = ImageOps.exif_transpose(image).convert('RGB')
+            review = image.copy()
+            review.thumbnail(review_size)
+            _save_jpeg(review, review_path, quality)
+            image.thumbnail(thumbnail_size)
+            _save_jpeg(image, thumbnail_path, quality)
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+        return f"Invalid image: {e}"
+    return None
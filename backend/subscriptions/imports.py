@@ -0,0 +1,450 @@
+import csv
+import io
+import itertools
+import json
+import time
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from dateutil.relativedelta import relativedelta
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import analytics, cache
+from .models import ImportCheckpoint, Payment, SubscriptionPlan, UserSubscription
+from .services import after_bulk_write
+
+# Bulk loading of plans, users, subscriptions and payments from CSV or NDJSON,
+# e.g. when migrating from another billing system. Records are read as a
+# stream and handled in batches: each batch is validated with a few lookup
+# queries, foreign keys are resolved from in-memory maps (plans by name, users
+# by username) and the valid rows go in with one bulk_create, or COPY on
+# PostgreSQL. Invalid records are reported and skipped. The column names match
+# the exports in exports.py, so an export can be loaded back; ids are not kept,
+# rows refer to each other by plan_name, username and (for payments)
+# subscription_start_date.
+
+KINDS = ('plans', 'users', 'subscriptions', 'payments')
+
+
+class RecordError(ValueError):
+    pass
+
+
+def read_records(stream, fmt):
+    """Yield dicts from a CSV (with a header row) or NDJSON text stream.
+
+    An NDJSON line that isn't valid JSON is yielded as a RecordError, so it is
+    reported and skipped like any other invalid record.
+    """
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+    elif fmt == 'ndjson':
+        for line in stream:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    yield RecordError(f"Invalid JSON: {e}")
+    else:
+        raise ValueError(f"Unknown format: {fmt}")
+
+
+def _value(record, key, required=False):
+    value = record.get(key)
+    if isinstance(value, str):
+        value = value.strip()
+    if value in (None, ''):
+        if required:
+            raise RecordError(f"{key} is required")
+        return None
+    return value
+
+
+def _text(record, key, required=False):
+    value = _value(record, key, required)
+    return '' if value is None else str(value)
+
+
+def _int(record, key, required=False):
+    value = _value(record, key, required)
+    try:
+        return None if value is None else int(value)
+    except (TypeError, ValueError):
+        raise RecordError(f"{key} must be a whole number")
+
+
+def _decimal(record, key, required=False):
+    value = _value(record, key, required)
+    try:
+        return None if value is None else Decimal(str(value))
+    except InvalidOperation:
+        raise RecordError(f"{key} must be a number")
+
+
+def _bool(record, key, default):
+    value = _value(record, key)
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    if str(value).lower() in ('1', 'true', 't', 'yes'):
+        return True
+    if str(value).lower() in ('0', 'false', 'f', 'no'):
+        return False
+    raise RecordError(f"{key} must be true or false")
+
+
+def _date(record, key, required=False):
+    value = _value(record, key, required)
+    try:
+        return None if value is None else date.fromisoformat(str(value))
+    except ValueError:
+        raise RecordError(f"{key} must be a YYYY-MM-DD date")
+
+
+def _datetime(record, key):
+    value = _value(record, key)
+    if value is None:
+        return None
+    parsed = parse_datetime(str(value))
+    if parsed is None:
+        raise RecordError(f"{key} must be an ISO 8601 date and time")
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+
+
+def _parse(batch, parse):
+    """Run `parse` over (number, record) pairs, splitting results from errors"""
+    parsed, errors = [], []
+    for number, record in batch:
+        try:
+            if isinstance(record, RecordError):
+                raise record
+            if not isinstance(record, dict):
+                raise RecordError("Record must be an object")
+            parsed.append((number, parse(record)))
+        except RecordError as e:
+            errors.append((number, str(e)))
+    return parsed, errors
+
+
+def _plans(context):
+    # Plans are few, so one map for the whole run: name -> (id, duration_months)
+    if 'plans' not in context:
+        context['plans'] = {
+            name: (pk, months)
+            for pk, name, months in SubscriptionPlan.objects.values_list('pk', 'name', 'duration_months')
+        }
+    return context['plans']
+
+
+def _users(usernames):
+    return dict(get_user_model().objects.filter(username__in=usernames).values_list('username', 'pk'))
+
+
+def _prepare_plans(batch, context):
+    parsed, errors = _parse(batch, lambda record: SubscriptionPlan(
+        name=_text(record, 'name', required=True),
+        price=_decimal(record, 'price', required=True),
+        duration_months=_int(record, 'duration_months', required=True),
+        active=_bool(record, 'active', True),
+    ))
+    existing = set(_plans(context))
+    plans = []
+    for number, plan in parsed:
+        if plan.duration_months <= 0:
+            errors.append((number, "duration_months must be positive"))
+        elif plan.name in existing:
+            errors.append((number, f"Plan {plan.name!r} already exists"))
+        else:
+            existing.add(plan.name)
+            plans.append(plan)
+    return plans, errors
+
+
+def _after_plans(plans, context):
+    # Reload the name map (COPY doesn't return ids)
+    context.pop('plans', None)
+
+
+def _prepare_users(batch, context):
+    User = get_user_model()
+    # Users without a password hash get an unusable one, generated once per batch
+    unusable_password = make_password(None)
+
+    def parse(record):
+        password = _text(record, 'password')
+        return User(
+            username=_text(record, 'username', required=True),
+            email=_text(record, 'email'),
+            first_name=_text(record, 'first_name'),
+            last_name=_text(record, 'last_name'),
+            is_active=_bool(record, 'is_active', True),
+            date_joined=_datetime(record, 'date_joined') or timezone.now(),
+            # Only already-encoded hashes are accepted; hashing here would cap throughput
+            password=password or unusable_password,
+        )
+
+    parsed, errors = _parse(batch, parse)
+    existing = set(_users([user.username for _, user in parsed]))
+    users = []
+    for number, user in parsed:
+        if user.username in existing:
+            errors.append((number, f"User {user.username!r} already exists"))
+        else:
+            existing.add(user.username)
+            users.append(user)
+    return users, errors
+
+
+def _prepare_subscriptions(batch, context):
+    parsed, errors = _parse(batch, lambda record: {
+        'username': _text(record, 'username', required=True),
+        'plan_name': _text(record, 'plan_name', required=True),
+        'start_date': _date(record, 'start_date', required=True),
+        'end_date': _date(record, 'end_date'),
+        'status': _text(record, 'status'),
+        'auto_renew': _bool(record, 'auto_renew', False),
+    })
+    plans = _plans(context)
+    users = _users({row['username'] for _, row in parsed})
+    today = timezone.now().date()
+    end_dates = context.setdefault('end_dates', {})
+
+    rows = []
+    for number, row in parsed:
+        user_id = users.get(row['username'])
+        plan_id, months = plans.get(row['plan_name'], (None, None))
+        if user_id is None:
+            errors.append((number, f"Unknown user {row['username']!r}"))
+            continue
+        if plan_id is None:
+            errors.append((number, f"Unknown plan {row['plan_name']!r}"))
+            continue
+        end_date = row['end_date']
+        if end_date is None:
+            key = (row['start_date'], months)
+            if key not in end_dates:
+                end_dates[key] = row['start_date'] + relativedelta(months=months)
+            end_date = end_dates[key]
+        status = row['status'] or ('ACTIVE' if end_date >= today else 'EXPIRED')
+        if status not in dict(UserSubscription.STATUS_CHOICES):
+            errors.append((number, f"Unknown status {status!r}"))
+            continue
+        rows.append((number, UserSubscription(
+            user_id=user_id, plan_id=plan_id, start_date=row['start_date'], end_date=end_date,
+            status=status, auto_renew=row['auto_renew'],
+        )))
+
+    # At most one ACTIVE subscription per user, counting existing rows
+    active_users = set(
+        UserSubscription.objects.filter(
+            user_id__in={s.user_id for _, s in rows if s.status == 'ACTIVE'}, status='ACTIVE'
+        ).values_list('user_id', flat=True)
+    )
+    subscriptions = []
+    for number, subscription in rows:
+        if subscription.status == 'ACTIVE':
+            if subscription.user_id in active_users:
+                errors.append((number, "User already has an active subscription"))
+                continue
+            active_users.add(subscription.user_id)
+        subscriptions.append(subscription)
+    return subscriptions, errors
+
+
+def _after_subscriptions(subscriptions, context):
+    after_bulk_write({subscription.user_id for subscription in subscriptions})
+    analytics.mark_subscriptions_dirty(subscriptions)
+
+
+def _prepare_payments(batch, context):
+    parsed, errors = _parse(batch, lambda record: {
+        'username': _text(record, 'username', required=True),
+        'plan_name': _text(record, 'plan_name'),
+        'subscription_start_date': _date(record, 'subscription_start_date'),
+        'is_verified': _bool(record, 'is_verified', False),
+        'created_at': _datetime(record, 'created_at'),
+        'payment_proof': _text(record, 'payment_proof'),
+        'proof_sha256': _text(record, 'proof_sha256'),
+        'proof_size': _int(record, 'proof_size'),
+    })
+    plans = _plans(context)
+    users = _users({row['username'] for _, row in parsed})
+    # Payments link to the user's subscription starting on subscription_start_date
+    linked = (
+        UserSubscription.objects.filter(
+            user_id__in=users.values(),
+            start_date__in={row['subscription_start_date'] for _, row in parsed if row['subscription_start_date']},
+        )
+        .values_list('user_id', 'start_date', 'pk')
+    )
+    subscriptions = {(user_id, start_date): pk for user_id, start_date, pk in linked}
+    pending_users = set(
+        Payment.objects.filter(user_id__in=users.values(), is_verified=False).values_list('user_id', flat=True)
+    )
+
+    payments = []
+    revenue_days = set()
+    now = timezone.now()
+    for number, row in parsed:
+        user_id = users.get(row['username'])
+        plan_id = None
+        subscription_id = None
+        if user_id is None:
+            errors.append((number, f"Unknown user {row['username']!r}"))
+            continue
+        if row['plan_name']:
+            plan_id = plans.get(row['plan_name'], (None, None))[0]
+            if plan_id is None:
+                errors.append((number, f"Unknown plan {row['plan_name']!r}"))
+                continue
+        if row['subscription_start_date']:
+            subscription_id = subscriptions.get((user_id, row['subscription_start_date']))
+            if subscription_id is None:
+                errors.append((number, f"No subscription starting {row['subscription_start_date']} for this user"))
+                continue
+        if not row['is_verified']:
+            if user_id in pending_users:
+                errors.append((number, "User already has a pending payment"))
+                continue
+            pending_users.add(user_id)
+        payment = Payment(
+            user_id=user_id, plan_id=plan_id, subscription_id=subscription_id,
+            is_verified=row['is_verified'], payment_proof=row['payment_proof'],
+            proof_sha256=row['proof_sha256'], proof_size=row['proof_size'],
+            created_at=row['created_at'] or now,
+        )
+        payments.append(payment)
+        if subscription_id:
+            revenue_days.add(row['subscription_start_date'])
+    # Days whose revenue these payments change, for the analytics rollups
+    context['revenue_days'] = revenue_days
+    return payments, errors
+
+
+def _after_payments(payments, context):
+    user_ids = {payment.user_id for payment in payments}
+    cache.invalidate_many(user_ids)
+    transaction.on_commit(lambda: cache.invalidate_many(user_ids))
+    analytics.mark_days_dirty(context.pop('revenue_days', ()))
+
+
+# kind -> (validate a batch into unsaved objects and errors, run after inserting them)
+IMPORTERS = {
+    'plans': (_prepare_plans, _after_plans),
+    'users': (_prepare_users, None),
+    'subscriptions': (_prepare_subscriptions, _after_subscriptions),
+    'payments': (_prepare_payments, _after_payments),
+}
+
+
+def _model(kind):
+    if kind == 'users':
+        return get_user_model()
+    return {'plans': SubscriptionPlan, 'subscriptions': UserSubscription, 'payments': Payment}[kind]
+
+
+def _copy_value(field, obj):
+    value = getattr(obj, field.attname)
+    if value is None and getattr(field, 'auto_now_add', False):
+        value = field.pre_save(obj, add=True)
+    value = field.get_db_prep_save(value, connection)
+    return r'\N' if value is None else value
+
+
+def copy_insert(model, objects):
+    """Insert unsaved model instances with PostgreSQL COPY (ids are not set)"""
+    fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for obj in objects:
+        writer.writerow([_copy_value(field, obj) for field in fields])
+    buffer.seek(0)
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {connection.ops.quote_name(model._meta.db_table)} ({columns}) "
+            f"FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+            buffer,
+        )
+
+
+def _insert(model, objects, use_copy):
+    if use_copy:
+        copy_insert(model, objects)
+        return
+    if model is not Payment:
+        model.objects.bulk_create(objects)
+        return
+    # A raw insert writes the created_at set on each payment; bulk_create would
+    # stamp the current time over it through auto_now_add
+    fields = [field for field in Payment._meta.concrete_fields if not field.primary_key]
+    for chunk in _batches(objects, connection.ops.bulk_batch_size(fields, objects) or len(objects)):
+        Payment.objects._insert(chunk, fields=fields, raw=True)
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def import_records(kind, records, batch_size=5000, use_copy=False, checkpoint=None, resume=False, on_batch=None):
+    """Import an iterable of dicts as `kind` rows and return the totals.
+
+    Each batch is committed together with the named ``checkpoint`` (if any);
+    with ``resume`` the records it already covers are skipped. ``on_batch``
+    is called after every batch with the running totals and that batch's
+    ``errors`` as (record number, message) pairs.
+    """
+    if kind not in IMPORTERS:
+        raise ValueError(f"Unknown import: {kind}")
+    if use_copy and connection.vendor != 'postgresql':
+        raise ValueError("COPY is only available on PostgreSQL")
+    prepare, after = IMPORTERS[kind]
+    model = _model(kind)
+
+    totals = {'records': 0, 'imported': 0, 'failed': 0}
+    if checkpoint:
+        state, _ = ImportCheckpoint.objects.get_or_create(name=checkpoint, defaults={'kind': kind})
+        if state.kind != kind:
+            raise ValueError(f"Checkpoint {checkpoint!r} belongs to a {state.kind} import")
+        if state.records and not resume:
+            raise ValueError(f"Checkpoint {checkpoint!r} already has progress; resume it or use another name")
+        totals = {'records': state.records, 'imported': state.imported, 'failed': state.failed}
+    skipped = totals['records']
+
+    started = time.monotonic()
+    context = {}
+    numbered = enumerate(itertools.islice(records, skipped, None), start=skipped + 1)
+    for batch in _batches(numbered, batch_size):
+        objects, errors = prepare(batch, context)
+        with transaction.atomic():
+            if objects:
+                _insert(model, objects, use_copy)
+                if after:
+                    after(objects, context)
+            totals['records'] += len(batch)
+            totals['imported'] += len(objects)
+            totals['failed'] += len(errors)
+            if checkpoint:
+                ImportCheckpoint.objects.filter(name=checkpoint).update(updated_at=timezone.now(), **totals)
+        if on_batch:
+            elapsed = time.monotonic() - started
+            on_batch({
+                **totals,
+                'seconds': round(elapsed, 3),
+                'rows_per_second': round((totals['records'] - skipped) / elapsed, 1) if elapsed else 0.0,
+                'errors': sorted(errors),
+            })
+
+    elapsed = time.monotonic() - started
+    return {
+        **totals,
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round((totals['records'] - skipped) / elapsed, 1) if elapsed else 0.0,
+    }
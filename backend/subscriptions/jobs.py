@@ -0,0 +1,238 @@
+import time
+from datetime import timedelta
+
+from dateutil.relativedelta import relativedelta
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from . import analytics, proof_pipeline
+from .models import DailyPlanStats, IdempotencyRecord, Payment, RollupDay, UserSubscription
+from .services import after_bulk_write
+
+# Scheduled maintenance jobs. Each one works in small index-driven chunks,
+# commits per chunk and returns a summary dict that the management commands
+# print, so they can also be called from a scheduler directly.
+
+
+def _summary(rows, started):
+    elapsed = time.monotonic() - started
+    return {
+        'rows': rows,
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(rows / elapsed, 1) if elapsed else float(rows),
+    }
+
+
+def expire_subscriptions(today=None, chunk_size=5000):
+    """Move ACTIVE subscriptions whose end_date has passed to EXPIRED.
+
+    Safe to run concurrently: rows locked by another sweeper are skipped and
+    the UPDATE re-checks the status, so no row is counted twice. Renewals
+    waiting on an expired subscription are activated in the same transaction,
+    and the users' current-subscription pointers and cached entitlements are
+    refreshed. Renewals left PENDING behind a predecessor retired some other
+    way are settled at the end.
+    """
+    today = today or timezone.now().date()
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    started = time.monotonic()
+    expired = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                UserSubscription.objects.select_for_update(skip_locked=skip_locked)
+                .filter(status='ACTIVE', end_date__lt=today)
+                .order_by('end_date', 'id')
+                .values_list('id', 'user_id')[:chunk_size]
+            )
+            if not rows:
+                break
+            ids = [subscription_id for subscription_id, _ in rows]
+            expired += UserSubscription.objects.filter(id__in=ids, status='ACTIVE').update(status='EXPIRED')
+            # Auto-renewed successors take over once their predecessor has expired
+            UserSubscription.promote_renewals(ids, today)
+            after_bulk_write({user_id for _, user_id in rows})
+        if len(rows) < chunk_size:
+            break
+    _resolve_orphaned_renewals(today)
+    return _summary(expired, started)
+
+
+def _resolve_orphaned_renewals(today):
+    """Settle renewals whose predecessor was retired without promoting them.
+
+    They take over unless the predecessor was canceled or the user already
+    holds another ACTIVE subscription, in which case they're canceled.
+    """
+    with transaction.atomic():
+        rows = list(
+            UserSubscription.objects.select_for_update(of=('self',))
+            .filter(status='PENDING', renewed_from__status__in=['EXPIRED', 'CANCELED'])
+            .order_by('-end_date', '-id')
+            .values_list('id', 'user_id', 'start_date', 'end_date', 'renewed_from__status')
+        )
+        if not rows:
+            return
+        user_ids = {user_id for _, user_id, _, _, _ in rows}
+        subscribed = set(
+            UserSubscription.objects.filter(user_id__in=user_ids, status='ACTIVE').values_list('user_id', flat=True)
+        )
+        statuses = {}
+        canceled = []
+        for subscription_id, user_id, start_date, end_date, predecessor_status in rows:
+            if predecessor_status == 'CANCELED' or user_id in subscribed:
+                statuses[subscription_id] = 'CANCELED'
+                canceled.append(UserSubscription(start_date=start_date, end_date=end_date))
+            elif end_date < today:
+                statuses[subscription_id] = 'EXPIRED'
+            else:
+                statuses[subscription_id] = 'ACTIVE'
+                subscribed.add(user_id)
+        for status in ('CANCELED', 'EXPIRED', 'ACTIVE'):
+            UserSubscription.objects.filter(
+                id__in=[pk for pk, new_status in statuses.items() if new_status == status], status='PENDING'
+            ).update(status=status)
+        after_bulk_write(user_ids)
+        # Canceled subscriptions drop out of the rollups
+        analytics.mark_subscriptions_dirty(canceled, today)
+
+
+def renew_subscriptions(today=None, window_days=3, chunk_size=1000):
+    """Create successors for auto-renewing subscriptions that end within the window.
+
+    A successor starts the day after its predecessor ends and stays PENDING
+    until the predecessor is retired, by expire_subscriptions or by
+    UserSubscription.retire_lapsed. Subscriptions that
+    already have a successor are skipped, so reruns (and concurrent runs)
+    never renew twice.
+    """
+    today = today or timezone.now().date()
+    horizon = today + timedelta(days=window_days)
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    due = UserSubscription.objects.filter(
+        auto_renew=True, status='ACTIVE', end_date__lte=horizon, renewal__isnull=True, plan__active=True,
+    )
+    started = time.monotonic()
+    renewed = 0
+    while True:
+        with transaction.atomic():
+            subscriptions = list(
+                due.select_for_update(of=('self',), skip_locked=skip_locked)
+                .select_related('plan')
+                .order_by('end_date', 'id')[:chunk_size]
+            )
+            if not subscriptions:
+                break
+            end_dates = {}
+            successors = []
+            for subscription in subscriptions:
+                start_date = subscription.end_date + timedelta(days=1)
+                key = (start_date, subscription.plan.duration_months)
+                if key not in end_dates:
+                    end_dates[key] = start_date + relativedelta(months=subscription.plan.duration_months)
+                successors.append(UserSubscription(
+                    user_id=subscription.user_id,
+                    plan=subscription.plan,
+                    start_date=start_date,
+                    end_date=end_dates[key],
+                    status='PENDING',
+                    auto_renew=True,
+                    renewed_from=subscription,
+                ))
+            UserSubscription.objects.bulk_create(successors)
+            after_bulk_write({subscription.user_id for subscription in subscriptions})
+            analytics.mark_subscriptions_dirty(successors, today)
+            renewed += len(successors)
+        if len(subscriptions) < chunk_size:
+            break
+    return _summary(renewed, started)
+
+
+def process_payment_proofs(workers=None, chunk_size=200):
+    """Render thumbnails and review copies for proofs that don't have them yet.
+
+    Used to backfill existing payments and as a throughput benchmark for
+    the proof pipeline.
+    """
+    pending = (
+        Payment.objects.filter(proof_thumbnail='', proof_error='')
+        .exclude(payment_proof='')
+        .order_by('pk')
+    )
+    started = time.monotonic()
+    processed = 0
+    last_pk = 0
+    with proof_pipeline.create_executor(workers) as executor:
+        while True:
+            batch = list(pending.filter(pk__gt=last_pk)[:chunk_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            jobs = [proof_pipeline.proof_job(payment) for payment in batch]
+            errors = executor.map(proof_pipeline.render_proof_variants, *zip(*(args for _, _, args in jobs)))
+            for payment, (thumbnail_name, review_name, _), error in zip(batch, jobs, errors):
+                proof_pipeline.apply_result(payment, thumbnail_name, review_name, error)
+            Payment.objects.bulk_update(batch, ['proof_thumbnail', 'proof_review', 'proof_error'])
+            processed += len(batch)
+    return _summary(processed, started)
+
+
+def purge_idempotency_records(chunk_size=5000):
+    """Delete stored Idempotency-Key responses whose TTL has passed"""
+    now = timezone.now()
+    started = time.monotonic()
+    deleted = 0
+    while True:
+        keys = list(
+            IdempotencyRecord.objects.filter(expires_at__lte=now)
+            .order_by('expires_at')
+            .values_list('key', flat=True)[:chunk_size]
+        )
+        if not keys:
+            break
+        deleted += IdempotencyRecord.objects.filter(key__in=keys, expires_at__lte=now).delete()[0]
+        if len(keys) < chunk_size:
+            break
+    return _summary(deleted, started)
+
+
+def rollup_daily_stats(today=None, since=None, window_days=31):
+    """Recompute the daily plan stats for dirty days and days not rolled up yet.
+
+    Days are processed in windows of up to ``window_days`` consecutive days,
+    one transaction each. ``since`` marks every day from that date on dirty
+    first, to rebuild after subscription dates were edited by hand. Returns the
+    summary with the number of days recomputed as ``rows``.
+    """
+    today = today or timezone.now().date()
+    if since:
+        analytics.mark_days_dirty(analytics.date_range(since, today))
+    last_clean = RollupDay.objects.filter(dirty=False).aggregate(Max('date'))['date__max']
+    if last_clean is None:
+        # First run: start from the oldest subscription
+        last_clean = UserSubscription.objects.aggregate(Min('start_date'))['start_date__min']
+        last_clean = last_clean - timedelta(days=1) if last_clean else today
+    days = set(analytics.date_range(last_clean + timedelta(days=1), today))
+    days.update(RollupDay.objects.filter(dirty=True, date__lte=today).values_list('date', flat=True))
+
+    started = time.monotonic()
+    processed = 0
+    days = sorted(days)
+    while days:
+        window = [day for day in days if (day - days[0]).days < window_days]
+        days = days[len(window):]
+        with transaction.atomic():
+            # Clear the flags first: a concurrent mark waits for this transaction
+            # and sets them again, so its change is picked up by the next run
+            RollupDay.objects.bulk_create(
+                [RollupDay(date=day, dirty=False) for day in window],
+                update_conflicts=True,
+                unique_fields=['date'],
+                update_fields=['dirty'],
+            )
+            rows = analytics.compute_stats(window)
+            DailyPlanStats.objects.filter(date__in=window).delete()
+            DailyPlanStats.objects.bulk_create(rows, batch_size=1000)
+        processed += len(window)
+    return _summary(processed, started)
@@ -0,0 +1,44 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from subscriptions.benchmarking import allow_test_host, run_asgi, run_wsgi
+from subscriptions.models import CurrentSubscription
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the sync read endpoints under WSGI with their async versions under ASGI "
+        "and print requests/s and latency percentiles as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help="Requests per serving mode")
+        parser.add_argument(
+            '--concurrency', type=int, default=50,
+            help="Requests in flight; for WSGI this is also the number of threads and database connections",
+        )
+        parser.add_argument('--username', help="User to authenticate as (default: any user with a subscription)")
+
+    def handle(self, *args, **options):
+        if options['username']:
+            user = User.objects.filter(username=options['username']).first()
+        else:
+            current = CurrentSubscription.objects.select_related('user').first()
+            user = current.user if current else None
+        if user is None:
+            raise CommandError("No user to benchmark with; create a subscription first or pass --username.")
+
+        headers = {'Authorization': f"Bearer {AccessToken.for_user(user)}"}
+        endpoints = ['plans/', 'user/', f"users/{user.id}/subscriptions/", f"users/{user.id}/subscriptions/current/"]
+        total, concurrency = options['requests'], options['concurrency']
+
+        with allow_test_host():
+            results = {
+                'concurrency': concurrency,
+                'wsgi': run_wsgi([f"/api/{endpoint}" for endpoint in endpoints], total, concurrency, headers),
+                'asgi': run_asgi([f"/api/async/{endpoint}" for endpoint in endpoints], total, concurrency, headers),
+            }
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,27 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from subscriptions.benchmarking.serialization import KINDS, benchmark_serialization
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the CPU time of the ModelSerializer and compiled list serialization paths "
+        "per 1,000 rows and print it as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=sorted(KINDS), action='append', help="Rows to serialize (default: all)")
+        parser.add_argument('--rows', type=int, default=1000, help="Rows per run")
+        parser.add_argument('--repeat', type=int, default=10, help="Runs per path; the median is reported")
+
+    def handle(self, *args, **options):
+        try:
+            results = [
+                benchmark_serialization(kind, options['rows'], options['repeat'])
+                for kind in options['kind'] or sorted(KINDS)
+            ]
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from subscriptions.jobs import expire_subscriptions
+
+
+class Command(BaseCommand):
+    help = "Mark subscriptions whose end date has passed as EXPIRED"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Rows updated per transaction")
+
+    def handle(self, *args, **options):
+        result = expire_subscriptions(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Expired {result['rows']} subscriptions in {result['seconds']}s "
+            f"({result['rows_per_second']} rows/s)"
+        ))
@@ -0,0 +1,36 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from subscriptions import exports
+
+
+class Command(BaseCommand):
+    help = "Stream subscriptions or payments, with their user and plan fields, as CSV or NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(exports.COLUMNS))
+        parser.add_argument('--format', dest='fmt', choices=sorted(exports.FORMATS), default='csv')
+        parser.add_argument('--output', help="File to write to (default: stdout)")
+        parser.add_argument('--start', type=date.fromisoformat, help="From this date (YYYY-MM-DD)")
+        parser.add_argument('--end', type=date.fromisoformat, help="Up to and including this date (YYYY-MM-DD)")
+        parser.add_argument('--plan', type=int, help="Only this plan id")
+        parser.add_argument('--status', help="Subscription status, or verified/pending for payments")
+        parser.add_argument('--chunk-size', type=int, help="Rows fetched per round trip")
+
+    def handle(self, *args, **options):
+        try:
+            queryset = exports.export_queryset(
+                options['kind'], start=options['start'], end=options['end'],
+                plan=options['plan'], status=options['status'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        chunks = exports.stream(options['kind'], options['fmt'], queryset, options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='') as output:
+                output.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,61 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from subscriptions import imports
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk import plans, users, subscriptions or payments from a CSV or NDJSON file "
+        "(import plans and users before the rows that refer to them)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=imports.KINDS)
+        parser.add_argument('path', help="File to read, or - for stdin")
+        parser.add_argument(
+            '--format', dest='fmt', choices=['csv', 'ndjson'],
+            help="Input format (default: from the file extension, csv for stdin)",
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help="Records validated and inserted per transaction")
+        parser.add_argument('--copy', action='store_true', help="Insert with COPY instead of bulk INSERTs (PostgreSQL only)")
+        parser.add_argument(
+            '--checkpoint',
+            help="Record progress under this name so a failed run can be continued with --resume",
+        )
+        parser.add_argument('--resume', action='store_true', help="Skip the records the checkpoint already covers")
+
+    def handle(self, *args, **options):
+        if options['resume'] and not options['checkpoint']:
+            raise CommandError("--resume needs --checkpoint")
+        fmt = options['fmt'] or ('ndjson' if options['path'].endswith(('.ndjson', '.jsonl')) else 'csv')
+
+        def report(progress):
+            for number, message in progress['errors']:
+                self.stderr.write(f"Record {number}: {message}")
+            self.stderr.write(
+                f"{progress['records']} records, {progress['imported']} imported, {progress['failed']} failed "
+                f"({progress['rows_per_second']} records/s)"
+            )
+
+        stream = sys.stdin if options['path'] == '-' else open(options['path'], newline='', encoding='utf-8')
+        try:
+            result = imports.import_records(
+                options['kind'],
+                imports.read_records(stream, fmt),
+                batch_size=options['batch_size'],
+                use_copy=options['copy'],
+                checkpoint=options['checkpoint'],
+                resume=options['resume'],
+                on_batch=report,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['imported']} of {result['records']} {options['kind']} records "
+            f"({result['failed']} failed) in {result['seconds']}s ({result['rows_per_second']} records/s)"
+        ))
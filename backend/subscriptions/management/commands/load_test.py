@@ -0,0 +1,44 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from subscriptions.benchmarking.load import SCENARIOS, run_load
+
+
+class Command(BaseCommand):
+    help = (
+        "Call every API endpoint at the given concurrency and print latency percentiles, "
+        "throughput and queries per request as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint")
+        parser.add_argument('--concurrency', type=int, default=10, help="Threads sending requests")
+        parser.add_argument(
+            '--only', help=f"Comma-separated scenarios to run (of: {', '.join(s.name for s in SCENARIOS)})",
+        )
+        parser.add_argument('--label', help="Stored in the report, e.g. a commit hash")
+        parser.add_argument('--output', help="Also write the report to this file")
+
+    def handle(self, *args, **options):
+        only = set(options['only'].split(',')) if options['only'] else None
+        unknown = (only or set()) - {scenario.name for scenario in SCENARIOS}
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+        report = run_load(
+            requests=options['requests'],
+            concurrency=options['concurrency'],
+            only=only,
+            on_result=lambda name, result: self.stderr.write(
+                f"{name}: {result['requests_per_second']} req/s, p95 {result['p95_ms']} ms, "
+                f"{result['queries_per_request']} queries/request"
+            ),
+        )
+        if options['label']:
+            report = {'label': options['label'], **report}
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        self.stdout.write(output)
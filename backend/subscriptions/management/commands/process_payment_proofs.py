@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from subscriptions.jobs import process_payment_proofs
+
+
+class Command(BaseCommand):
+    help = "Create thumbnails and review copies for payment proofs that don't have them yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: PAYMENT_PROOF_WORKERS)")
+        parser.add_argument('--chunk-size', type=int, default=200, help="Payments loaded and updated per batch")
+
+    def handle(self, *args, **options):
+        result = process_payment_proofs(workers=options['workers'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {result['rows']} payment proofs in {result['seconds']}s "
+            f"({result['rows_per_second']} images/s)"
+        ))
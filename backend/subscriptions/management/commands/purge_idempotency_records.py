@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from subscriptions.jobs import purge_idempotency_records
+
+
+class Command(BaseCommand):
+    help = "Delete stored Idempotency-Key responses that have expired"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Rows deleted per statement")
+
+    def handle(self, *args, **options):
+        result = purge_idempotency_records(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {result['rows']} idempotency records in {result['seconds']}s "
+            f"({result['rows_per_second']} rows/s)"
+        ))
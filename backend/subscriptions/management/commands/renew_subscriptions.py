@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from subscriptions.jobs import renew_subscriptions
+
+
+class Command(BaseCommand):
+    help = "Create renewals for auto-renewing subscriptions that end within the window"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window-days', type=int, default=3, help="Renew subscriptions ending within this many days")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Subscriptions renewed per transaction")
+
+    def handle(self, *args, **options):
+        result = renew_subscriptions(window_days=options['window_days'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Renewed {result['rows']} subscriptions in {result['seconds']}s "
+            f"({result['rows_per_second']} rows/s)"
+        ))
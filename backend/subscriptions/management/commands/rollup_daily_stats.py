@@ -0,0 +1,23 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from subscriptions.jobs import rollup_daily_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily per-plan analytics rollups for dirty days and days not rolled up yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since', type=date.fromisoformat,
+            help="Rebuild every day from this date (YYYY-MM-DD), e.g. after editing subscription dates by hand",
+        )
+        parser.add_argument('--window-days', type=int, default=31, help="Consecutive days recomputed per transaction")
+
+    def handle(self, *args, **options):
+        result = rollup_daily_stats(since=options['since'], window_days=options['window_days'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled up {result['rows']} days in {result['seconds']}s "
+            f"({result['rows_per_second']} days/s)"
+        ))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from subscriptions.benchmarking.seed import seed
+
+
+class Command(BaseCommand):
+    help = "Bulk-create benchmark users with subscription histories and payments"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000, help="Users to create")
+        parser.add_argument('--plans', type=int, default=20, help="Plans to spread them over (created if missing)")
+        parser.add_argument('--max-subscriptions', type=int, default=4, help="Most subscriptions per user")
+        parser.add_argument(
+            '--pending-ratio', type=float, default=0.05,
+            help="Share of users without a live subscription that get a payment awaiting verification",
+        )
+        parser.add_argument('--history-days', type=int, default=3 * 365, help="How far back histories start")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Users per transaction")
+        parser.add_argument('--prefix', default='seed', help="Username prefix")
+        parser.add_argument('--seed', type=int, default=42, help="Random seed")
+
+    def handle(self, *args, **options):
+        result = seed(
+            options['users'],
+            plans=options['plans'],
+            max_subscriptions=options['max_subscriptions'],
+            pending_ratio=options['pending_ratio'],
+            history_days=options['history_days'],
+            batch_size=options['batch_size'],
+            prefix=options['prefix'],
+            rng_seed=options['seed'],
+            on_batch=lambda totals: self.stderr.write(
+                f"{totals['users']} users, {totals['subscriptions']} subscriptions, {totals['payments']} payments"
+            ),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result['users']} users, {result['subscriptions']} subscriptions and "
+            f"{result['payments']} payments in {result['seconds']}s ({result['rows_per_second']} rows/s)"
+        ))
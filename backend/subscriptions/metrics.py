@@ -0,0 +1,206 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# In-process request metrics for the API (see middleware.py). Per view they
+# aggregate request counts, a latency histogram, SQL query counts and time,
+# serializer time and response bytes; response compression is counted per
+# encoding. render_prometheus() returns them all in the Prometheus text
+# format. Each worker process keeps its own numbers, so scrape every process
+# (or sum them) when running several.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = ContextVar('request_metrics', default=None)
+
+_lock = threading.Lock()
+_views = {}
+_compression = {}
+
+
+class RequestMetrics:
+    """Counters for the request being handled, filled in by the hooks below"""
+
+    __slots__ = ('queries', 'db_seconds', 'serializer_seconds', 'compression_seconds', '_timing')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.compression_seconds = 0.0
+        self._timing = False
+
+
+def current_request():
+    """Metrics of the request being measured, or None outside a measured request"""
+    return _current.get()
+
+
+def start_request():
+    """Collect metrics for the current request; returns a token for finish_request"""
+    return _current.set(RequestMetrics())
+
+
+def finish_request(token):
+    current = _current.get()
+    _current.reset(token)
+    return current
+
+
+def sql_wrapper(execute, sql, params, many, context):
+    """Database execute wrapper counting queries and their time for the current request"""
+    current = _current.get()
+    if current is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        current.queries += 1
+        current.db_seconds += time.perf_counter() - started
+
+
+def install_sql_wrapper(sender, connection, **kwargs):
+    """connection_created handler: add sql_wrapper to every new database connection"""
+    if sql_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(sql_wrapper)
+
+
+@contextmanager
+def serializer_timer():
+    """Count the enclosed block as serializer time (nested blocks count once)"""
+    current = _current.get()
+    if current is None or current._timing:
+        yield
+        return
+    current._timing = True
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        current.serializer_seconds += time.perf_counter() - started
+        current._timing = False
+
+
+def record(view, method, status_code, seconds, current, response_bytes):
+    with _lock:
+        stats = _views.get(view)
+        if stats is None:
+            stats = _views[view] = {
+                'requests': {}, 'buckets': [0] * len(LATENCY_BUCKETS), 'count': 0, 'seconds': 0.0,
+                'queries': 0, 'db_seconds': 0.0, 'serializer_seconds': 0.0, 'response_bytes': 0,
+            }
+        key = (method, status_code)
+        stats['requests'][key] = stats['requests'].get(key, 0) + 1
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                stats['buckets'][index] += 1
+                break
+        stats['count'] += 1
+        stats['seconds'] += seconds
+        stats['queries'] += current.queries
+        stats['db_seconds'] += current.db_seconds
+        stats['serializer_seconds'] += current.serializer_seconds
+        stats['response_bytes'] += response_bytes
+
+
+def record_compression(encoding, original_bytes, compressed_bytes, cpu_seconds):
+    with _lock:
+        stats = _compression.get(encoding)
+        if stats is None:
+            stats = _compression[encoding] = {'responses': 0, 'bytes_in': 0, 'bytes_out': 0, 'cpu_seconds': 0.0}
+        stats['responses'] += 1
+        stats['bytes_in'] += original_bytes
+        stats['bytes_out'] += compressed_bytes
+        stats['cpu_seconds'] += cpu_seconds
+
+
+def snapshot():
+    """Copy of the aggregated metrics, keyed by view"""
+    with _lock:
+        return {
+            view: {**stats, 'requests': dict(stats['requests']), 'buckets': list(stats['buckets'])}
+            for view, stats in _views.items()
+        }
+
+
+def compression_snapshot():
+    """Copy of the compression totals, keyed by encoding"""
+    with _lock:
+        return {encoding: dict(stats) for encoding, stats in _compression.items()}
+
+
+def reset():
+    with _lock:
+        _views.clear()
+        _compression.clear()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def render_prometheus(sample_rate=1.0, entitlement_cache=None):
+    """The metrics in Prometheus text format, plus the entitlement cache's
+    ``{'hits': ..., 'misses': ...}`` counters when given"""
+    views = snapshot()
+    lines = [
+        '# HELP api_metrics_sample_rate Share of requests measured; scale the other metrics by its inverse.',
+        '# TYPE api_metrics_sample_rate gauge',
+        f'api_metrics_sample_rate {sample_rate}',
+        '# HELP api_requests_total Measured requests by view, method and status.',
+        '# TYPE api_requests_total counter',
+    ]
+    for view, stats in sorted(views.items()):
+        for (method, status_code), count in sorted(stats['requests'].items()):
+            lines.append(f'api_requests_total{_labels(view=view, method=method, status=status_code)} {count}')
+
+    lines += [
+        '# HELP api_request_duration_seconds Request latency by view.',
+        '# TYPE api_request_duration_seconds histogram',
+    ]
+    for view, stats in sorted(views.items()):
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, stats['buckets']):
+            cumulative += count
+            lines.append(f'api_request_duration_seconds_bucket{_labels(view=view, le=bound)} {cumulative}')
+        lines.append(f'api_request_duration_seconds_bucket{_labels(view=view, le="+Inf")} {stats["count"]}')
+        lines.append(f'api_request_duration_seconds_sum{_labels(view=view)} {stats["seconds"]:.6f}')
+        lines.append(f'api_request_duration_seconds_count{_labels(view=view)} {stats["count"]}')
+
+    totals = (
+        ('api_db_queries_total', 'queries', 'SQL queries run by measured requests.', 'd'),
+        ('api_db_seconds_total', 'db_seconds', 'Time spent in SQL queries.', '.6f'),
+        ('api_serializer_seconds_total', 'serializer_seconds', 'Time spent building serializer data.', '.6f'),
+        ('api_response_bytes_total', 'response_bytes', 'Response body bytes as sent (streaming responses excluded).', 'd'),
+    )
+    for name, field, help_text, spec in totals:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        for view, stats in sorted(views.items()):
+            lines.append(f'{name}{_labels(view=view)} {stats[field]:{spec}}')
+
+    encodings = compression_snapshot()
+    totals = (
+        ('api_compression_responses_total', 'responses', 'Measured responses compressed.', 'd'),
+        ('api_compression_input_bytes_total', 'bytes_in', 'Response bytes before compression.', 'd'),
+        ('api_compression_output_bytes_total', 'bytes_out', 'Response bytes after compression.', 'd'),
+        ('api_compression_cpu_seconds_total', 'cpu_seconds', 'CPU time spent compressing responses.', '.6f'),
+    )
+    for name, field, help_text, spec in totals:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        for encoding, stats in sorted(encodings.items()):
+            lines.append(f'{name}{_labels(encoding=encoding)} {stats[field]:{spec}}')
+
+    if entitlement_cache is not None:
+        lines += [
+            '# HELP api_entitlement_cache_lookups_total Entitlement cache lookups by result (every lookup, not sampled).',
+            '# TYPE api_entitlement_cache_lookups_total counter',
+            f'api_entitlement_cache_lookups_total{_labels(result="hit")} {entitlement_cache["hits"]}',
+            f'api_entitlement_cache_lookups_total{_labels(result="miss")} {entitlement_cache["misses"]}',
+        ]
+    return '\n'.join(lines) + '\n'
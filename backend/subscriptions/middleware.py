@@ -0,0 +1,182 @@
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from rest_framework.permissions import SAFE_METHODS
+
+from . import compression, metrics, routers
+
+
+class RequestMetricsMiddleware:
+    """Measure a sample of requests for the metrics endpoint and add Server-Timing headers.
+
+    Requests outside the sample (METRICS_SAMPLE_RATE) pass straight through,
+    so the rate bounds the overhead under load. Works for sync and async views.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def sampled(self):
+        rate = getattr(settings, 'METRICS_SAMPLE_RATE', 1.0)
+        return rate >= 1 or random.random() < rate
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        token = metrics.start_request()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current = metrics.finish_request(token)
+        self.finish(request, response, time.perf_counter() - started, current)
+        return response
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        token = metrics.start_request()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current = metrics.finish_request(token)
+        self.finish(request, response, time.perf_counter() - started, current)
+        return response
+
+    def finish(self, request, response, seconds, current):
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        size = 0 if response.streaming else len(response.content)
+        metrics.record(view, request.method, response.status_code, seconds, current, size)
+        if getattr(settings, 'METRICS_SERVER_TIMING', True):
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={current.db_seconds * 1000:.1f};desc="{current.queries} queries"',
+                f'serializer;dur={current.serializer_seconds * 1000:.1f}',
+                *([f'compress;dur={current.compression_seconds * 1000:.1f}'] if current.compression_seconds else []),
+                f'total;dur={seconds * 1000:.1f}',
+            ])
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """Compress responses with brotli or gzip, whichever Accept-Encoding prefers.
+
+    Only GET and HEAD responses are compressed, so secrets in responses to
+    writes (such as tokens) can't be guessed from the compressed size
+    (BREACH). Bodies under COMPRESSION_MIN_SIZE bytes, content types outside
+    COMPRESSION_CONTENT_TYPES and media files (payment proofs are already
+    compressed images) are sent as they are. Like Django's GZipMiddleware,
+    strong ETags are made weak; the plan catalog accepts those in
+    If-None-Match. Measured requests report bytes and CPU time to the metrics.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'COMPRESSION_ENABLED', True):
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def compressible(self, request, response):
+        if request.method not in ('GET', 'HEAD') or response.status_code == 206:
+            return False
+        if response.has_header('Content-Encoding') or (response.streaming and response.is_async):
+            return False
+        if settings.MEDIA_URL and request.path.startswith(settings.MEDIA_URL):
+            return False
+        content_type = response.get('Content-Type', '').partition(';')[0].strip().lower()
+        types = getattr(settings, 'COMPRESSION_CONTENT_TYPES', ['application/json', 'application/x-ndjson', 'text/'])
+        if not any(content_type == t or (t.endswith('/') and content_type.startswith(t)) for t in types):
+            return False
+        return response.streaming or len(response.content) >= getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+
+    def process_response(self, request, response):
+        if not self.compressible(request, response):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = compression.negotiate(
+            request.headers.get('Accept-Encoding', ''), compression.available_encodings()
+        )
+        if encoding is None:
+            return response
+
+        compressor = compression.compressor(
+            encoding,
+            gzip_level=getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6),
+            brotli_quality=getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 4),
+        )
+        current = metrics.current_request()
+        if response.streaming:
+            on_finish = None
+            if current is not None:
+                # The body is sent after the request has been measured
+                def on_finish(bytes_in, bytes_out, cpu_seconds):
+                    metrics.record_compression(encoding, bytes_in, bytes_out, cpu_seconds)
+            response.streaming_content = compression.compress_stream(response.streaming_content, compressor, on_finish)
+            del response.headers['Content-Length']
+        else:
+            compressed, cpu_seconds = compression.compress(response.content, compressor)
+            if current is not None:
+                current.compression_seconds += cpu_seconds
+                metrics.record_compression(encoding, len(response.content), len(compressed), cpu_seconds)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """Let safe requests read from the replicas and pin writers to the primary (see routers.py).
+
+    Not used when DATABASE_REPLICAS is empty. Works for sync and async views.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not routers.replicas():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        key = routers.client_key(request)
+        if request.method not in SAFE_METHODS:
+            response = self.get_response(request)
+            if key:
+                routers.pin_to_primary(key)
+            return response
+        with routers.replica_reads(not (key and routers.pinned_to_primary(key))):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        key = routers.client_key(request)
+        if request.method not in SAFE_METHODS:
+            response = await self.get_response(request)
+            if key:
+                routers.pin_to_primary(key)
+            return response
+        with routers.replica_reads(not (key and routers.pinned_to_primary(key))):
+            return await self.get_response(request)
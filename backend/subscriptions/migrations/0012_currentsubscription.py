@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_current_subscriptions(apps, schema_editor):
+    UserSubscription = apps.get_model('subscriptions', 'UserSubscription')
+    CurrentSubscription = apps.get_model('subscriptions', 'CurrentSubscription')
+    latest = {}
+    subscriptions = (
+        UserSubscription.objects.order_by('user_id', models.F('end_date').asc(nulls_first=True), 'id')
+        .values_list('user_id', 'id')
+    )
+    for user_id, subscription_id in subscriptions.iterator():
+        latest[user_id] = subscription_id
+    CurrentSubscription.objects.bulk_create(
+        [CurrentSubscription(user_id=user_id, subscription_id=subscription_id) for user_id, subscription_id in latest.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('subscriptions', '0011_usersubscription_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrentSubscription',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('subscription', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='subscriptions.usersubscription')),
+            ],
+        ),
+        migrations.RunPython(populate_current_subscriptions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:58
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def expire_stale_active_subscriptions(apps, schema_editor):
+    UserSubscription = apps.get_model('subscriptions', 'UserSubscription')
+    UserSubscription.objects.filter(status='ACTIVE', end_date__lt=timezone.now().date()).update(status='EXPIRED')
+    # Of any overlapping ACTIVE rows left, only the latest one per user stays ACTIVE
+    seen = set()
+    superseded = []
+    active = (
+        UserSubscription.objects.filter(status='ACTIVE')
+        .order_by('user_id', models.F('end_date').desc(nulls_last=True), '-id')
+        .values_list('user_id', 'id')
+    )
+    for user_id, subscription_id in active.iterator():
+        if user_id in seen:
+            superseded.append(subscription_id)
+        seen.add(user_id)
+    UserSubscription.objects.filter(id__in=superseded).update(status='EXPIRED')
+
+
+def resolve_duplicate_pending_payments(apps, schema_editor):
+    # The API allowed only one unverified payment per user, but nothing in the
+    # database did. Keep the newest one awaiting verification and delete the
+    # older duplicates it supersedes: marking them verified would count
+    # unreviewed proofs as revenue. Their proof files stay in storage.
+    Payment = apps.get_model('subscriptions', 'Payment')
+    seen = set()
+    duplicates = []
+    pending = (
+        Payment.objects.filter(is_verified=False)
+        .order_by('user_id', '-created_at', '-id')
+        .values_list('user_id', 'id')
+    )
+    for user_id, payment_id in pending.iterator():
+        if user_id in seen:
+            duplicates.append(payment_id)
+        seen.add(user_id)
+    Payment.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0012_currentsubscription'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['user', 'is_verified'], name='payment_user_verified_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usersubscription',
+            index=models.Index(fields=['user', 'end_date'], name='usersub_user_end_date_idx'),
+        ),
+        migrations.RunPython(resolve_duplicate_pending_payments, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='payment',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_verified', False)), fields=('user',), name='unique_pending_payment_per_user'),
+        ),
+        migrations.RunPython(expire_stale_active_subscriptions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='usersubscription',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'ACTIVE')), fields=('user',), name='unique_active_subscription_per_user'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:04
+
+import subscriptions.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0014_usersubscription_status_end_date_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='proof_sha256',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='proof_size',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='payment_proof',
+            field=models.ImageField(storage=subscriptions.storage.payment_proof_storage, upload_to='payment_proofs/'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0015_payment_proof_hash_and_size'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='proof_error',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='proof_review',
+            field=models.ImageField(blank=True, editable=False, upload_to='payment_proofs/review/'),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='proof_thumbnail',
+            field=models.ImageField(blank=True, editable=False, upload_to='payment_proofs/thumbnails/'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0016_payment_proof_variants'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usersubscription',
+            name='auto_renew',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='usersubscription',
+            name='renewed_from',
+            field=models.OneToOneField(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='renewal', to='subscriptions.usersubscription'),
+        ),
+        migrations.AddIndex(
+            model_name='usersubscription',
+            index=models.Index(condition=models.Q(('auto_renew', True), ('status', 'ACTIVE')), fields=['end_date'], name='usersub_auto_renew_due_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0018_idempotencyrecord'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupDay',
+            fields=[
+                ('date', models.DateField(primary_key=True, serialize=False)),
+                ('dirty', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyPlanStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('new_subscriptions', models.PositiveIntegerField(default=0)),
+                ('renewed_subscriptions', models.PositiveIntegerField(default=0)),
+                ('expired_subscriptions', models.PositiveIntegerField(default=0)),
+                ('active_subscriptions', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='subscriptions.subscriptionplan')),
+            ],
+            options={
+                'verbose_name_plural': 'daily plan stats',
+                'constraints': [models.UniqueConstraint(fields=('date', 'plan'), name='unique_daily_plan_stats')],
+            },
+        ),
+    ]
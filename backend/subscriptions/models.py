@@ -1,9 +1,12 @@
 # subscriptions/models.py
 from django.db import models
 from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.utils import timezone
 from dateutil.relativedelta import relativedelta
 
+from .storage import payment_proof_storage
+
 class SubscriptionPlan(models.Model):
     name = models.CharField(max_length=100)
     price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -27,6 +30,31 @@ class UserSubscription(models.Model):
     start_date = models.DateField(null=True, blank=True)
     end_date = models.DateField(null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='ACTIVE')
+    auto_renew = models.BooleanField(default=False)
+    # Set on subscriptions created by the renewal engine; one successor per subscription
+    renewed_from = models.OneToOneField(
+        'self', on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='renewal'
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'end_date'], name='usersub_user_end_date_idx'),
+            models.Index(fields=['status', 'end_date'], name='usersub_status_end_date_idx'),
+            # Subscriptions the renewal engine has to look at, by expiry
+            models.Index(
+                fields=['end_date'],
+                condition=models.Q(auto_renew=True, status='ACTIVE'),
+                name='usersub_auto_renew_due_idx',
+            ),
+        ]
+        constraints = [
+            # A user can hold at most one ACTIVE subscription at a time
+            models.UniqueConstraint(
+                fields=['user'],
+                condition=models.Q(status='ACTIVE'),
+                name='unique_active_subscription_per_user',
+            ),
+        ]
 
     @property
     def is_active(self):
@@ -42,18 +70,190 @@ class UserSubscription(models.Model):
         # Automatically calculate the end_date when start_date is set and end_date is not
         if self.start_date and not self.end_date:
             self.end_date = self.start_date + relativedelta(months=self.plan.duration_months)
+        if self._state.adding and self.status == 'ACTIVE':
+            # Retire lapsed subscriptions so the one-active-row constraint only
+            # rejects the insert when the user still has a live subscription
+            UserSubscription.retire_lapsed([self.user_id])
         super().save(*args, **kwargs)
+        # Keep the user's current subscription pointer in sync
+        CurrentSubscription.refresh_for_user(self.user_id)
+
+    @classmethod
+    def retire_lapsed(cls, user_ids, today=None):
+        """Expire the users' ACTIVE subscriptions whose end_date has passed.
+
+        Auto-renewed successors waiting on them take over, or expire as well
+        if they have run out too. Uses queryset updates, so callers refresh
+        pointers and cached entitlements. Returns the expired ids.
+        """
+        today = today or timezone.now().date()
+        lapsed = list(
+            cls.objects.filter(user_id__in=user_ids, status='ACTIVE', end_date__lt=today)
+            .values_list('id', flat=True)
+        )
+        if lapsed:
+            cls.objects.filter(id__in=lapsed, status='ACTIVE').update(status='EXPIRED')
+            cls.promote_renewals(lapsed, today)
+        return lapsed
+
+    @classmethod
+    def promote_renewals(cls, predecessor_ids, today=None):
+        """Activate the PENDING successors of retired subscriptions"""
+        today = today or timezone.now().date()
+        successors = cls.objects.filter(renewed_from_id__in=predecessor_ids, status='PENDING')
+        successors.filter(end_date__gte=today).update(status='ACTIVE')
+        # Whatever is still pending ran out before it could start
+        successors.update(status='EXPIRED')
+
+    def delete(self, *args, **kwargs):
+        user_id = self.user_id
+        result = super().delete(*args, **kwargs)
+        CurrentSubscription.refresh_for_user(user_id)
+        return result
+
+
+class CurrentSubscription(models.Model):
+    # One row per user pointing at their latest subscription, so the current
+    # entitlement is a primary key lookup instead of a scan of the history
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True)
+    subscription = models.ForeignKey(UserSubscription, on_delete=models.CASCADE, related_name='+')
+
+    def __str__(self):
+        return f"Current subscription for user {self.user_id}: {self.subscription_id}"
+
+    @classmethod
+    def refresh_for_user(cls, user_id):
+        """Point the user's entry at their latest subscription (by end_date)"""
+        latest_id = (
+            UserSubscription.objects.filter(user_id=user_id)
+            .order_by(models.F('end_date').desc(nulls_last=True), '-id')
+            .values_list('id', flat=True)
+            .first()
+        )
+        if latest_id is None:
+            cls.objects.filter(user_id=user_id).delete()
+        else:
+            cls.objects.update_or_create(user_id=user_id, defaults={'subscription_id': latest_id})
+
+    @classmethod
+    def refresh_for_users(cls, user_ids):
+        """refresh_for_user for many users with one read and one write, for bulk operations"""
+        latest = (
+            UserSubscription.objects.filter(user_id=models.OuterRef('pk'))
+            .order_by(models.F('end_date').desc(nulls_last=True), '-id')
+            .values('id')[:1]
+        )
+        rows = (
+            get_user_model().objects.filter(pk__in=user_ids)
+            .annotate(latest_id=models.Subquery(latest))
+            .filter(latest_id__isnull=False)
+            .values_list('pk', 'latest_id')
+        )
+        cls.objects.bulk_create(
+            [cls(user_id=user_id, subscription_id=latest_id) for user_id, latest_id in rows],
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=['subscription'],
+        )
 
 
 class Payment(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     plan = models.ForeignKey(SubscriptionPlan, on_delete=models.CASCADE, null=True, blank=True)
     subscription = models.ForeignKey(UserSubscription, on_delete=models.CASCADE, null=True, blank=True)
-    payment_proof = models.ImageField(upload_to='payment_proofs/')
+    payment_proof = models.ImageField(upload_to='payment_proofs/', storage=payment_proof_storage)
+    proof_sha256 = models.CharField(max_length=64, blank=True, editable=False)
+    proof_size = models.PositiveBigIntegerField(null=True, blank=True, editable=False)
+    # Derived copies written by the background proof pipeline
+    proof_thumbnail = models.ImageField(upload_to='payment_proofs/thumbnails/', blank=True, editable=False)
+    proof_review = models.ImageField(upload_to='payment_proofs/review/', blank=True, editable=False)
+    proof_error = models.CharField(max_length=255, blank=True, editable=False)
     is_verified = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'is_verified'], name='payment_user_verified_idx'),
+        ]
+        constraints = [
+            # A user can have at most one payment awaiting verification
+            models.UniqueConstraint(
+                fields=['user'],
+                condition=models.Q(is_verified=False),
+                name='unique_pending_payment_per_user',
+            ),
+        ]
+
     def __str__(self):
         plan_name = self.plan.name if self.plan else "No Plan"
         return f"Payment for {self.user.username} - {plan_name} ({self.created_at.strftime('%Y-%m-%d')})"
 
+    def save(self, *args, **kwargs):
+        proof = self.payment_proof
+        if proof and not proof._committed:
+            # Store the upload first so its content hash and size go into the same write
+            proof.save(proof.name, proof.file, save=False)
+            if hasattr(proof.storage, 'content_hash'):
+                self.proof_sha256 = proof.storage.content_hash(proof.name)
+            self.proof_size = proof.size
+        super().save(*args, **kwargs)
+
+
+
+class IdempotencyRecord(models.Model):
+    # Stored response for an Idempotency-Key, keyed by a hash of (user, path, key).
+    # status_code stays null while the first request is still being processed.
+    key = models.CharField(max_length=64, primary_key=True)
+    # Hash of the first request's payload; reusing the key with another one is rejected
+    request_hash = models.CharField(max_length=64, blank=True)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    body = models.TextField(blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Idempotency record {self.key} ({self.status_code})"
+
+
+class DailyPlanStats(models.Model):
+    # Per-plan daily rollup maintained by jobs.rollup_daily_stats. Days without
+    # any activity for a plan have no row.
+    date = models.DateField()
+    plan = models.ForeignKey(SubscriptionPlan, on_delete=models.CASCADE)
+    new_subscriptions = models.PositiveIntegerField(default=0)
+    renewed_subscriptions = models.PositiveIntegerField(default=0)
+    expired_subscriptions = models.PositiveIntegerField(default=0)
+    active_subscriptions = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = 'daily plan stats'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'plan'], name='unique_daily_plan_stats'),
+        ]
+
+    def __str__(self):
+        return f"{self.plan_id} on {self.date}"
+
+
+class RollupDay(models.Model):
+    # One row per day the rollup has covered; dirty days are recomputed on the
+    # next run. Days after the last clean one haven't been rolled up yet.
+    date = models.DateField(primary_key=True)
+    dirty = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"{self.date} ({'dirty' if self.dirty else 'clean'})"
+
+
+class ImportCheckpoint(models.Model):
+    # Progress of a named `manage.py import_data` run, updated in the same
+    # transaction as each imported batch so a failed run can be resumed
+    name = models.CharField(max_length=255, primary_key=True)
+    kind = models.CharField(max_length=20)
+    records = models.PositiveBigIntegerField(default=0)
+    imported = models.PositiveBigIntegerField(default=0)
+    failed = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.records} {self.kind} records"
@@ -0,0 +1,98 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection
+
+from .imaging import render_proof_variants
+from .models import Payment
+
+# Background processing of payment proofs: the thumbnail shown in the admin
+# changelist and a compressed review copy. Pillow work runs in a process pool
+# so uploads return as soon as the payment row is committed.
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def is_enabled():
+    return getattr(settings, 'PAYMENT_PROOF_PIPELINE_ENABLED', True)
+
+
+def create_executor(workers=None):
+    # Spawned workers import only Pillow, not a copy of the server process
+    return ProcessPoolExecutor(
+        max_workers=workers or getattr(settings, 'PAYMENT_PROOF_WORKERS', 2),
+        mp_context=multiprocessing.get_context('spawn'),
+    )
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = create_executor()
+        return _executor
+
+
+def proof_job(payment):
+    """Return (thumbnail_name, review_name, render args) for a payment's proof"""
+    # Variants are keyed by content hash, so duplicate uploads share them
+    key = payment.proof_sha256 or f"payment-{payment.pk}"
+    thumbnail_name = f"payment_proofs/thumbnails/{key}.jpg"
+    review_name = f"payment_proofs/review/{key}.jpg"
+    args = (
+        payment.payment_proof.path,
+        default_storage.path(thumbnail_name),
+        default_storage.path(review_name),
+        getattr(settings, 'PAYMENT_PROOF_THUMBNAIL_SIZE', (160, 160)),
+        getattr(settings, 'PAYMENT_PROOF_REVIEW_SIZE', (1600, 1600)),
+        getattr(settings, 'PAYMENT_PROOF_JPEG_QUALITY', 75),
+    )
+    return thumbnail_name, review_name, args
+
+
+def apply_result(payment, thumbnail_name, review_name, error):
+    """Set the variant fields on a payment from a render result (not saved)"""
+    if error:
+        payment.proof_error = error[:255]
+    else:
+        payment.proof_thumbnail = thumbnail_name
+        payment.proof_review = review_name
+        payment.proof_error = ''
+
+
+def _record(payment_id, thumbnail_name, review_name, error):
+    if error:
+        Payment.objects.filter(pk=payment_id).update(proof_error=error[:255])
+    else:
+        Payment.objects.filter(pk=payment_id).update(
+            proof_thumbnail=thumbnail_name, proof_review=review_name, proof_error=''
+        )
+
+
+def submit(payment):
+    """Queue a payment's proof for processing without waiting for it"""
+    thumbnail_name, review_name, args = proof_job(payment)
+    if default_storage.exists(thumbnail_name) and default_storage.exists(review_name):
+        # Same image was processed for an earlier upload
+        _record(payment.pk, thumbnail_name, review_name, None)
+        return
+
+    payment_id = payment.pk
+
+    def done(future):
+        try:
+            _record(payment_id, thumbnail_name, review_name, future.result())
+        except Exception:
+            logger.exception("Processing the proof of payment %s failed", payment_id)
+        finally:
+            # Callbacks run on the executor's own thread, which has its own connection
+            connection.close()
+
+    get_executor().submit(render_proof_variants, *args).add_done_callback(done)
@@ -0,0 +1,224 @@
+import hashlib
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+# Read-replica routing. Writes, transactions and everything outside a request
+# (jobs, management commands) use the primary ("default"). Safe requests read
+# from the DATABASE_REPLICAS aliases via ReplicaRoutingMiddleware, each request
+# from one replica, round-robin over the healthy ones. A client that just sent
+# a write is pinned to the primary for DATABASE_REPLICA_STICKY_SECONDS so it
+# reads its own writes. The pin is stored in the DATABASE_REPLICA_PIN_CACHE
+# cache, keyed by the user id in the client's JWT (which survives token
+# refreshes) or a hash of its session cookie; that cache has to be shared by
+# all worker processes (see check_pin_cache). Reads that fill a cache (plan
+# catalog, users, entitlements) always use the primary, so a lagging replica
+# can't leave stale data behind in it.
+
+logger = logging.getLogger(__name__)
+
+PIN_PREFIX = 'db-primary-pin'
+# Cache backends that only live inside one process
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# The replica_reads() block in effect: {} until its first read picks a replica
+_replica_block = ContextVar('replica_block', default=None)
+_next = itertools.count()
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Let the reads in this block go to a replica (or force the primary with enabled=False).
+
+    The replica is chosen on the first read and used for the whole block, so
+    one request doesn't see data from replicas at different points.
+    """
+    token = _replica_block.set({} if enabled else None)
+    try:
+        yield
+    finally:
+        _replica_block.reset(token)
+
+
+def client_key(request):
+    """Who sent the request, or None for anonymous requests.
+
+    The user id from a valid JWT, so the key stays the same across token
+    refreshes, otherwise a hash of the session cookie.
+    """
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    if header is not None:
+        try:
+            raw_token = authentication.get_raw_token(header)
+            if raw_token is not None:
+                return f"user:{authentication.get_validated_token(raw_token)[api_settings.USER_ID_CLAIM]}"
+        except (AuthenticationFailed, KeyError):
+            return None
+    session = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not session:
+        return None
+    return f"session:{hashlib.sha256(session.encode()).hexdigest()[:32]}"
+
+
+def pin_cache():
+    return caches[getattr(settings, 'DATABASE_REPLICA_PIN_CACHE', 'default')]
+
+
+def pin_to_primary(key):
+    pin_cache().set(f"{PIN_PREFIX}:{key}", True, getattr(settings, 'DATABASE_REPLICA_STICKY_SECONDS', 5))
+
+
+def pinned_to_primary(key):
+    return pin_cache().get(f"{PIN_PREFIX}:{key}") is not None
+
+
+def check_pin_cache(app_configs, **kwargs):
+    """System check: pins only hold across workers in a shared cache"""
+    if not replicas():
+        return []
+    alias = getattr(settings, 'DATABASE_REPLICA_PIN_CACHE', 'default')
+    if settings.CACHES.get(alias, {}).get('BACKEND') in LOCAL_CACHE_BACKENDS:
+        return [checks.Warning(
+            f"DATABASE_REPLICAS is set but the {alias!r} cache, which holds the primary pins, is local to each process.",
+            hint="Point DATABASE_REPLICA_PIN_CACHE at a cache shared by all workers (e.g. Redis or Memcached), "
+                 "or clients may not read their own writes.",
+            id='subscriptions.W001',
+        )]
+    return []
+
+
+class ReplicaHealth:
+    """Per-alias health of the replicas in this process, re-probed every
+    DATABASE_REPLICA_HEALTH_CHECK_INTERVAL seconds.
+
+    A probe opens (or reuses) this thread's connection to the replica, runs a
+    query and, on PostgreSQL, checks that replay lag is under
+    DATABASE_REPLICA_MAX_LAG seconds. A replica that fails is skipped until
+    the next probe succeeds.
+    """
+
+    LAG_SQL = (
+        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = {}
+
+    def healthy(self, alias):
+        interval = getattr(settings, 'DATABASE_REPLICA_HEALTH_CHECK_INTERVAL', 10)
+        now = time.monotonic()
+        with self._lock:
+            healthy, checked_at = self._state.get(alias, (None, None))
+            if checked_at is not None and now - checked_at < interval:
+                return healthy
+            # Claim the probe; other threads keep the last result meanwhile
+            self._state[alias] = (healthy is not False, now)
+        healthy = self.probe(alias)
+        with self._lock:
+            self._state[alias] = (healthy, now)
+        return healthy
+
+    def probe(self, alias):
+        try:
+            connection = connections[alias]
+            with connection.cursor() as cursor:
+                if connection.vendor == 'postgresql':
+                    cursor.execute(self.LAG_SQL)
+                    lag = cursor.fetchone()[0]
+                    max_lag = getattr(settings, 'DATABASE_REPLICA_MAX_LAG', 30)
+                    if lag is not None and lag > max_lag:
+                        logger.warning("Replica %s is %.1fs behind; reading from the primary", alias, lag)
+                        return False
+                else:
+                    cursor.execute("SELECT 1")
+        except Exception as e:
+            # Includes connection errors, unknown aliases and databases the current test may not use
+            logger.warning("Replica %s failed its health check: %s", alias, e)
+            return False
+        return True
+
+    def mark_down(self, alias):
+        with self._lock:
+            self._state[alias] = (False, time.monotonic())
+
+    def reset(self):
+        with self._lock:
+            self._state.clear()
+
+
+health = ReplicaHealth()
+
+
+def replica_error_wrapper(execute, sql, params, many, context):
+    """Take a replica out of rotation as soon as it fails a query with a connection error"""
+    try:
+        return execute(sql, params, many, context)
+    except OperationalError:
+        health.mark_down(context['connection'].alias)
+        raise
+
+
+def install_replica_wrapper(sender, connection, **kwargs):
+    """connection_created handler: add replica_error_wrapper to replica connections"""
+    if connection.alias in replicas() and replica_error_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(replica_error_wrapper)
+
+
+def choose_replica():
+    """The next healthy replica alias, or None when there is none"""
+    aliases = replicas()
+    for _ in range(len(aliases)):
+        alias = aliases[next(_next) % len(aliases)]
+        if health.healthy(alias):
+            return alias
+    return None
+
+
+class ReplicaRouter:
+    """Route reads to replicas where replica_reads() allows it, everything else to the primary"""
+
+    def db_for_read(self, model, **hints):
+        block = _replica_block.get()
+        if block is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Related objects come from wherever the instance was loaded
+            return instance._state.db
+        if 'alias' not in block:
+            block['alias'] = choose_replica() or DEFAULT_DB_ALIAS
+        return block['alias']
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema from the primary through replication
+        return False if db in replicas() else None
@@ -0,0 +1,159 @@
+from dateutil.relativedelta import relativedelta
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Exists, Q
+from django.utils import timezone
+
+from . import analytics, cache
+from .models import CurrentSubscription, Payment, SubscriptionPlan, UserSubscription
+
+# Batch operations used by the admin and API. They work on whole sets of rows
+# with a fixed number of queries, so they bypass the per-row save() logic and
+# keep the current-subscription pointers and entitlement cache in sync here.
+
+
+def after_bulk_write(user_ids):
+    """Refresh current-subscription pointers and cached entitlements after bulk writes"""
+    CurrentSubscription.refresh_for_users(user_ids)
+    cache.invalidate_many(user_ids)
+    transaction.on_commit(lambda: cache.invalidate_many(user_ids))
+
+
+def payment_eligibility(user_id, plan_id, today=None):
+    """Return what a payment upload needs to know about (user, plan) in one query.
+
+    The result has the ``plan`` (None if there is no such plan) and whether
+    the user has a ``pending_payment`` or an ``active`` subscription.
+    """
+    today = today or timezone.now().date()
+    plan = (
+        SubscriptionPlan.objects.filter(pk=plan_id)
+        .annotate(
+            user_has_pending_payment=Exists(
+                Payment.objects.filter(user_id=user_id, is_verified=False)
+            ),
+            user_has_active_subscription=Exists(
+                CurrentSubscription.objects.filter(user_id=user_id, subscription__end_date__gte=today)
+            ),
+        )
+        .first()
+    )
+    return {
+        'plan': plan,
+        'pending_payment': bool(plan and plan.user_has_pending_payment),
+        'active': bool(plan and plan.user_has_active_subscription),
+    }
+
+
+def live_subscription_users(user_ids, today=None):
+    """The users with a subscription that hasn't ended yet, whatever its status.
+
+    Same rule as the single-create endpoint; ACTIVE rows always count so
+    inserts can't trip the one-active-subscription constraint.
+    """
+    today = today or timezone.now().date()
+    return set(
+        UserSubscription.objects.filter(Q(status='ACTIVE') | Q(end_date__gte=today), user_id__in=user_ids)
+        .values_list('user_id', flat=True)
+    )
+
+
+def verify_payments(payment_ids, today=None):
+    """Verify pending payments and create their subscriptions in one transaction.
+
+    Payments without a plan, already verified or linked, or whose user still
+    has an active subscription are skipped. Returns a dict with the verified
+    payments and the skipped ones.
+    """
+    today = today or timezone.now().date()
+    with transaction.atomic():
+        payments = list(
+            Payment.objects.select_for_update(of=('self',))
+            .select_related('plan')
+            .filter(pk__in=payment_ids, is_verified=False, subscription__isnull=True, plan__isnull=False)
+            .order_by('pk')
+        )
+        user_ids = {payment.user_id for payment in payments}
+
+        # Retire lapsed subscriptions, then leave out users who still have a live one
+        UserSubscription.retire_lapsed(user_ids, today)
+        subscribed = live_subscription_users(user_ids, today)
+        to_verify = [payment for payment in payments if payment.user_id not in subscribed]
+
+        subscriptions = UserSubscription.objects.bulk_create([
+            UserSubscription(
+                user_id=payment.user_id,
+                plan=payment.plan,
+                start_date=today,
+                end_date=today + relativedelta(months=payment.plan.duration_months),
+            )
+            for payment in to_verify
+        ])
+        for payment, subscription in zip(to_verify, subscriptions):
+            payment.subscription = subscription
+            payment.is_verified = True
+        Payment.objects.bulk_update(to_verify, ['subscription', 'is_verified'])
+        after_bulk_write(user_ids)
+        analytics.mark_subscriptions_dirty(subscriptions, today)
+
+    verified_ids = {payment.pk for payment in to_verify}
+    return {
+        'verified': to_verify,
+        'skipped': [pk for pk in payment_ids if pk not in verified_ids],
+    }
+
+
+def provision_subscriptions(entries, today=None):
+    """Create subscriptions for many (user, plan, start_date) entries at once.
+
+    ``entries`` is a list of dicts with ``user`` and ``plan`` ids and an
+    optional ``start_date`` (defaults to today). Existing subscriptions are
+    checked with one query, end dates are computed in one pass and the rows
+    are inserted with bulk_create. Returns one result dict per entry, in
+    order, with either the new subscription ``id`` or an ``error``.
+    """
+    today = today or timezone.now().date()
+    user_ids = {entry['user'] for entry in entries}
+    with transaction.atomic():
+        plans = SubscriptionPlan.objects.in_bulk({entry['plan'] for entry in entries})
+        existing_users = set(
+            get_user_model().objects.filter(pk__in=user_ids).values_list('pk', flat=True)
+        )
+        UserSubscription.retire_lapsed(user_ids, today)
+        subscribed = live_subscription_users(user_ids, today)
+
+        results = []
+        to_create = []
+        end_dates = {}
+        for index, entry in enumerate(entries):
+            plan = plans.get(entry['plan'])
+            if entry['user'] not in existing_users:
+                error = "User not found."
+            elif plan is None:
+                error = "Plan not found."
+            elif entry['user'] in subscribed:
+                error = "User already has an active subscription."
+            else:
+                error = None
+            if error:
+                results.append({'index': index, 'error': error})
+                continue
+
+            subscribed.add(entry['user'])
+            start_date = entry.get('start_date') or today
+            key = (start_date, plan.duration_months)
+            if key not in end_dates:
+                end_dates[key] = start_date + relativedelta(months=plan.duration_months)
+            to_create.append(UserSubscription(
+                user_id=entry['user'], plan=plan, start_date=start_date, end_date=end_dates[key],
+            ))
+            results.append({'index': index})
+
+        created = UserSubscription.objects.bulk_create(to_create, batch_size=1000)
+        remaining = iter(created)
+        for result in results:
+            if 'error' not in result:
+                result['id'] = next(remaining).pk
+        after_bulk_write(user_ids)
+        analytics.mark_subscriptions_dirty(created, today)
+    return results
@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import analytics, cache, catalog, metrics, proof_pipeline, routers
+from .authentication import invalidate_user
+from .models import CurrentSubscription, Payment, SubscriptionPlan, UserSubscription
+
+
+@receiver(post_save, sender=UserSubscription)
+@receiver(post_delete, sender=UserSubscription)
+@receiver(post_save, sender=CurrentSubscription)
+@receiver(post_delete, sender=CurrentSubscription)
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def invalidate_entitlement(sender, instance, **kwargs):
+    cache.invalidate(instance.user_id)
+    # Drop it again once the write is visible to other connections, in case a
+    # concurrent reader cached the pre-commit state in between
+    transaction.on_commit(lambda: cache.invalidate(instance.user_id))
+
+
+@receiver(post_save, sender=UserSubscription)
+@receiver(post_delete, sender=UserSubscription)
+def mark_subscription_stats_dirty(sender, instance, **kwargs):
+    analytics.mark_subscriptions_dirty([instance])
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def mark_payment_stats_dirty(sender, instance, **kwargs):
+    # Revenue is booked on the start date of the paid subscription
+    if instance.subscription_id:
+        start_date = (
+            UserSubscription.objects.filter(pk=instance.subscription_id)
+            .values_list('start_date', flat=True)
+            .first()
+        )
+        if start_date:
+            analytics.mark_days_dirty([start_date])
+
+
+@receiver(post_save, sender=SubscriptionPlan)
+@receiver(post_delete, sender=SubscriptionPlan)
+def bump_plan_catalog_version(sender, instance, **kwargs):
+    catalog.bump_version()
+    transaction.on_commit(catalog.bump_version)
+
+
+@receiver(post_save, sender=Payment)
+def process_payment_proof(sender, instance, created, **kwargs):
+    if created and instance.payment_proof and proof_pipeline.is_enabled():
+        transaction.on_commit(lambda: proof_pipeline.submit(instance))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+    transaction.on_commit(lambda: invalidate_user(instance.pk))
+
+
+# Count SQL queries and their time for the request metrics
+connection_created.connect(metrics.install_sql_wrapper)
+connection_created.connect(routers.install_replica_wrapper)
@@ -0,0 +1,58 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files.storage import FileSystemStorage, storages
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """File system storage that names files after the SHA-256 of their content.
+
+    Uploads are streamed chunk by chunk into a temporary file while being
+    hashed, then moved to ``<upload_to>/<aa>/<sha256><ext>``. Identical files
+    end up at the same path, so a re-uploaded screenshot is stored only once.
+    """
+
+    def _save(self, name, content):
+        directory, basename = posixpath.split(name)
+        extension = os.path.splitext(basename)[1].lower()
+        os.makedirs(self.path(directory), exist_ok=True)
+
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.path(directory), suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            hexdigest = digest.hexdigest()
+            name = posixpath.join(directory, hexdigest[:2], hexdigest + extension)
+            full_path = self.path(name)
+            if os.path.exists(full_path):
+                # Same content is already stored
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                os.replace(tmp_path, full_path)
+                if self.file_permissions_mode is not None:
+                    os.chmod(full_path, self.file_permissions_mode)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        # Names are derived from the content in _save, so never add suffixes
+        return name
+
+    def content_hash(self, name):
+        """SHA-256 of a file saved by this storage, taken from its name"""
+        return os.path.splitext(posixpath.basename(name))[0]
+
+
+def payment_proof_storage():
+    return storages['payment_proofs']
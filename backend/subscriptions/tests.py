@@ -1,3 +1,1470 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import io
+import json
+import tempfile
+from unittest import mock, skipUnless
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
 
-# Create your tests here.
+from dateutil.relativedelta import relativedelta
+from PIL import Image
+
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.conf import settings
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .models import CurrentSubscription, DailyPlanStats, ImportCheckpoint, Payment, SubscriptionPlan, UserSubscription
+from .jobs import expire_subscriptions, process_payment_proofs, renew_subscriptions, rollup_daily_stats
+from . import cache as entitlements, catalog, compression, exports, metrics, proof_pipeline, routers
+from .api import renderers
+from .api.views import ExportView, PaymentCreateView
+from .api.compiled import DAILY_STATS_ROWS, PAYMENT_ROWS, SUBSCRIPTION_ROWS
+from .api.serializers import DailyPlanStatsSerializer, PaymentSerializer, UserSubscriptionSerializer
+from .benchmarking.load import SCENARIOS, prepare_fixture
+from .benchmarking.seed import seed
+from .imports import import_records, read_records
+from .storage import ContentAddressedStorage
+from .authentication import CachedJWTAuthentication
+from .middleware import CompressionMiddleware, ReplicaRoutingMiddleware
+from .urls import urlpatterns
+from .services import verify_payments
+
+
+class QueryBudgetTestCase(TestCase):
+    """Fixture with enough rows that an N+1 query shows up in the counts"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com')
+        cls.plans = [
+            SubscriptionPlan.objects.create(name=f"Plan {i}", price=100 * (i + 1), duration_months=i + 1)
+            for i in range(3)
+        ]
+        cls.users = [User.objects.create_user(f"user{i}") for i in range(6)]
+        for i, user in enumerate(cls.users):
+            plan = cls.plans[i % len(cls.plans)]
+            UserSubscription.objects.create(user=user, plan=plan, start_date=date(2020, 1, 1))
+            subscription = UserSubscription.objects.create(user=user, plan=plan, start_date=date.today())
+            Payment.objects.create(
+                user=user, plan=plan, subscription=subscription,
+                payment_proof='payment_proofs/proof.png', is_verified=True,
+            )
+        cls.user = cls.users[0]
+
+
+class APIQueryBudgetTests(QueryBudgetTestCase):
+    def setUp(self):
+        # Subscription lists take their plans from the catalog, loaded once per version
+        catalog.get_plans(catalog.get_version())
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertQueryBudget(self, budget, url):
+        with self.assertNumQueries(budget):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_plan_list(self):
+        # Served from the in-process catalog once it has been loaded
+        self.client.get(reverse('plan-list-create'))
+        self.assertQueryBudget(0, reverse('plan-list-create'))
+
+    def test_plan_detail(self):
+        self.client.get(reverse('plan-list-create'))
+        self.assertQueryBudget(0, reverse('plan-retrieve-update-destroy', args=[self.plans[0].pk]))
+
+    def test_subscription_list(self):
+        response = self.assertQueryBudget(1, reverse('subscription-list-create'))
+        self.assertEqual(len(response.data['results']), 12)
+
+    def test_subscription_detail(self):
+        subscription = UserSubscription.objects.filter(user=self.user).first()
+        self.assertQueryBudget(1, reverse('subscription-retrieve-update-destroy', args=[subscription.pk]))
+
+    def test_user_subscriptions(self):
+        response = self.assertQueryBudget(1, reverse('user-subscriptions', args=[self.user.pk]))
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_user_current_subscription(self):
+        self.assertQueryBudget(1, reverse('user-current-subscription', args=[self.user.pk]))
+
+    def test_user_detail(self):
+        self.assertQueryBudget(0, reverse('user-detail'))
+
+    def test_payment_list(self):
+        self.assertQueryBudget(1, reverse('payment-list'))
+
+
+class CursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('paged')
+        plan = SubscriptionPlan.objects.create(name='Monthly', price=100, duration_months=1)
+        # Every row shares an end_date, so only the id tells them apart
+        cls.subscriptions = [
+            UserSubscription.objects.create(
+                user=cls.user, plan=plan, start_date=date(2020, 1, 1), end_date=date(2020, 2, 1), status='EXPIRED',
+            )
+            for _ in range(7)
+        ]
+
+    def setUp(self):
+        catalog.get_plans(catalog.get_version())
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def pages(self, url):
+        while url:
+            data = self.client.get(url).json()
+            yield [row['id'] for row in data['results']]
+            url = data['next']
+
+    def test_walks_every_row_once(self):
+        url = reverse('user-subscriptions', args=[self.user.pk]) + '?page_size=3'
+        pages = list(self.pages(url))
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), sorted((s.pk for s in self.subscriptions), reverse=True))
+
+    def test_rows_added_between_pages(self):
+        url = reverse('user-subscriptions', args=[self.user.pk]) + '?page_size=3'
+        pages = self.pages(url)
+        seen = next(pages)
+        UserSubscription.objects.create(
+            user=self.user, plan=self.subscriptions[0].plan, start_date=date(2020, 1, 1), status='EXPIRED',
+        )
+        for page in pages:
+            seen += page
+        # The new row sorts before the cursor, so it neither shifts nor repeats later pages
+        self.assertEqual(seen, sorted((s.pk for s in self.subscriptions), reverse=True))
+
+    def test_page_size_is_capped(self):
+        url = reverse('user-subscriptions', args=[self.user.pk])
+        with override_settings(API_PAGE_SIZE=2, API_MAX_PAGE_SIZE=4):
+            self.assertEqual(len(self.client.get(url).json()['results']), 2)
+            self.assertEqual(len(self.client.get(url, {'page_size': 100}).json()['results']), 4)
+
+
+class GoldenSerializationTests(QueryBudgetTestCase):
+    # The compiled list path must produce exactly the bytes of the
+    # ModelSerializer + JSONRenderer path it replaces
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        plan = SubscriptionPlan.objects.create(name="Ünïcode \u2028 \"plan\"\n", price='9.50', duration_months=2)
+        cls.plans.append(plan)
+        first = UserSubscription.objects.create(user=cls.user, plan=plan, status='CANCELED')
+        UserSubscription.objects.create(
+            user=cls.users[1], plan=plan, start_date=date(2021, 5, 31), status='EXPIRED', renewed_from=first,
+        )
+        Payment.objects.create(user=cls.user, plan=plan, payment_proof='')
+        rollup_daily_stats(today=date.today(), since=date.today() - timedelta(days=3))
+
+    def setUp(self):
+        self.request = APIRequestFactory().get('/')
+
+    def assertGolden(self, rows, serializer_class, queryset):
+        context = {'request': self.request}
+        expected = JSONRenderer().render(serializer_class(queryset, many=True, context=context).data)
+        data = rows.serialize(queryset.values(*rows.columns), context)
+        self.assertEqual(renderers.FastJSONRenderer().render(data), expected)
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assertEqual(renderers.FastJSONRenderer().render(data), expected)
+
+    def test_subscriptions(self):
+        self.assertGolden(SUBSCRIPTION_ROWS, UserSubscriptionSerializer, UserSubscription.objects.order_by('id'))
+
+    def test_payments(self):
+        self.assertGolden(PAYMENT_ROWS, PaymentSerializer, Payment.objects.order_by('id'))
+
+    def test_plans_missing_from_the_catalog_load_in_one_query(self):
+        queryset = UserSubscription.objects.order_by('id')
+        rows = list(queryset.values(*SUBSCRIPTION_ROWS.columns))
+        context = {'request': self.request}
+        with mock.patch.object(catalog, 'get_version', return_value='stale'), \
+                mock.patch.object(catalog, 'get_plans', return_value=([], {})), \
+                self.assertNumQueries(1):
+            data = SUBSCRIPTION_ROWS.serialize(rows, context)
+        self.assertGreater(len({row['plan_id'] for row in rows}), 1)
+        expected = JSONRenderer().render(UserSubscriptionSerializer(queryset, many=True, context=context).data)
+        self.assertEqual(renderers.FastJSONRenderer().render(data), expected)
+
+    def test_daily_stats(self):
+        self.assertTrue(DailyPlanStats.objects.exists())
+        self.assertGolden(DAILY_STATS_ROWS, DailyPlanStatsSerializer, DailyPlanStats.objects.order_by('date', 'plan_id'))
+
+    def test_list_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get(reverse('user-subscriptions', args=[self.user.pk]))
+        subscriptions = UserSubscription.objects.filter(user=self.user).order_by('-id')
+        expected = JSONRenderer().render({
+            'next': None, 'previous': None, 'results': UserSubscriptionSerializer(subscriptions, many=True).data,
+        })
+        self.assertEqual(response.content, expected)
+
+
+class SparseFieldsetTests(QueryBudgetTestCase):
+    def setUp(self):
+        catalog.get_plans(catalog.get_version())
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.subscription = UserSubscription.objects.filter(user=self.user).latest('id')
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json(), ' '.join(query['sql'] for query in queries.captured_queries)
+
+    def test_list_fields(self):
+        data, sql = self.get(reverse('user-subscriptions', args=[self.user.pk]), fields='status,plan,id')
+        self.assertEqual(list(data['results'][0]), ['id', 'plan', 'status'])
+        self.assertEqual(data['results'][0]['plan'], self.subscription.plan_id)
+        self.assertNotIn('auto_renew', sql)
+
+    def test_expand(self):
+        data, _ = self.get(reverse('payment-list'), fields='id,plan', expand='plan')
+        self.assertEqual(data['results'][0]['plan']['name'], self.subscription.plan.name)
+        data, _ = self.get(reverse('payment-list'), expand='plan')
+        self.assertIn('payment_proof', data['results'][0])
+        self.assertEqual(data['results'][0]['plan']['id'], self.subscription.plan_id)
+
+    def test_detail_matches_list(self):
+        params = {'fields': 'id,is_active,plan,end_date', 'expand': 'plan'}
+        listed, _ = self.get(reverse('user-subscriptions', args=[self.user.pk]), **params)
+        detail, sql = self.get(reverse('subscription-retrieve-update-destroy', args=[self.subscription.pk]), **params)
+        self.assertEqual(detail, listed['results'][0])
+        self.assertNotIn('auto_renew', sql)
+
+    def test_current_subscription(self):
+        with self.assertNumQueries(1):
+            data, sql = self.get(reverse('user-current-subscription', args=[self.user.pk]), fields='status,plan')
+        self.assertEqual(data, {'plan': self.subscription.plan_id, 'status': 'ACTIVE'})
+        self.assertNotIn('subscriptionplan', sql)
+
+    def test_plans(self):
+        data, _ = self.get(reverse('plan-list-create'), fields='name')
+        self.assertEqual(data, [{'name': plan.name} for plan in self.plans])
+
+    def test_unknown_names(self):
+        response = self.client.get(reverse('payment-list'), {'fields': 'id,secret'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('secret', response.json()['fields'][0])
+        response = self.client.get(reverse('subscription-retrieve-update-destroy', args=[self.subscription.pk]), {'expand': 'user'})
+        self.assertEqual(response.status_code, 400)
+
+
+class AdminQueryBudgetTests(QueryBudgetTestCase):
+    # Session and user lookups, the changelist count queries and the page
+    # itself; the budget must not grow with the number of rows listed
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def assertQueryBudget(self, budget, url):
+        with self.assertNumQueries(budget):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_plan_changelist(self):
+        self.assertQueryBudget(5, reverse('admin:subscriptions_subscriptionplan_changelist'))
+
+    def test_subscription_changelist(self):
+        self.assertQueryBudget(6, reverse('admin:subscriptions_usersubscription_changelist'))
+
+    def test_payment_changelist(self):
+        self.assertQueryBudget(6, reverse('admin:subscriptions_payment_changelist'))
+
+
+class PlanCatalogCachingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.plan = SubscriptionPlan.objects.create(name='Monthly', price=100, duration_months=1)
+
+    def test_not_modified_without_database(self):
+        response = self.client.get(reverse('plan-list-create'))
+        self.assertIn('max-age', response['Cache-Control'])
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('plan-list-create'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_saving_a_plan_changes_the_etag(self):
+        etag = self.client.get(reverse('plan-list-create'))['ETag']
+        self.plan.price = 150
+        self.plan.save()
+        response = self.client.get(reverse('plan-list-create'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()[0]['price'], '150.00')
+
+    def test_workers_with_local_caches_converge(self):
+        # Each LocMemCache stands in for the cache of one worker process
+        worker_a, worker_b = LocMemCache('worker-a', {}), LocMemCache('worker-b', {})
+        with mock.patch.object(catalog, 'cache', worker_a):
+            version = catalog.get_version()
+        with mock.patch.object(catalog, 'cache', worker_b):
+            # Same plans, same version (and ETag) in every process
+            self.assertEqual(catalog.get_version(), version)
+            self.plan.price = 150
+            self.plan.save()
+            changed = catalog.get_version()
+        self.assertNotEqual(changed, version)
+
+        now = datetime.now().timestamp()
+        with mock.patch.object(catalog, 'cache', worker_a):
+            # Worker A only sees the change once its cached version expires
+            self.assertEqual(catalog.get_version(), version)
+            with mock.patch('time.time', return_value=now + settings.PLAN_CATALOG_VERSION_TTL + 1):
+                self.assertEqual(catalog.get_version(), changed)
+                plans, _ = catalog.get_plans(changed)
+        self.assertEqual(plans[0]['price'], '150.00')
+
+
+class CurrentSubscriptionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.plan = SubscriptionPlan.objects.create(name='Monthly', price=100, duration_months=1)
+        cls.user = User.objects.create_user('subscriber')
+
+    def current(self, user=None):
+        return CurrentSubscription.objects.filter(user=user or self.user).values_list('subscription_id', flat=True).first()
+
+    def subscribe(self, start_date, **kwargs):
+        return UserSubscription.objects.create(
+            user=self.user, plan=self.plan, start_date=start_date, status='EXPIRED', **kwargs
+        )
+
+    def test_follows_the_latest_end_date(self):
+        older = self.subscribe(date(2020, 1, 1))
+        self.assertEqual(self.current(), older.pk)
+        newer = self.subscribe(date(2021, 1, 1))
+        self.assertEqual(self.current(), newer.pk)
+
+        older.end_date = date(2022, 1, 1)
+        older.save()
+        self.assertEqual(self.current(), older.pk)
+
+        older.delete()
+        self.assertEqual(self.current(), newer.pk)
+        newer.delete()
+        self.assertIsNone(self.current())
+
+    def test_refresh_for_users_after_bulk_changes(self):
+        other = User.objects.create_user('other')
+        first = self.subscribe(date(2020, 1, 1))
+        second = self.subscribe(date(2021, 1, 1))
+        UserSubscription.objects.create(user=other, plan=self.plan, start_date=date(2020, 6, 1), status='EXPIRED')
+        # Queryset updates skip save(), so the pointers are stale until refreshed
+        UserSubscription.objects.filter(pk=first.pk).update(end_date=date(2030, 1, 1))
+        self.assertEqual(self.current(), second.pk)
+
+        nobody = User.objects.create_user('nobody')
+        with self.assertNumQueries(2):
+            CurrentSubscription.refresh_for_users([self.user.pk, other.pk, nobody.pk])
+        self.assertEqual(self.current(), first.pk)
+        self.assertEqual(CurrentSubscription.objects.count(), 2)
+
+
+class PaymentVerificationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.plan = SubscriptionPlan.objects.create(name='Quarterly', price=300, duration_months=3)
+
+    def create_payments(self, count, prefix):
+        payment_ids = []
+        for i in range(count):
+            user = User.objects.create_user(f"{prefix}{i}")
+            payment = Payment.objects.create(user=user, plan=self.plan, payment_proof='payment_proofs/proof.png')
+            payment_ids.append(payment.pk)
+        return payment_ids
+
+    def verify_counting_queries(self, payment_ids):
+        with CaptureQueriesContext(connection) as queries:
+            result = verify_payments(payment_ids)
+        return len(queries), result
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        small, _ = self.verify_counting_queries(self.create_payments(2, 'small'))
+        large, result = self.verify_counting_queries(self.create_payments(20, 'large'))
+        self.assertEqual(small, large)
+        self.assertEqual(len(result['verified']), 20)
+
+    def test_creates_linked_subscriptions(self):
+        payment_ids = self.create_payments(2, 'user')
+        verify_payments(payment_ids)
+        for payment in Payment.objects.filter(pk__in=payment_ids):
+            self.assertTrue(payment.is_verified)
+            subscription = payment.subscription
+            self.assertEqual(subscription.end_date, subscription.start_date + relativedelta(months=3))
+            self.assertEqual(CurrentSubscription.objects.get(user=payment.user).subscription, subscription)
+
+    def test_skips_users_with_an_active_subscription(self):
+        payment_id, = self.create_payments(1, 'active')
+        user = Payment.objects.get(pk=payment_id).user
+        UserSubscription.objects.create(user=user, plan=self.plan, start_date=date.today())
+        result = verify_payments([payment_id])
+        self.assertEqual(result['skipped'], [payment_id])
+        self.assertFalse(Payment.objects.get(pk=payment_id).is_verified)
+
+    def test_skips_users_with_a_live_pending_subscription(self):
+        payment_id, = self.create_payments(1, 'pending')
+        user = Payment.objects.get(pk=payment_id).user
+        UserSubscription.objects.create(user=user, plan=self.plan, start_date=date.today(), status='PENDING')
+        self.assertEqual(verify_payments([payment_id])['skipped'], [payment_id])
+        self.assertEqual(UserSubscription.objects.filter(user=user).count(), 1)
+
+
+class ConstraintMigrationTests(TransactionTestCase):
+    # 0013 adds the one-pending-payment and one-active-subscription constraints
+    # to tables that may already break them
+    before = [('subscriptions', '0012_currentsubscription')]
+    after = [('subscriptions', '0013_subscription_indexes_and_constraints')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        self.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_resolves_duplicate_pending_payments(self):
+        apps = self.migrate(self.before)
+        User = apps.get_model('auth', 'User')
+        Payment = apps.get_model('subscriptions', 'Payment')
+        plan = apps.get_model('subscriptions', 'SubscriptionPlan').objects.create(name='Monthly', price=100, duration_months=1)
+        payer, other = User.objects.create(username='payer'), User.objects.create(username='other')
+        older, newer, single = (
+            Payment.objects.create(user=user, plan=plan, payment_proof='payment_proofs/proof.png')
+            for user in (payer, payer, other)
+        )
+        Payment.objects.filter(pk=older.pk).update(created_at=newer.created_at - timedelta(days=1))
+
+        apps = self.migrate(self.after)
+        payments = apps.get_model('subscriptions', 'Payment').objects.all()
+        self.assertEqual(set(payments.filter(is_verified=False).values_list('pk', flat=True)), {newer.pk, single.pk})
+        # The superseded duplicate is dropped, not approved
+        self.assertFalse(payments.filter(pk=older.pk).exists())
+
+
+class PaymentAdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com')
+        cls.plan = SubscriptionPlan.objects.create(name='Monthly', price=100, duration_months=1)
+        cls.user = User.objects.create_user('payer')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def verify(self, payment):
+        url = reverse('admin:subscriptions_payment_change', args=[payment.pk])
+        return self.client.post(url, {'is_verified': 'on'}, follow=True)
+
+    def test_verifying_creates_the_subscription(self):
+        payment = Payment.objects.create(user=self.user, plan=self.plan, payment_proof='payment_proofs/proof.png')
+        self.verify(payment)
+        payment.refresh_from_db()
+        self.assertTrue(payment.is_verified)
+        self.assertEqual(payment.subscription.status, 'ACTIVE')
+
+    def test_conflict_leaves_the_payment_pending(self):
+        UserSubscription.objects.create(user=self.user, plan=self.plan, start_date=date.today())
+        payment = Payment.objects.create(user=self.user, plan=self.plan, payment_proof='payment_proofs/proof.png')
+        response = self.verify(payment)
+        self.assertIn("already has an active subscription.", [str(message) for message in response.context["messages"]][0])
+        payment.refresh_from_db()
+        self.assertFalse(payment.is_verified)
+        self.assertIsNone(payment.subscription)
+
+    def test_adding_a_second_active_subscription_is_rejected(self):
+        UserSubscription.objects.create(user=self.user, plan=self.plan, start_date=date.today())
+        response = self.client.post(
+            reverse('admin:subscriptions_usersubscription_add'),
+            {'user': self.user.pk, 'plan': self.plan.pk, 'start_date': date.today().isoformat()},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("payer already has an active subscription.", response.context['adminform'].form.non_field_errors())
+        self.assertEqual(UserSubscription.objects.filter(user=self.user).count(), 1)
+
+
+class SubscriptionCreateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('subscriber')
+        cls.plan = SubscriptionPlan.objects.create(name='Monthly', price=100, duration_months=1)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create(self, status='ACTIVE'):
+        return self.client.post(reverse('subscription-list-create'), {
+            'user': self.user.pk, 'plan_id': self.plan.pk, 'start_date': date.today(), 'status': status,
+        })
+
+    def test_rejects_overlap_with_any_unexpired_subscription(self):
+        for status in ('PENDING', 'CANCELED'):
+            with self.subTest(status=status):
+                UserSubscription.objects.filter(user=self.user).delete()
+                UserSubscription.objects.create(user=self.user, plan=self.plan, start_date=date.today(), status=status)
+                self.assertEqual(self.create().status_code, 400)
+                self.assertEqual(self.create(status='PENDING').status_code, 400)
+                self.assertEqual(UserSubscription.objects.filter(user=self.user).count(), 1)
+
+    def test_creates_after_expiry(self):
+        UserSubscription.objects.create(user=self.user, plan=self.plan, start_date=date(2020, 1, 1))
+        self.assertEqual(self.create().status_code, 201)
+
+
+class ContentAddressedStorageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('payer')
+        cls.plan = SubscriptionPlan.objects.create(name='Monthly', price=100, duration_months=1)
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+
+    def stored_files(self):
+        storage = ContentAddressedStorage()
+        directories, _ = storage.listdir('payment_proofs')
+        return sorted(
+            f"{directory}/{name}" for directory in directories for name in storage.listdir(f'payment_proofs/{directory}')[1]
+        )
+
+    def test_names_files_after_their_content(self):
+        # Larger than one chunk, so the hash is built up while streaming
+        content = bytes(range(256)) * 1024
+        digest = hashlib.sha256(content).hexdigest()
+        name = ContentAddressedStorage().save('payment_proofs/Scan.PNG', SimpleUploadedFile('Scan.PNG', content))
+        self.assertEqual(name, f'payment_proofs/{digest[:2]}/{digest}.png')
+        with ContentAddressedStorage().open(name) as stored:
+            self.assertEqual(stored.read(), content)
+        self.assertEqual(self.stored_files(), [f'{digest[:2]}/{digest}.png'])
+
+    def test_identical_uploads_are_stored_once(self):
+        payments = [
+            Payment.objects.create(
+                user=User.objects.create_user(f'payer{i}'), plan=self.plan,
+                payment_proof=SimpleUploadedFile(f'proof{i}.png', b'same screenshot'),
+            )
+            for i in range(2)
+        ]
+        digest = hashlib.sha256(b'same screenshot').hexdigest()
+        self.assertEqual(self.stored_files(), [f'{digest[:2]}/{digest}.png'])
+        for payment in Payment.objects.filter(pk__in=[payment.pk for payment in payments]):
+            self.assertEqual(payment.payment_proof.name, f'payment_proofs/{digest[:2]}/{digest}.png')
+            self.assertEqual(payment.proof_sha256, digest)
+            self.assertEqual(payment.proof_size, len(b'same screenshot'))
+
+    def test_different_content_gets_different_names(self):
+        storage = ContentAddressedStorage()
+        first = storage.save('payment_proofs/proof.png', SimpleUploadedFile('proof.png', b'first'))
+        second = storage.save('payment_proofs/proof.png', SimpleUploadedFile('proof.png', b'second'))
+        self.assertNotEqual(first, second)
+        self.assertEqual(len(self.stored_files()), 2)
+
+
+class ProofPipelineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.plan = SubscriptionPlan.objects.create(name='Monthly', price=100, duration_months=1)
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+
+    def payment(self, username, content):
+        return Payment.objects.create(
+            user=User.objects.create_user(username), plan=self.plan,
+            payment_proof=SimpleUploadedFile('proof.png', content),
+        )
+
+    def png(self, size, color='red'):
+        image = io.BytesIO()
+        Image.new('RGB', size, color).save(image, 'PNG')
+        return image.getvalue()
+
+    def test_renders_variants_and_reports_corrupt_images(self):
+        good = self.payment('good', self.png((2400, 1200)))
+        corrupt = self.payment('corrupt', b'not an image')
+        self.assertEqual(process_payment_proofs(workers=1)['rows'], 2)
+
+        good.refresh_from_db()
+        self.assertEqual(good.proof_thumbnail.name, f'payment_proofs/thumbnails/{good.proof_sha256}.jpg')
+        self.assertEqual(good.proof_error, '')
+        with Image.open(good.proof_thumbnail.path) as thumbnail:
+            self.assertEqual((thumbnail.format, thumbnail.size), ('JPEG', (160, 80)))
+        with Image.open(good.proof_review.path) as review:
+            self.assertEqual((review.format, review.size), ('JPEG', (1600, 800)))
+
+        corrupt.refresh_from_db()
+        self.assertTrue(corrupt.proof_error.startswith('Invalid image'))
+        self.assertFalse(corrupt.proof_thumbnail)
+        # Processed payments, including failed ones, are not picked up again
+        self.assertEqual(process_payment_proofs(workers=1)['rows'], 0)
+
+    def test_duplicate_upload_reuses_variants(self):
+        first = self.payment('first', self.png((32, 32)))
+        process_payment_proofs(workers=1)
+        second = self.payment('second', self.png((32, 32)))
+        with mock.patch.object(proof_pipeline, 'get_executor') as get_executor:
+            proof_pipeline.submit(second)
+        get_executor.assert_not_called()
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(second.proof_thumbnail, first.proof_thumbnail)
+        self.assertEqual(second.proof_review, first.proof_review)
+
+
+class PaymentUploadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('payer')
+        cls.plan = SubscriptionPlan.objects.create(name='Monthly', price=100, duration_months=1)
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, plan_id):
+        image = io.BytesIO()
+        Image.new('RGB', (8, 8)).save(image, 'PNG')
+        proof = SimpleUploadedFile('proof.png', image.getvalue(), content_type='image/png')
+        return self.client.post(reverse('payment-list'), {'plan': plan_id, 'payment_proof': proof})
+
+    def test_upload_takes_two_queries(self):
+        # The eligibility query and the insert, besides the transaction control around it
+        with CaptureQueriesContext(connection) as queries:
+            response = self.upload(self.plan.pk)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['plan'], self.plan.pk)
+        statements = [q['sql'] for q in queries.captured_queries if 'SAVEPOINT' not in q['sql']]
+        self.assertEqual(len(statements), 2, statements)
+
+    def test_rejects_ineligible_uploads(self):
+        self.assertEqual(self.upload(self.plan.pk + 100).status_code, 404)
+        self.upload(self.plan.pk)
+        response = self.upload(self.plan.pk)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], "You already have a pending payment awaiting verification")
+
+
+class EntitlementCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('entitled')
+        cls.plan = SubscriptionPlan.objects.create(name='Monthly', price=100, duration_months=1)
+
+    def setUp(self):
+        cache.clear()
+        entitlements.reset_stats()
+
+    def test_hit_after_miss(self):
+        subscription = UserSubscription.objects.create(user=self.user, plan=self.plan, start_date=date.today())
+        first = entitlements.get_entitlement(self.user.pk)
+        with self.assertNumQueries(0):
+            second = entitlements.get_entitlement(self.user.pk)
+        self.assertEqual(first, second)
+        self.assertEqual(second['plan_id'], self.plan.pk)
+        self.assertEqual(second['end_date'], subscription.end_date)
+        self.assertTrue(second['active'])
+        self.assertEqual(entitlements.stats(), {'hits': 1, 'misses': 1})
+
+    def test_timeout_is_capped_at_end_date(self):
+        today = date.today()
+        UserSubscription.objects.create(user=self.user, plan=self.plan, start_date=today - timedelta(days=30), end_date=today)
+        # One minute before the subscription lapses at the end of its last day
+        now = datetime.combine(today, time(23, 59), tzinfo=dt_timezone.utc)
+        backend = caches[settings.ENTITLEMENT_CACHE_ALIAS]
+        with mock.patch('django.utils.timezone.now', return_value=now), \
+                mock.patch.object(backend, 'set', wraps=backend.set) as cache_set:
+            entitlements.get_entitlement(self.user.pk)
+        self.assertEqual(cache_set.call_args.args[2], 60)
+
+        # Entries for lapsed subscriptions aren't cached at all
+        with mock.patch('django.utils.timezone.now', return_value=now + timedelta(minutes=2)), \
+                mock.patch.object(backend, 'set') as cache_set:
+            self.assertFalse(entitlements.get_entitlement(self.user.pk)['active'])
+        cache_set.assert_not_called()
+
+    def test_subscription_changes_invalidate(self):
+        self.assertIsNone(entitlements.get_entitlement(self.user.pk)['plan_id'])
+        subscription = UserSubscription.objects.create(user=self.user, plan=self.plan, start_date=date.today())
+        self.assertEqual(entitlements.get_entitlement(self.user.pk)['plan_id'], self.plan.pk)
+
+        subscription.end_date = date.today() + timedelta(days=90)
+        subscription.save()
+        self.assertEqual(entitlements.get_entitlement(self.user.pk)['end_date'], subscription.end_date)
+
+        subscription.delete()
+        self.assertIsNone(entitlements.get_entitlement(self.user.pk)['plan_id'])
+        self.assertEqual(entitlements.stats(), {'hits': 0, 'misses': 4})
+
+    def test_payments_invalidate(self):
+        self.assertFalse(entitlements.get_entitlement(self.user.pk)['pending_payment'])
+        Payment.objects.create(user=self.user, plan=self.plan, payment_proof='payment_proofs/proof.png')
+        self.assertTrue(entitlements.get_entitlement(self.user.pk)['pending_payment'])
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('member', 'member@example.com')
+
+    def setUp(self):
+        # Rolled-back rows from other tests don't send signals, so start clean
+        cache.clear()
+        self.refresh = RefreshToken.for_user(self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.refresh.access_token}")
+
+    def test_user_detail_resolves_user_from_cache(self):
+        self.client.get(reverse('user-detail'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('user-detail'))
+        self.assertEqual(response.data['email'], 'member@example.com')
+
+    def test_user_changes_invalidate_the_cache(self):
+        self.client.get(reverse('user-detail'))
+        self.user.email = 'new@example.com'
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('user-detail')).data['email'], 'new@example.com')
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('user-detail')).status_code, 401)
+
+    def test_payment_uploads_authenticate_against_the_database(self):
+        for method, authentication in (('get', CachedJWTAuthentication), ('post', JWTAuthentication)):
+            view = PaymentCreateView()
+            view.setup(getattr(RequestFactory(), method)(reverse('payment-list')))
+            self.assertEqual([type(authenticator) for authenticator in view.get_authenticators()], [authentication])
+
+    def test_token_refresh_without_database(self):
+        url = reverse('token_refresh')
+        self.client.post(url, {'refresh': str(self.refresh)})
+        with self.assertNumQueries(0):
+            response = self.client.post(url, {'refresh': str(self.refresh)})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.data)
+
+
+class SubscriptionProvisioningTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com')
+        cls.plan = SubscriptionPlan.objects.create(name='Yearly', price=1000, duration_months=12)
+        cls.users = [User.objects.create_user(f"seat{i}") for i in range(30)]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def provision(self, entries):
+        return self.client.post(reverse('subscription-batch-create'), entries, format='json')
+
+    def test_reports_a_result_per_entry(self):
+        subscribed = self.users[0]
+        UserSubscription.objects.create(user=subscribed, plan=self.plan, start_date=date.today())
+        response = self.provision([
+            {'user': subscribed.pk, 'plan': self.plan.pk},
+            {'user': self.users[1].pk, 'plan': self.plan.pk, 'start_date': '2025-01-31'},
+            {'user': self.users[2].pk, 'plan': 9999},
+            {'user': self.users[1].pk, 'plan': self.plan.pk},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 1)
+        errors = [result.get('error') for result in response.data['results']]
+        self.assertEqual(errors, [
+            "User already has an active subscription.", None, "Plan not found.",
+            "User already has an active subscription.",
+        ])
+        subscription = UserSubscription.objects.get(pk=response.data['results'][1]['id'])
+        self.assertEqual(subscription.end_date, date(2026, 1, 31))
+        self.assertEqual(CurrentSubscription.objects.get(user=self.users[1]).subscription, subscription)
+
+    def test_rejects_users_with_any_live_subscription(self):
+        for user, status in zip(self.users, ('PENDING', 'CANCELED')):
+            UserSubscription.objects.create(user=user, plan=self.plan, start_date=date.today(), status=status)
+        response = self.provision([{'user': user.pk, 'plan': self.plan.pk} for user in self.users[:2]])
+        self.assertEqual(response.data['created'], 0)
+        self.assertEqual(
+            [result['error'] for result in response.data['results']], ["User already has an active subscription."] * 2,
+        )
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        with CaptureQueriesContext(connection) as small:
+            self.provision([{'user': user.pk, 'plan': self.plan.pk} for user in self.users[:2]])
+        with CaptureQueriesContext(connection) as large:
+            self.provision([{'user': user.pk, 'plan': self.plan.pk} for user in self.users[2:]])
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(UserSubscription.objects.count(), len(self.users))
+
+    def test_requires_staff(self):
+        self.client.force_authenticate(self.users[0])
+        self.assertEqual(self.provision([{'user': self.users[0].pk, 'plan': self.plan.pk}]).status_code, 403)
+
+
+class ExpirySweeperTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.plan = SubscriptionPlan.objects.create(name='Monthly', price=100, duration_months=1)
+        today = date.today()
+        cls.lapsed = [
+            UserSubscription.objects.create(
+                user=User.objects.create_user(f"lapsed{i}"), plan=cls.plan,
+                start_date=today - timedelta(days=40 + i), end_date=today - timedelta(days=1 + i),
+            )
+            for i in range(3)
+        ]
+        cls.live = UserSubscription.objects.create(
+            user=User.objects.create_user('live'), plan=cls.plan, start_date=today, end_date=today + timedelta(days=5),
+        )
+
+    def setUp(self):
+        cache.clear()
+        entitlements.reset_stats()
+
+    def test_expires_only_lapsed_rows(self):
+        self.assertEqual(expire_subscriptions(chunk_size=2)['rows'], 3)
+        self.assertEqual(expire_subscriptions()['rows'], 0)
+        statuses = dict(UserSubscription.objects.values_list('id', 'status'))
+        self.assertEqual({statuses[subscription.pk] for subscription in self.lapsed}, {'EXPIRED'})
+        self.assertEqual(statuses[self.live.pk], 'ACTIVE')
+
+    def test_refreshes_pointers_and_entitlements(self):
+        user_id = self.live.user_id
+        self.assertTrue(entitlements.get_entitlement(user_id)['active'])
+        CurrentSubscription.objects.filter(user_id=user_id).delete()
+
+        expire_subscriptions(today=self.live.end_date + timedelta(days=1))
+        self.assertEqual(CurrentSubscription.objects.get(user_id=user_id).subscription_id, self.live.pk)
+        entitlements.get_entitlement(user_id)
+        self.assertEqual(entitlements.stats(), {'hits': 0, 'misses': 2})
+
+
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('async-user', 'async@example.com')
+        cls.plan = SubscriptionPlan.objects.create(name='Monthly', price=100, duration_months=1)
+        cls.subscriptions = [
+            UserSubscription.objects.create(
+                user=cls.user, plan=cls.plan, start_date=date(2020, 1 + i, 1), status='EXPIRED',
+            )
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.auth = {'headers': {'Authorization': f"Bearer {RefreshToken.for_user(self.user).access_token}"}}
+
+    async def test_user_detail_requires_a_valid_token(self):
+        response = await self.async_client.get(reverse('async-user-detail'), **self.auth)
+        self.assertEqual(response.json(), {'id': self.user.pk, 'username': 'async-user', 'email': 'async@example.com'})
+        for headers in ({}, {'Authorization': 'Bearer'}, {'Authorization': 'Bearer not-a-token'}):
+            with self.subTest(headers=headers):
+                response = await self.async_client.get(reverse('async-user-detail'), headers=headers)
+                self.assertEqual(response.status_code, 401)
+                self.assertIn('detail', response.json())
+
+    async def test_inactive_users_are_rejected(self):
+        await User.objects.filter(pk=self.user.pk).aupdate(is_active=False)
+        response = await self.async_client.get(reverse('async-user-subscriptions', args=[self.user.pk]), **self.auth)
+        self.assertEqual(response.status_code, 401)
+
+    async def test_only_get_is_allowed(self):
+        response = await self.async_client.post(reverse('async-user-detail'), **self.auth)
+        self.assertEqual(response.status_code, 405)
+
+    async def test_subscriptions_page_with_before_cursor(self):
+        url = reverse('async-user-subscriptions', args=[self.user.pk]) + '?page_size=2'
+        ids = []
+        while url:
+            data = (await self.async_client.get(url, **self.auth)).json()
+            self.assertLessEqual(len(data['results']), 2)
+            ids += [row['id'] for row in data['results']]
+            url = data['next']
+        self.assertEqual(ids, sorted((s.pk for s in self.subscriptions), reverse=True))
+
+        response = await self.async_client.get(
+            reverse('async-user-subscriptions', args=[self.user.pk]), {'before': 'x'}, **self.auth
+        )
+        self.assertEqual(response.status_code, 400)
+
+    async def test_matches_sync_current_subscription(self):
+        url = reverse('async-user-current-subscription', args=[self.user.pk])
+        response = await self.async_client.get(url, **self.auth)
+        expected = await self.async_client.get(reverse('user-current-subscription', args=[self.user.pk]), **self.auth)
+        self.assertEqual(response.json(), expected.json())
+        response = await self.async_client.get(reverse('async-user-current-subscription', args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_plan_etag(self):
+        response = await self.async_client.get(reverse('async-plan-list'))
+        self.assertEqual(response.json()[0]['id'], self.plan.pk)
+        response = await self.async_client.get(reverse('async-plan-list'), headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+        response = await self.async_client.get(reverse('async-plan-detail', args=[self.plan.pk + 1]))
+        self.assertEqual(response.status_code, 404)
+
+
+class RenewalEngineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.plan = SubscriptionPlan.objects.create(name='Monthly', price=100, duration_months=1)
+        today = date.today()
+        cls.expiring = UserSubscription.objects.create(
+            user=User.objects.create_user('expiring'), plan=cls.plan, auto_renew=True,
+            start_date=today - timedelta(days=30), end_date=today,
+        )
+        cls.later = UserSubscription.objects.create(
+            user=User.objects.create_user('later'), plan=cls.plan, auto_renew=True,
+            start_date=today, end_date=today + timedelta(days=20),
+        )
+
+    def test_renews_each_subscription_once(self):
+        self.assertEqual(renew_subscriptions(window_days=3)['rows'], 1)
+        self.assertEqual(renew_subscriptions(window_days=3)['rows'], 0)
+
+        renewal = UserSubscription.objects.get(renewed_from=self.expiring)
+        self.assertEqual(renewal.start_date, self.expiring.end_date + timedelta(days=1))
+        self.assertEqual(renewal.status, 'PENDING')
+        self.assertFalse(UserSubscription.objects.filter(renewed_from=self.later).exists())
+
+    def test_renewal_activates_when_predecessor_expires(self):
+        renew_subscriptions(window_days=3)
+        expire_subscriptions(today=date.today() + timedelta(days=1))
+        self.assertEqual(UserSubscription.objects.get(renewed_from=self.expiring).status, 'ACTIVE')
+
+    def lapsed_with_renewal(self, username, status='ACTIVE'):
+        today = date.today()
+        predecessor = UserSubscription.objects.create(
+            user=User.objects.create_user(username), plan=self.plan, auto_renew=True, status=status,
+            start_date=today - timedelta(days=40), end_date=today - timedelta(days=10),
+        )
+        renewal = UserSubscription.objects.create(
+            user=predecessor.user, plan=self.plan, status='PENDING', renewed_from=predecessor,
+            start_date=today - timedelta(days=9), end_date=today + timedelta(days=20),
+        )
+        return predecessor, renewal
+
+    def test_renewal_activates_when_predecessor_is_retired_on_purchase(self):
+        predecessor, renewal = self.lapsed_with_renewal('renewing')
+        # Retiring the lapsed row hands over to the renewal, so the new purchase conflicts
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            UserSubscription.objects.create(user=predecessor.user, plan=self.plan, start_date=date.today())
+        UserSubscription.retire_lapsed([predecessor.user_id])
+        renewal.refresh_from_db()
+        self.assertEqual(renewal.status, 'ACTIVE')
+        self.assertEqual(CurrentSubscription.objects.get(user=predecessor.user).subscription, renewal)
+
+    def test_sweeper_settles_stranded_renewals(self):
+        # Predecessors retired before their renewals were promoted
+        _, stranded = self.lapsed_with_renewal('stranded', status='EXPIRED')
+        _, canceled = self.lapsed_with_renewal('canceled', status='CANCELED')
+        predecessor, superseded = self.lapsed_with_renewal('superseded', status='EXPIRED')
+        UserSubscription.objects.create(user=predecessor.user, plan=self.plan, start_date=date.today())
+
+        expire_subscriptions()
+        statuses = dict(UserSubscription.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[stranded.pk], 'ACTIVE')
+        self.assertEqual(statuses[canceled.pk], 'CANCELED')
+        self.assertEqual(statuses[superseded.pk], 'CANCELED')
+
+
+class IdempotencyKeyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('retrying')
+        cls.plan = SubscriptionPlan.objects.create(name='Monthly', price=100, duration_months=1)
+        UserSubscription.objects.create(user=cls.user, plan=cls.plan, start_date=date(2020, 1, 1))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_retried_renewal_is_replayed(self):
+        first = self.client.post(reverse('renew-subscription'), HTTP_IDEMPOTENCY_KEY='renew-1')
+        self.assertEqual(first.status_code, 201)
+        with self.assertNumQueries(1):
+            retry = self.client.post(reverse('renew-subscription'), HTTP_IDEMPOTENCY_KEY='renew-1')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(UserSubscription.objects.filter(user=self.user).count(), 2)
+
+    def test_new_key_runs_the_request_again(self):
+        self.client.post(reverse('renew-subscription'), HTTP_IDEMPOTENCY_KEY='renew-1')
+        response = self.client.post(reverse('renew-subscription'), HTTP_IDEMPOTENCY_KEY='renew-2')
+        self.assertEqual(response.status_code, 400)
+
+    def test_key_reused_with_another_payload_is_rejected(self):
+        other = SubscriptionPlan.objects.create(name='Yearly', price=1000, duration_months=12)
+        url = reverse('purchase-subscription')
+        first = self.client.post(url, {'plan_id': self.plan.pk}, format='json', HTTP_IDEMPOTENCY_KEY='buy-1')
+        self.assertEqual(first.status_code, 200)
+        retry = self.client.post(url, {'plan_id': self.plan.pk}, format='json', HTTP_IDEMPOTENCY_KEY='buy-1')
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+
+        response = self.client.post(url, {'plan_id': other.pk}, format='json', HTTP_IDEMPOTENCY_KEY='buy-1')
+        self.assertEqual(response.status_code, 422)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+    def test_uploads_are_compared_by_content(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+
+        def upload(color):
+            image = io.BytesIO()
+            Image.new('RGB', (8, 8), color).save(image, 'PNG')
+            proof = SimpleUploadedFile('proof.png', image.getvalue(), content_type='image/png')
+            return self.client.post(
+                reverse('payment-list'), {'plan': self.plan.pk, 'payment_proof': proof}, HTTP_IDEMPOTENCY_KEY='pay-1',
+            )
+
+        self.assertEqual(upload('red').status_code, 201)
+        self.assertEqual(upload('red')['Idempotent-Replayed'], 'true')
+        self.assertEqual(upload('blue').status_code, 422)
+        self.assertEqual(Payment.objects.filter(user=self.user).count(), 1)
+
+
+class DailyRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com')
+        cls.plan = SubscriptionPlan.objects.create(name='Monthly', price=100, duration_months=1)
+        cls.users = [User.objects.create_user(f"member{i}") for i in range(3)]
+        first = UserSubscription.objects.create(user=cls.users[0], plan=cls.plan, start_date=date(2024, 1, 1))
+        UserSubscription.objects.create(user=cls.users[0], plan=cls.plan, start_date=date(2024, 2, 2))
+        UserSubscription.objects.create(user=cls.users[1], plan=cls.plan, start_date=date(2024, 1, 15))
+        Payment.objects.create(
+            user=cls.users[0], plan=cls.plan, subscription=first,
+            payment_proof='payment_proofs/proof.png', is_verified=True,
+        )
+
+    def stats(self, day):
+        return DailyPlanStats.objects.get(date=day, plan=self.plan)
+
+    def test_rollup_counts(self):
+        rollup_daily_stats(today=date(2024, 3, 31))
+        self.assertEqual(self.stats(date(2024, 1, 1)).new_subscriptions, 1)
+        self.assertEqual(self.stats(date(2024, 1, 1)).revenue, 100)
+        self.assertEqual(self.stats(date(2024, 1, 20)).active_subscriptions, 2)
+        self.assertEqual(self.stats(date(2024, 2, 1)).expired_subscriptions, 1)
+        self.assertEqual(self.stats(date(2024, 2, 2)).renewed_subscriptions, 1)
+        self.assertFalse(DailyPlanStats.objects.filter(date=date(2024, 3, 10)).exists())
+
+    def test_reprocesses_only_dirty_days(self):
+        rollup_daily_stats(today=date(2024, 3, 31))
+        self.assertEqual(rollup_daily_stats(today=date(2024, 3, 31))['rows'], 0)
+
+        UserSubscription.objects.create(user=self.users[2], plan=self.plan, start_date=date(2024, 3, 20))
+        result = rollup_daily_stats(today=date(2024, 3, 31))
+        self.assertEqual(result['rows'], 12)
+        self.assertEqual(self.stats(date(2024, 3, 20)).new_subscriptions, 1)
+        self.assertEqual(self.stats(date(2024, 3, 31)).active_subscriptions, 1)
+
+    def test_summary_endpoint(self):
+        rollup_daily_stats(today=date(2024, 3, 31))
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        with self.assertNumQueries(2):
+            response = client.get(reverse('analytics-summary'), {'start': '2024-01-01', 'end': '2024-03-31'})
+        self.assertEqual(response.status_code, 200)
+        january, february = response.data[:2]
+        self.assertEqual(january['new_subscriptions'], 2)
+        self.assertEqual(january['active_subscriptions'], 2)
+        self.assertEqual(january['mrr'], 200)
+        self.assertEqual(february['churn_rate'], 0.5)
+
+
+class ExportTests(QueryBudgetTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def export(self, path, **params):
+        with self.assertNumQueries(1):
+            response = self.client.get(f"/api/export/{path}", params)
+            content = b''.join(response.streaming_content).decode()
+        self.assertEqual(response.status_code, 200)
+        return content
+
+    def test_subscriptions_csv(self):
+        lines = self.export('subscriptions.csv', plan=self.plans[0].pk).splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'user_id', 'username'])
+        self.assertEqual(len(lines), 1 + UserSubscription.objects.filter(plan=self.plans[0]).count())
+
+    def test_payments_ndjson(self):
+        rows = [json.loads(line) for line in self.export('payments.ndjson', status='verified').splitlines()]
+        self.assertEqual(len(rows), len(self.users))
+        self.assertEqual(rows[0]['username'], self.users[0].username)
+
+    def test_rejects_unknown_status(self):
+        response = self.client.get('/api/export/payments.csv', {'status': 'ACTIVE'})
+        self.assertEqual(response.status_code, 400)
+
+
+class BulkImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.plan = SubscriptionPlan.objects.create(name='Monthly', price=100, duration_months=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def load(self, kind, text, **kwargs):
+        return import_records(kind, read_records(io.StringIO(text), 'csv'), **kwargs)
+
+    def import_users_and_subscriptions(self, count, prefix):
+        self.load('users', 'username,email\n' + ''.join(f"{prefix}{i},{prefix}{i}@example.com\n" for i in range(count)))
+        with CaptureQueriesContext(connection) as queries:
+            result = self.load('subscriptions', 'username,plan_name,start_date\n' + ''.join(
+                f"{prefix}{i},Monthly,2024-01-{i % 28 + 1:02d}\n" for i in range(count)
+            ))
+        self.assertEqual(result['imported'], count)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        self.assertEqual(self.import_users_and_subscriptions(5, 'small'), self.import_users_and_subscriptions(50, 'large'))
+
+    def test_reports_invalid_records(self):
+        batches = []
+        result = self.load('subscriptions', (
+            'username,plan_name,start_date\n'
+            'nobody,Monthly,2024-01-01\n'
+            'nobody,Yearly,not-a-date\n'
+        ), on_batch=batches.append)
+        self.assertEqual((result['imported'], result['failed']), (0, 2))
+        self.assertEqual(batches[0]['errors'], [(1, "Unknown user 'nobody'"), (2, 'start_date must be a YYYY-MM-DD date')])
+
+    def test_reports_malformed_ndjson_lines(self):
+        batches = []
+        text = '{"name": "Basic", "price": 10, "duration_months": 1}\n{"name": \n[1, 2]\n{"name": "Pro", "price": 20, "duration_months": 1}\n'
+        result = import_records('plans', read_records(io.StringIO(text), 'ndjson'), on_batch=batches.append)
+        self.assertEqual((result['imported'], result['failed']), (2, 2))
+        self.assertEqual([number for number, _ in batches[0]['errors']], [2, 3])
+        self.assertTrue(batches[0]['errors'][0][1].startswith('Invalid JSON'))
+        self.assertEqual(batches[0]['errors'][1][1], 'Record must be an object')
+        self.assertEqual(SubscriptionPlan.objects.filter(name__in=['Basic', 'Pro']).count(), 2)
+
+    def test_resume_skips_committed_records(self):
+        text = 'name,price,duration_months\nBasic,10,1\nPro,20,1\nTeam,30,1\n'
+        ImportCheckpoint.objects.create(name='plans-1', kind='plans', records=2, imported=2)
+        result = self.load('plans', text, checkpoint='plans-1', resume=True)
+        self.assertEqual((result['records'], result['imported']), (3, 3))
+        self.assertEqual(list(SubscriptionPlan.objects.order_by('pk').values_list('name', flat=True)), ['Monthly', 'Team'])
+
+    def test_exports_load_back(self):
+        user = User.objects.create_user(username='roundtrip', password='pass')
+        subscription = UserSubscription.objects.create(user=user, plan=self.plan, start_date=date(2024, 1, 1))
+        created_at = datetime(2024, 1, 2, 9, 30, tzinfo=dt_timezone.utc)
+        Payment.objects.create(user=user, plan=self.plan, subscription=subscription, is_verified=True)
+        Payment.objects.update(created_at=created_at)
+        dumps = {
+            kind: ''.join(exports.stream(kind, 'csv', exports.export_queryset(kind)))
+            for kind in ('subscriptions', 'payments')
+        }
+        Payment.objects.all().delete()
+        UserSubscription.objects.all().delete()
+
+        self.assertEqual(self.load('subscriptions', dumps['subscriptions'])['imported'], 1)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.load('payments', dumps['payments'])['imported'], 1)
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE "subscriptions_payment"')])
+        payment = Payment.objects.get()
+        self.assertEqual(payment.subscription, UserSubscription.objects.get(user=user, start_date=date(2024, 1, 1)))
+        self.assertEqual(payment.created_at, created_at)
+
+
+class RequestMetricsTests(QueryBudgetTestCase):
+    def setUp(self):
+        catalog.get_plans(catalog.get_version())
+        metrics.reset()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_records_view_metrics(self):
+        response = self.client.get(reverse('user-subscriptions', args=[self.user.pk]))
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+        scrape = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('api_requests_total{view="user-subscriptions",method="GET",status="200"} 1', scrape)
+        self.assertIn('api_db_queries_total{view="user-subscriptions"} 1', scrape)
+        self.assertIn('api_request_duration_seconds_count{view="user-subscriptions"} 1', scrape)
+
+    def test_publishes_entitlement_cache_counters(self):
+        entitlements.reset_stats()
+        cache.clear()
+        entitlements.get_entitlement(self.user.pk)
+        entitlements.get_entitlement(self.user.pk)
+        scrape = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('api_entitlement_cache_lookups_total{result="hit"} 1', scrape)
+        self.assertIn('api_entitlement_cache_lookups_total{result="miss"} 1', scrape)
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_unsampled_requests_pass_through(self):
+        response = self.client.get(reverse('user-subscriptions', args=[self.user.pk]))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(metrics.snapshot(), {})
+
+
+class CompressionTests(QueryBudgetTestCase):
+    def setUp(self):
+        catalog.get_plans(catalog.get_version())
+        metrics.reset()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_compresses_json(self):
+        url = reverse('subscription-list-create')
+        plain = self.client.get(url)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='br;q=0.5, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertIn('compress;dur=', response['Server-Timing'])
+
+        stats = metrics.compression_snapshot()['gzip']
+        self.assertEqual((stats['responses'], stats['bytes_in']), (1, len(plain.content)))
+        self.assertEqual(stats['bytes_out'], len(response.content))
+        scrape = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn(f'api_compression_input_bytes_total{{encoding="gzip"}} {len(plain.content)}', scrape)
+
+    @skipUnless(compression.brotli, "brotli isn't installed")
+    def test_prefers_brotli(self):
+        url = reverse('subscription-list-create')
+        plain = self.client.get(url)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(compression.brotli.decompress(response.content), plain.content)
+
+    def test_skips_small_and_refused(self):
+        self.assertFalse(self.client.get(reverse('user-detail'), HTTP_ACCEPT_ENCODING='gzip').has_header('Content-Encoding'))
+        for accept in ('gzip;q=0', 'identity', ''):
+            response = self.client.get(reverse('subscription-list-create'), HTTP_ACCEPT_ENCODING=accept)
+            self.assertFalse(response.has_header('Content-Encoding'), accept)
+
+    def test_skips_media(self):
+        middleware = CompressionMiddleware(lambda request: None)
+        request = RequestFactory().get('/media/payment_proofs/proof.png', HTTP_ACCEPT_ENCODING='gzip')
+        response = middleware.process_response(request, HttpResponse(b'x' * 5000, content_type='image/png'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        request = RequestFactory().get('/api/proof/', HTTP_ACCEPT_ENCODING='gzip')
+        response = middleware.process_response(request, HttpResponse(b'x' * 5000, content_type='image/png'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    @override_settings(COMPRESSION_MIN_SIZE=0)
+    def test_plan_etag_revalidates(self):
+        response = self.client.get(reverse('plan-list-create'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertTrue(response['ETag'].startswith('W/"plans-'))
+        response = self.client.get(
+            reverse('plan-list-create'), HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'],
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_compresses_streaming_export(self):
+        url = reverse('export', args=['subscriptions', 'ndjson'])
+        plain = b''.join(self.client.get(url).streaming_content)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), plain)
+        self.assertEqual(metrics.compression_snapshot()['gzip']['bytes_in'], len(plain))
+
+    def test_negotiation(self):
+        self.assertEqual(compression.negotiate('gzip;q=0.5, br', ('br', 'gzip')), 'br')
+        self.assertEqual(compression.negotiate('gzip, br;q=0.8', ('br', 'gzip')), 'gzip')
+        self.assertEqual(compression.negotiate('gzip, br', ('br', 'gzip')), 'br')
+        self.assertEqual(compression.negotiate('*', ('gzip',)), 'gzip')
+        self.assertIsNone(compression.negotiate('br', ('gzip',)))
+        self.assertIsNone(compression.negotiate('gzip;q=0, *', ('gzip',)))
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.router = routers.ReplicaRouter()
+        healthy = mock.patch.object(routers.health, 'healthy', side_effect=lambda alias: alias in self.up)
+        healthy.start()
+        self.addCleanup(healthy.stop)
+        self.up = {'replica1', 'replica2'}
+
+    def test_reads_go_to_replicas_in_replica_blocks(self):
+        self.assertEqual(self.router.db_for_read(SubscriptionPlan), 'default')
+        chosen = set()
+        for _ in range(2):
+            with routers.replica_reads():
+                # One replica for the whole block
+                aliases = {self.router.db_for_read(model) for model in (SubscriptionPlan, UserSubscription, Payment)}
+                self.assertEqual(len(aliases), 1)
+                chosen |= aliases
+                self.assertEqual(self.router.db_for_write(SubscriptionPlan), 'default')
+                with mock.patch.object(connections['default'], 'in_atomic_block', True):
+                    self.assertEqual(self.router.db_for_read(SubscriptionPlan), 'default')
+        self.assertEqual(chosen, {'replica1', 'replica2'})
+        self.up = {'replica2'}
+        with routers.replica_reads():
+            self.assertEqual(self.router.db_for_read(SubscriptionPlan), 'replica2')
+        self.up = set()
+        with routers.replica_reads():
+            self.assertEqual(self.router.db_for_read(SubscriptionPlan), 'default')
+        with routers.replica_reads(False):
+            self.up = {'replica1', 'replica2'}
+            self.assertEqual(self.router.db_for_read(SubscriptionPlan), 'default')
+
+    def bearer(self, user):
+        return {'HTTP_AUTHORIZATION': f"Bearer {AccessToken.for_user(user)}"}
+
+    def test_writers_stay_on_the_primary(self):
+        seen = []
+        middleware = ReplicaRoutingMiddleware(lambda request: seen.append(self.router.db_for_read(UserSubscription)) or HttpResponse())
+        writer, reader = User(pk=1, username='writer'), User(pk=2, username='reader')
+        factory = RequestFactory()
+        middleware(factory.get('/api/subscriptions/', **self.bearer(writer)))
+        middleware(factory.post('/api/renew/', **self.bearer(writer)))
+        # A refreshed token for the same user keeps the pin
+        middleware(factory.get('/api/subscriptions/', **self.bearer(writer)))
+        middleware(factory.get('/api/subscriptions/', **self.bearer(reader)))
+        middleware(factory.get('/api/subscriptions/', HTTP_AUTHORIZATION='Bearer not-a-token'))
+        self.assertEqual(seen[1:3], ['default', 'default'])
+        self.assertTrue(all(alias.startswith('replica') for alias in (seen[0], *seen[3:])))
+
+    def test_pins_hold_across_workers(self):
+        # Two workers, each with its own client for the same shared cache
+        seen = []
+        middleware = ReplicaRoutingMiddleware(lambda request: seen.append(self.router.db_for_read(UserSubscription)) or HttpResponse())
+        writer = User(pk=1, username='writer')
+        with mock.patch.object(routers, 'pin_cache', return_value=LocMemCache('shared-pins', {})):
+            middleware(RequestFactory().post('/api/renew/', **self.bearer(writer)))
+        with mock.patch.object(routers, 'pin_cache', return_value=LocMemCache('shared-pins', {})):
+            middleware(RequestFactory().get('/api/subscriptions/', **self.bearer(writer)))
+        self.assertEqual(seen[1], 'default')
+
+    def test_warns_about_process_local_pin_caches(self):
+        self.assertEqual([error.id for error in routers.check_pin_cache(None)], ['subscriptions.W001'])
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache'}}
+        with override_settings(CACHES=shared):
+            self.assertEqual(routers.check_pin_cache(None), [])
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(routers.check_pin_cache(None), [])
+
+    def test_exports_stream_from_a_replica(self):
+        admin = User(pk=1, username='admin', is_staff=True)
+        request = APIRequestFactory().get(reverse('export', args=['subscriptions', 'csv']))
+        force_authenticate(request, admin)
+        middleware = ReplicaRoutingMiddleware(lambda request: ExportView.as_view()(request, kind='subscriptions', fmt='csv'))
+        def stream(kind, fmt, queryset):
+            # The database the rows would be read from once the body is consumed
+            yield queryset.db
+
+        with mock.patch.object(exports, 'stream', stream):
+            response = middleware(request)
+            self.assertIn(b''.join(response.streaming_content), {b'replica1', b'replica2'})
+
+    def test_health_checks(self):
+        health = routers.ReplicaHealth()
+        with mock.patch.object(health, 'probe', return_value=True) as probe:
+            self.assertTrue(health.healthy('replica1'))
+            self.assertTrue(health.healthy('replica1'))
+            self.assertEqual(probe.call_count, 1)
+            health.mark_down('replica1')
+            self.assertFalse(health.healthy('replica1'))
+            with override_settings(DATABASE_REPLICA_HEALTH_CHECK_INTERVAL=0):
+                self.assertTrue(health.healthy('replica1'))
+        # Not configured, or not usable from a SimpleTestCase: either way unreachable
+        self.assertFalse(health.probe('replica1'))
+
+
+@skipUnless(getattr(settings, 'DATABASE_REPLICAS', None), "no replicas configured (e.g. USE_SQLITE=1 SQLITE_REPLICAS=1)")
+class ReplicaRoutingTests(TransactionTestCase):
+    # Runs against real databases: the test replicas mirror the primary
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        routers.health.reset()
+        self.user = User.objects.create_user('replica-user')
+        plan = SubscriptionPlan.objects.create(name="Monthly", price=100, duration_months=1)
+        UserSubscription.objects.create(user=self.user, plan=plan, start_date=date(2020, 1, 1))
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.user).access_token}")
+
+    def queries(self, method, url):
+        contexts = {alias: CaptureQueriesContext(connections[alias]) for alias in connections}
+        for context in contexts.values():
+            context.__enter__()
+        try:
+            response = getattr(self.client, method)(url)
+        finally:
+            for context in contexts.values():
+                context.__exit__(None, None, None)
+        return response, {alias for alias, context in contexts.items() if len(context)}
+
+    def test_reads_your_writes(self):
+        url = reverse('user-subscriptions', args=[self.user.pk])
+        response, aliases = self.queries('get', url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(aliases & set(settings.DATABASE_REPLICAS))
+
+        response, aliases = self.queries('post', reverse('renew-subscription'))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(aliases, {'default'})
+
+        response, aliases = self.queries('get', url)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(aliases, {'default'})
+
+
+class BenchmarkTests(TestCase):
+    def test_load_test_covers_every_url(self):
+        covered = {scenario.url_name for scenario in SCENARIOS}
+        expected = {pattern.name for pattern in urlpatterns} | {'token_obtain_pair'}
+        self.assertEqual(expected - covered, set())
+
+    def test_purchase_scenario_reaches_the_entitlement_checks(self):
+        fixture = prepare_fixture()
+        scenario, = [scenario for scenario in SCENARIOS if scenario.name == 'purchase']
+        client = APIClient()
+        client.force_authenticate(fixture['user'])
+        response = client.post(reverse(scenario.url_name), scenario.body(fixture), format='json')
+        self.assertEqual(response.data, {"error": "You already have an active subscription."})
+
+    def test_seeder_respects_constraints(self):
+        result = seed(40, plans=4, batch_size=15)
+        self.assertEqual(result['users'], 40)
+        self.assertEqual(User.objects.filter(username__startswith='seed-').count(), 40)
+        self.assertEqual(Payment.objects.filter(is_verified=True).count(), result['subscriptions'])
+        self.assertEqual(CurrentSubscription.objects.count(), 40)
+        self.assertEqual(seed(10, plans=4)['users'], 10)
+        self.assertTrue(User.objects.filter(username='seed-49').exists())
@@ -1,28 +1,48 @@
 from django.urls import path
 from django.conf import settings
 from django.conf.urls.static import static
+from .api import async_views
 from .api.views import (
     SubscriptionPlanListCreate,
     SubscriptionPlanRetrieveUpdateDestroy,
     UserSubscriptionListCreate, 
+    SubscriptionBatchCreateView,
     UserSubscriptionRetrieveUpdateDestroy,  
     UserSubscriptions, 
+    UserCurrentSubscription,
     RenewSubscriptionView,
     PurchaseSubscriptionView,
     UserDetailView,
-    PaymentCreateView
+    PaymentCreateView,
+    AnalyticsDailyStatsView,
+    AnalyticsSummaryView,
+    ExportView,
+    metrics_view,
 )
 
 urlpatterns = [
     path('plans/', SubscriptionPlanListCreate.as_view(), name='plan-list-create'),
     path('plans/<int:pk>/', SubscriptionPlanRetrieveUpdateDestroy.as_view(), name='plan-retrieve-update-destroy'),
     path('subscriptions/', UserSubscriptionListCreate.as_view(), name='subscription-list-create'), 
+    path('subscriptions/batch/', SubscriptionBatchCreateView.as_view(), name='subscription-batch-create'),
     path('subscriptions/<int:pk>/', UserSubscriptionRetrieveUpdateDestroy.as_view(), name='subscription-retrieve-update-destroy'), 
     path('users/<int:user_id>/subscriptions/', UserSubscriptions.as_view(), name='user-subscriptions'),
+    path('users/<int:user_id>/subscriptions/current/', UserCurrentSubscription.as_view(), name='user-current-subscription'),
     path('renew/', RenewSubscriptionView.as_view(), name='renew-subscription'),
     path('purchase/', PurchaseSubscriptionView.as_view(), name='purchase-subscription'),
     path('user/', UserDetailView.as_view(), name='user-detail'),
     path('payments/', PaymentCreateView.as_view(), name='payment-list'),
+    path('analytics/daily/', AnalyticsDailyStatsView.as_view(), name='analytics-daily'),
+    path('analytics/summary/', AnalyticsSummaryView.as_view(), name='analytics-summary'),
+    path('export/<slug:kind>.<slug:fmt>', ExportView.as_view(), name='export'),
+    path('metrics/', metrics_view, name='metrics'),
+
+    # Async read endpoints, served natively when running under ASGI (backend/asgi.py)
+    path('async/plans/', async_views.plan_list, name='async-plan-list'),
+    path('async/plans/<int:pk>/', async_views.plan_detail, name='async-plan-detail'),
+    path('async/user/', async_views.user_detail, name='async-user-detail'),
+    path('async/users/<int:user_id>/subscriptions/', async_views.user_subscriptions, name='async-user-subscriptions'),
+    path('async/users/<int:user_id>/subscriptions/current/', async_views.user_current_subscription, name='async-user-current-subscription'),
 ]
 
 if settings.DEBUG:
@@ -107,21 +107,22 @@ function App() {
     }
 
     try {
-      const response = await api.get(`/api/users/${user.id}/subscriptions/`);
-      if (response.data.length > 0) {
-        const latestSub = response.data.sort((a, b) => new Date(b.end_date) - new Date(a.end_date))[0];
-        setSubscription(latestSub);
-
-        if (latestSub.status === 'ACTIVE' || latestSub.status === 'PENDING') {
-          setCurrentPage('dashboard');
-        } else {
-          setCurrentPage('plans');
-        }
+      const response = await api.get(`/api/users/${user.id}/subscriptions/current/`);
+      const latestSub = response.data;
+      setSubscription(latestSub);
+
+      if (latestSub.status === 'ACTIVE' || latestSub.status === 'PENDING') {
+        setCurrentPage('dashboard');
       } else {
-        setSubscription(null);
         setCurrentPage('plans');
       }
     } catch (error) {
+      if (error.response && error.response.status === 404) {
+        // The user has no subscriptions yet
+        setSubscription(null);
+        setCurrentPage('plans');
+        return;
+      }
       console.error('Failed to fetch subscription status', error);
       setMessage('Failed to fetch subscription status.');
       setSubscription(null);
@@ -165,11 +166,15 @@ function App() {
     setCurrentPage('login');
   };
 
+  // A fresh key per user action; retries of the same request reuse it, so the
+  // server answers them with the first response instead of repeating the action
+  const idempotent = () => ({ headers: { 'Idempotency-Key': crypto.randomUUID() } });
+
   const handlePurchase = async (planId) => {
     setIsLoading(true);
     setMessage('');
     try {
-      await api.post('/api/purchase/', { plan_id: planId });
+      await api.post('/api/purchase/', { plan_id: planId }, idempotent());
       setSelectedPlanId(planId);
       setCurrentPage('payment_upload');
       setMessage('Please upload payment proof to complete your purchase.');
@@ -190,7 +195,7 @@ function App() {
     formData.append('plan', selectedPlanId);
 
     try {
-      await api.post('/api/payments/', formData);
+      await api.post('/api/payments/', formData, idempotent());
       setMessage('Payment proof uploaded successfully. Awaiting admin verification.');
       setSelectedPlanId(null);
       setCurrentPage('dashboard');
@@ -208,7 +213,7 @@ function App() {
     setIsLoading(true);
     setMessage('');
     try {
-      await api.post('/api/renew/');
+      await api.post('/api/renew/', null, idempotent());
       setMessage('Renewal successful! Updating status...');
       fetchSubscriptionStatus();
     } catch (error) {